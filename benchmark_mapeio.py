@@ -0,0 +1,299 @@
+"""Benchmark das etapas da validação com dados sintéticos.
+
+Exemplos:
+    python benchmark_mapeio.py                          # 10k, 100k e 1M linhas
+    python benchmark_mapeio.py --tamanhos 10000 100000 --saida benchmarks/
+    python benchmark_mapeio.py --comparar benchmarks/benchmark_20260101_120000.json
+
+Gera descrições e preços no formato das extrações reais (3x200G, C/12,
+12X4R, L3P2, "R$ 1.234,56", subcategorias de tamanhos bem desiguais,
+cruzando os limites de 1000/2000 linhas dos quantis) e mede tempo e pico de
+memória de cada etapa. O resultado é gravado em JSON para comparar versões.
+"""
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import validador_mapeio
+from validador_mapeio import (
+    COLUNAS_AUX_INTERESSE,
+    FAIXAS_QUANTIL,
+    calcular_status_geral,
+    comparar_contenido,
+    construir_indice_ean,
+    converter_numero,
+    cruzar_por_indice_ean,
+    extrair_peso,
+    extrair_peso_com_cache,
+    extrair_peso_lote,
+    mapear_colunas,
+    normalizar_nomes_colunas,
+    processar_dataframe,
+    to_excel_com_resumo,
+    validar_precos,
+)
+
+TAMANHOS_PADRAO = [10_000, 100_000, 1_000_000]
+# A versão linha a linha de extrair_peso é lenta demais para 1M linhas
+MAX_LINHAS_EXTRAIR_PESO_LINHA = 100_000
+
+# ----------------------------
+# Geração de dados sintéticos
+# ----------------------------
+_PRODUTOS = ["SABONETE", "OLEO SOJA", "REFRIG COLA", "PAPEL HIG", "DETERGENTE", "BISCOITO", "LEITE UHT",
+             "CAFE TORRADO", "ARROZ TIPO 1", "SHAMPOO", "AMACIANTE", "IOGURTE"]
+_MARCAS = ["MARCA A", "MARCA B", "PROPRIA", "PREMIUM", "NACIONAL"]
+# (modelo da embalagem, peso total em gramas aproximado) — um por regra de REGRAS_PESO
+_EMBALAGENS = [
+    ("{a}x{b}G", lambda a, b: a * b),
+    ("{a}X{b}ML", lambda a, b: a * b),
+    ("2 UN X {a} X {b}G", lambda a, b: 2 * a * b),
+    ("{b}GR", lambda a, b: b),
+    ("{a},5L", lambda a, b: a * 1000 + 500),
+    ("{a}KG", lambda a, b: a * 1000),
+    ("{a} UN", lambda a, b: a),
+    ("C/{a}", lambda a, b: a),
+    ("C/3X{a}", lambda a, b: 3 * a),
+    ("12X{a}R", lambda a, b: 12 * a),
+    ("L{a}P2", lambda a, b: a),
+    ("PCT {a}", lambda a, b: a),
+    ("{b}", lambda a, b: b),
+]
+
+
+def gerar_dados(n, seed=0, tamanho_aux=None):
+    """Gera (df_principal, df_aux) com `n` linhas e os nomes de coluna das extrações reais."""
+    rng = np.random.default_rng(seed)
+
+    # Subcategorias com tamanhos tipo Zipf: poucas muito grandes (> 2000 linhas
+    # em tamanhos maiores), várias entre 1000 e 2000 e uma cauda de pequenas
+    n_categorias = max(5, n // 500)
+    pesos = 1 / np.arange(1, n_categorias + 1) ** 0.9
+    categorias = rng.choice(n_categorias, size=n, p=pesos / pesos.sum())
+
+    a = rng.integers(1, 25, size=n)
+    b = rng.choice([50, 90, 100, 200, 250, 400, 500, 900, 1000], size=n)
+    modelos = rng.integers(0, len(_EMBALAGENS), size=n)
+    embalagens = np.empty(n, dtype=object)
+    gramas = np.empty(n, dtype=float)
+    for i, (modelo, calc) in enumerate(_EMBALAGENS):
+        sel = modelos == i
+        embalagens[sel] = [modelo.format(a=x, b=y) for x, y in zip(a[sel], b[sel])]
+        gramas[sel] = calc(a[sel], b[sel])
+    descricoes = (pd.Series(rng.choice(_PRODUTOS, size=n)) + " "
+                  + pd.Series(rng.choice(_MARCAS, size=n)) + " " + embalagens)
+
+    # Contenido certo na maior parte, com erros e ausentes
+    contenido = np.where(rng.random(n) < 0.85, gramas, gramas * rng.choice([0.5, 2, 10], size=n))
+    contenido = pd.Series(contenido).where(rng.random(n) > 0.02)
+
+    # Preço log-normal por categoria, com alguns extremos, no formato brasileiro
+    base_categoria = rng.lognormal(3, 1, size=n_categorias)
+    precos = base_categoria[categorias] * rng.lognormal(0, 0.3, size=n)
+    extremos = rng.random(n) < 0.01
+    precos[extremos] *= rng.choice([0.05, 20], size=extremos.sum())
+    texto_preco = pd.Series(precos).map(lambda v: f"R$ {v:,.2f}".translate(str.maketrans(",.", ".,")))
+
+    vendas = np.where(rng.random(n) < 0.9, rng.gamma(1.5, 500, size=n).round(2), 0)
+    eans = 7_890_000_000_000 + rng.choice(10 * n, size=n, replace=False)
+
+    df = pd.DataFrame({
+        "EAN": eans.astype(str),
+        "Descripcion": descricoes,
+        "Contenido": contenido,
+        "Precio KG/LT": texto_preco,
+        "Est Mer 7 (Subcategoria)": pd.Series(categorias).map(lambda c: f"SUBCATEGORIA {c:04d}"),
+        "Imp Vta (Ult.24 Meses)": vendas,
+    })
+
+    tamanho_aux = tamanho_aux or n
+    eans_aux = rng.choice(eans, size=min(tamanho_aux, n), replace=False)
+    df_aux = pd.DataFrame({"EAN": eans_aux})
+    for coluna in COLUNAS_AUX_INTERESSE[:3]:
+        df_aux[coluna] = rng.choice(["OK", "REVISAR", "SEM INFORMAÇÃO"], size=len(df_aux))
+    return df, df_aux
+
+
+# ----------------------------
+# Medição
+# ----------------------------
+def medir(funcao, *args, repeticoes=1, **kwargs):
+    """Roda `funcao` e retorna (resultado, segundos, pico de memória em MB).
+
+    O tempo é o menor entre as repetições; o pico de memória (tracemalloc) é
+    medido numa rodada separada, para não inflar o tempo.
+    """
+    tempos = []
+    for _ in range(repeticoes):
+        gc.collect()
+        inicio = time.perf_counter()
+        resultado = funcao(*args, **kwargs)
+        tempos.append(time.perf_counter() - inicio)
+        del resultado
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        resultado = funcao(*args, **kwargs)
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return resultado, min(tempos), pico / 1024 ** 2
+
+
+def _extrair_peso_linha(serie):
+    return serie.apply(extrair_peso)
+
+
+def _limpar_cache_peso():
+    caminho = os.path.join(validador_mapeio.CACHE_PESO_DIR, "extrair_peso.sqlite")
+    if os.path.exists(caminho):
+        os.remove(caminho)
+
+
+def _extrair_peso_cache_frio(serie):
+    _limpar_cache_peso()
+    return extrair_peso_com_cache(serie)
+
+
+def _processar_cache_frio(df, df_aux, **opcoes):
+    _limpar_cache_peso()
+    return processar_dataframe(df.copy(), df_aux.copy(), **opcoes)
+
+
+def _processar_baixa_memoria_cache_frio(df, df_aux):
+    return _processar_cache_frio(df, df_aux, baixa_memoria=True)
+
+
+def _etapas(df, df_aux, colunas):
+    """Etapas medidas, na ordem do pipeline: (nome, função, args, limite de linhas)."""
+    preco, categoria = colunas["preco"], colunas["categoria"]
+    df_numerico = df.assign(**{preco: converter_numero(df[preco])})
+    pesos = extrair_peso_lote(df[colunas["descricao"]])
+    df_validado = df_numerico.assign(
+        QtdEmbalagemGramas=pesos["QtdEmbalagemGramas"],
+        ValidacaoContenido=comparar_contenido(pesos["QtdEmbalagemGramas"], df[colunas["contenido"]]),
+        **validar_precos(df_numerico, preco, categoria),
+    )
+    indice_ean = construir_indice_ean(df_aux.copy())
+    return [
+        ("extrair_peso (linha a linha)", _extrair_peso_linha, (df[colunas["descricao"]],),
+         MAX_LINHAS_EXTRAIR_PESO_LINHA),
+        ("extrair_peso_lote", extrair_peso_lote, (df[colunas["descricao"]],), None),
+        ("extrair_peso_com_cache (cache frio)", _extrair_peso_cache_frio, (df[colunas["descricao"]],), None),
+        ("extrair_peso_com_cache (cache quente)", extrair_peso_com_cache, (df[colunas["descricao"]],), None),
+        ("converter_numero (preço)", converter_numero, (df[preco],), None),
+        ("validar_precos (quantil + mediana)", validar_precos, (df_numerico, preco, categoria), None),
+        ("calcular_status_geral", calcular_status_geral, (df_validado,), None),
+        ("construir_indice_ean", lambda d: construir_indice_ean(d.copy()), (df_aux,), None),
+        ("cruzar_por_indice_ean", cruzar_por_indice_ean, (df_validado, indice_ean), None),
+        ("to_excel_com_resumo", to_excel_com_resumo, (df_validado, colunas["vendas"]), None),
+        ("processar_dataframe (cache frio)", _processar_cache_frio, (df, df_aux), None),
+        ("processar_dataframe (baixa memória, cache frio)", _processar_baixa_memoria_cache_frio, (df, df_aux),
+         None),
+    ]
+
+
+def rodar_benchmark(tamanhos=TAMANHOS_PADRAO, repeticoes=1, seed=0, filtro=None, saida_progresso=sys.stdout):
+    """Mede cada etapa em cada tamanho. Retorna uma lista de dicts (uma linha por etapa/tamanho)."""
+    resultados = []
+    for n in tamanhos:
+        df, df_aux = gerar_dados(n, seed)
+        normalizar_nomes_colunas(df)
+        colunas = mapear_colunas(df)
+        tamanhos_categoria = df[colunas["categoria"]].value_counts()
+        limites = [limite for limite, _, _ in FAIXAS_QUANTIL if limite]
+        print(f"== {n} linhas, {len(tamanhos_categoria)} subcategorias "
+              f"(maior: {tamanhos_categoria.iloc[0]}; "
+              + ", ".join(f">= {lim}: {(tamanhos_categoria >= lim).sum()}" for lim in limites) + ")",
+              file=saida_progresso)
+
+        for nome, funcao, args, max_linhas in _etapas(df, df_aux, colunas):
+            if filtro and not any(f.lower() in nome.lower() for f in filtro):
+                continue
+            if max_linhas and n > max_linhas:
+                print(f"   {nome:<50} pulado (> {max_linhas} linhas)", file=saida_progresso)
+                continue
+            _, segundos, pico_mb = medir(funcao, *args, repeticoes=repeticoes)
+            resultados.append({
+                "etapa": nome,
+                "linhas": n,
+                "segundos": round(segundos, 4),
+                "linhas_por_segundo": round(n / segundos) if segundos else None,
+                "pico_memoria_mb": round(pico_mb, 1),
+            })
+            print(f"   {nome:<50} {segundos:8.3f}s {pico_mb:9.1f} MB", file=saida_progresso)
+    return resultados
+
+
+def _versao_codigo():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar_resultados(atual, anterior):
+    """Junta duas rodadas por etapa/tamanho com a razão de tempo (atual / anterior)."""
+    chaves = ["etapa", "linhas"]
+    df_atual = pd.DataFrame(atual)[chaves + ["segundos", "pico_memoria_mb"]]
+    df_anterior = pd.DataFrame(anterior)[chaves + ["segundos", "pico_memoria_mb"]]
+    comparacao = df_atual.merge(df_anterior, on=chaves, how="left", suffixes=("", "_anterior"))
+    comparacao["razao_tempo"] = (comparacao["segundos"] / comparacao["segundos_anterior"]).round(2)
+    return comparacao
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark das etapas da validação com dados sintéticos.")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=TAMANHOS_PADRAO,
+                        help="quantidades de linhas (padrão: 10000 100000 1000000)")
+    parser.add_argument("--repeticoes", type=int, default=1, help="rodadas por etapa; vale o menor tempo")
+    parser.add_argument("--etapas", nargs="+", metavar="TRECHO",
+                        help="mede só as etapas cujo nome contém algum dos trechos")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--saida", default="benchmarks", help="pasta onde gravar o JSON (padrão: benchmarks/)")
+    parser.add_argument("--comparar", metavar="JSON", help="resultado anterior para comparar os tempos")
+    args = parser.parse_args(argv)
+
+    # Cache de extrair_peso temporário: não mistura com o cache do usuário
+    with tempfile.TemporaryDirectory() as pasta_cache:
+        validador_mapeio.CACHE_PESO_DIR = pasta_cache
+        resultados = rodar_benchmark(args.tamanhos, args.repeticoes, args.seed, args.etapas)
+
+    os.makedirs(args.saida, exist_ok=True)
+    agora = datetime.datetime.now()
+    caminho = os.path.join(args.saida, f"benchmark_{agora:%Y%m%d_%H%M%S}.json")
+    with open(caminho, "w", encoding="utf-8") as f:
+        json.dump({
+            "data": agora.isoformat(timespec="seconds"),
+            "commit": _versao_codigo(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "maquina": platform.platform(),
+            "resultados": resultados,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"Resultados gravados em {caminho}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            anterior = json.load(f)["resultados"]
+        with pd.option_context("display.width", 200, "display.max_rows", None):
+            print(comparar_resultados(resultados, anterior).to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,651 +1,556 @@
-import streamlit as st
-import pandas as pd
-import re
-import numpy as np
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
 from io import BytesIO
-# ----------------------------
-# Configurações do app
-# ----------------------------
-st.set_page_config(
-    page_title="Validador de Embalagens e Preços",
-    layout="wide"
-)
 
-st.markdown("<h1 style='text-align: center;'>Validador de Mapeio e Preços</h1>", unsafe_allow_html=True)
-st.markdown("""
-Para o funcionamento correto da ferramenta, são necessárias colunas que **tenham nomes semelhantes** aos seguintes:
-- **Descrição:** `Descripcion`, `PROD_NOMBRE_ORIGINAL`, `Nome SKU`
-- **Contenido:** `Contenido`, `Qtd Conteúdo SKU`
-- **Preço Kg/Lt:** `Precio KG/LT`, `Preço convertido kg/lt R$`, `Preço kg/lt`
-- **Subcategoria:** `Est Mer 7 (Subcategoria)`, `NIVEL1`
-- **Venda em volume:** `Imp Vta (Ult.24 Meses)`, `Vendas em volume`
-
-A ferramenta faz:
-- Validação da quantidade de embalagem (`QtdEmbalagem` e `QtdEmbalagemGramas`)
-- Validação de conteúdo (`ValidacaoContenido`)
-- Detecção de preços fora do padrão por subcategoria (`ValidacionPrecio`)
-- Detecção adicional de preços extremos baseados na mediana (`ValidacionPrecioMediana`)
-- Download do Excel processado
-""")
+import streamlit as st
+
+from validador_mapeio import (
+    CAMINHO_INDICE_FAIXAS,
+    COLUNA_ORIGEM,
+    ColunasFaltandoError,
+    ProcessamentoCancelado,
+    atualizar_indice_faixas,
+    avisar_progresso,
+    calcular_resumo,
+    carregar_indice_faixas,
+    configurar_log_json,
+    etapa,
+    filtrar_resultado,
+    indexar_resultado,
+    ler_arquivo_principal,
+    ler_arquivos_principais,
+    carregar_indice_ean,
+    exportar_resultado,
+    medir_pico_memoria,
+    novo_diagnostico,
+    novo_indice_faixas,
+    pagina_resultado,
+    processar_dataframe,
+    revalidar_incremental,
+    salvar_indice_faixas,
+    tabela_diagnostico,
+    tabela_resumo_por_origem,
+)
 
 # ----------------------------
 # Funções auxiliares
 # ----------------------------
-import re
-import pandas as pd
-
-def extrair_peso(texto):
-    if pd.isna(texto):
-        return None, None
-
-    texto = str(texto).upper().strip()
-
-    # -------------------------------------------------
-    # 1️⃣ Tenta capturar formatos de PESO / VOLUME (Kg, L, etc)
-    # -------------------------------------------------
-    unidades_intermed = r"(?:UN|UNID|CJ|CX|DS|PCT|FD|SC)?"
-    unidade_final = r"(KILOS|KILO|KG|G|GR|GRS|GRAMAS|GRAMA|ML|L|LT|LTS|LITROS|LITRO)"
-    
-    # Casos compostos tipo 3x200G ou 2x500ML
-    match_multi = re.search(rf"((?:\d+\s*{unidades_intermed}\s*[xX]\s*)+\d+[.,]?\d*\s*{unidade_final})", texto, re.IGNORECASE)
-    if match_multi:
-        bloco = match_multi.group(1)
-        unidade = match_multi.group(len(match_multi.groups())).lower()
-        numeros = [float(n.replace(",", ".")) for n in re.findall(r"\d+[.,]?\d*", bloco)]
-        multiplicadores = numeros[:-1] if len(numeros) > 1 else []
-        peso = numeros[-1]
-        if unidade in ["kg","kilos", "kilo", "lt", "l", "lts", "litros", "litro"]:
-            peso *= 1000
-        total = peso
-        for n in multiplicadores:
-            total *= n
-        return bloco, int(total)
-
-    # Casos como 3x4x200ML
-    match_3d = re.search(rf"(\d+)\s*[xX]\s*(\d+)\s*[xX]\s*(\d+[.,]?\d*)\s*{unidade_final}\b", texto, re.IGNORECASE)
-    if match_3d:
-        n1 = int(match_3d.group(1))
-        n2 = int(match_3d.group(2))
-        valor = float(match_3d.group(3).replace(",", "."))
-        unidade = match_3d.group(4).lower()
-        if unidade in ["kg","kilos", "kilo", "lt", "l", "lts", "litros", "litro"]:
-            valor *= 1000
-        return match_3d.group(0), int(n1 * n2 * valor)
-
-    # Casos como 3x200ML
-    match_2d = re.search(rf"(\d+)\s*[xX]\s*(\d+[.,]?\d*)\s*{unidade_final}\b", texto, re.IGNORECASE)
-    if match_2d:
-        n1 = int(match_2d.group(1))
-        valor = float(match_2d.group(2).replace(",", "."))
-        unidade = match_2d.group(3).lower()
-        if unidade in ["kg","kilos", "kilo", "lt", "l", "lts", "litros", "litro"]:
-            valor *= 1000
-        return match_2d.group(0), int(n1 * valor)
-
-    # Casos simples como "200ML", "1L", "500G"
-    match = re.search(rf"(\d+[.,]?\d*)\s*{unidade_final}\b", texto, re.IGNORECASE)
-    if match:
-        valor = float(match.group(1).replace(",", "."))
-        unidade = match.group(2).lower()
-        if unidade in ["kg","kilos", "kilo", "lt", "l", "lts", "litros", "litro"]:
-            valor *= 1000
-        return match.group(0), int(valor)
-
-    # -------------------------------------------------
-    # 2️⃣ Caso não tenha achado peso/volume → tenta UNIDADES (robusto, cobre C/XX, C/XXxYY e XXxYY)
-    # -------------------------------------------------
-
-    # 1) Padrões com número antes do sufixo: "3x12UN", "24 UN", "12UN", "2x24 UN"
-    match_un = re.search(
-        r"(?:(\d+)\s*[xX]\s*)?(\d+)\s*(?:UN|UNID|UND|UNIDADE|UNIDADES|CJ|CX|PCT|FD|SC)\b",
-        texto,
-        re.IGNORECASE
-    )
-    if match_un:
-        mult = int(match_un.group(1)) if match_un.group(1) else 1
-        qtd = int(match_un.group(2))
-        return match_un.group(0), mult * qtd
-
-    # 2) Padrões tipo "C/3X24", "C 2X6", "C.4X12"
-    match_c_pack = re.search(r"C[\s./]?(\d+)\s*[xX]\s*(\d+)\b", texto, re.IGNORECASE)
-    if match_c_pack:
-        mult = int(match_c_pack.group(1))
-        qtd = int(match_c_pack.group(2))
-        return match_c_pack.group(0), mult * qtd
-
-    # 3) Padrões simples "C/32", "C 32", "C.32", "C32"
-    match_c = re.search(r"C[\s./]?(\d{1,4})\b", texto, re.IGNORECASE)
-    if match_c:
-        return match_c.group(0), int(match_c.group(1))
-
-    # -------------------------------------------------
-    # 3️⃣ Papel Higiênico (Rolos e Leve/Pague)
-    # -------------------------------------------------
-    match_rolos = re.search(r"(\d+)[xX](\d+)R\b", texto)
-    if match_rolos:
-        qtd_total = int(match_rolos.group(1)) * int(match_rolos.group(2))
-        return match_rolos.group(0), qtd_total
-
-    match_leve_pague = re.search(r"L(\d+)\s*P\d+", texto, re.IGNORECASE)
-    if match_leve_pague:
-        qtd = int(match_leve_pague.group(1))
-        return match_leve_pague.group(0), qtd
-
-    # ------------------------------------------------------
-    # 3️⃣ Fallback - identificar casos sem unidade de medida
-    # ------------------------------------------------------
-
-    # 4) Padrões "3X12", "2X6", "4X24" sem UN no final
-    match_pack = re.search(r"(\d+)\s*[xX]\s*(\d+)\b", texto, re.IGNORECASE)
-    if match_pack:
-        mult = int(match_pack.group(1))
-        qtd = int(match_pack.group(2))
-        return match_pack.group(0), mult * qtd
-
-    # 5) Fallback: último número do texto (pode capturar casos residuais)
-    nums = re.findall(r"\d+", texto)
-    if nums:
-        last = int(nums[-1])
-        if 0 < last <= 10000:
-            return str(last), last
-        
-    # -------------------------------------------------
-    # 3️⃣ Caso nada encontrado
-    # -------------------------------------------------
-    return None, None
+def mostrar_avisos(avisos):
+    for nivel, mensagem in avisos:
+        getattr(st, nivel)(mensagem)
 
 
-# ----------------------------
-# Validador de preço por categoria (IQR 5-95%)
-# ----------------------------
-def validar_precio_por_categoria(df, coluna_preco, coluna_categoria):
-    df[coluna_preco] = (
-        df[coluna_preco]
-        .astype(str)                    # garante que é texto
-        .str.replace(r"[^\d,.-]", "", regex=True)  # remove "R$", espaços, etc.
-        .str.replace(",", ".", regex=False)        # troca vírgula por ponto
-        )
-    df[coluna_preco] = pd.to_numeric(df[coluna_preco], errors="coerce")
-
-    def marcar_outliers(grupo):
-        n = len(grupo)
-        if n < 1000:
-            limite_inferior = grupo.quantile(0.05)
-            limite_superior = grupo.quantile(0.95)
-        elif n < 2000:
-            limite_inferior = grupo.quantile(0.03)
-            limite_superior = grupo.quantile(0.97)
-        else:
-            limite_inferior = grupo.quantile(0.02)
-            limite_superior = grupo.quantile(0.98)
-        return grupo.apply(lambda x: "OK" if limite_inferior <= x <= limite_superior else "OUTLIER")
-    return df.groupby(coluna_categoria)[coluna_preco].transform(marcar_outliers)
+# Resultados já processados nesta sessão, por hash do conteúdo dos arquivos.
+# Cada interação com a página (inclusive o clique no download) reexecuta o
+# script; com o cache, a leitura, as validações e o Excel não são refeitos.
+MAX_RESULTADOS_SESSAO = 3
+MAX_BYTES_SESSAO = 1024 ** 3
 
-# ----------------------------
-# Novo validador: outliers com base na mediana (3x acima ou 1/3 abaixo)
-# ----------------------------
-def validar_precio_mediana(df, coluna_preco, coluna_categoria):
-    df[coluna_preco] = (
-        df[coluna_preco]
-        .astype(str)                    # garante que é texto
-        .str.replace(r"[^\d,.-]", "", regex=True)  # remove "R$", espaços, etc.
-        .str.replace(",", ".", regex=False)        # troca vírgula por ponto
-    )
-    df[coluna_preco] = pd.to_numeric(df[coluna_preco], errors="coerce")
 
-    def marcar_por_mediana(grupo):
-        mediana = grupo.median()
-        limite_inferior = mediana / 5
-        limite_superior = mediana * 5
-        return grupo.apply(lambda x: "OK" if limite_inferior <= x <= limite_superior else "OUTLIER_MEDIANA")
-    return df.groupby(coluna_categoria)[coluna_preco].transform(marcar_por_mediana)
+def hash_upload(arquivo):
+    """Hash do conteúdo do upload; para uma lista de uploads, dos nomes e conteúdos de todos."""
+    if arquivo is None:
+        return None
+    if isinstance(arquivo, list):
+        h = hashlib.sha256()
+        for item in arquivo:
+            h.update(item.name.encode("utf-8"))
+            h.update(hash_upload(item).encode("ascii"))
+        return h.hexdigest()
+    return hashlib.sha256(arquivo.getvalue()).hexdigest()
+
+
+def nome_upload(arquivo):
+    if isinstance(arquivo, list):
+        return " + ".join(item.name for item in arquivo)
+    return arquivo.name
+
+
+def _cache_sessao():
+    if "resultados" not in st.session_state:
+        st.session_state["resultados"] = OrderedDict()
+    return st.session_state["resultados"]
+
+
+def _ultimo_resultado(cache, nome, chave):
+    """Último resultado da sessão para um arquivo de mesmo nome e mesmas opções."""
+    for chave_anterior, resultado in reversed(cache.items()):
+        if resultado["nome"] == nome and chave_anterior[1:] == chave[1:]:
+            return resultado
+    return None
+
+
+def processar_uploads(cache, chave, arquivo, arquivo_aux, somente_necessarias=False, formato="xlsx",
+                      com_diagnostico=False, paralelo=False, progresso=None, ao_ler=None, trava=None,
+                      baixa_memoria=False, faixas_referencia=None):
+    """Lê, valida e exporta, reaproveitando o resultado se os arquivos não mudaram.
+
+    `arquivo`/`arquivo_aux` são file-likes com `.name` e `chave` a de
+    `chave_processamento`; `arquivo` também pode ser uma lista de file-likes,
+    lidos em paralelo e validados juntos (`ler_arquivos_principais`). Se o
+    arquivo mudou mas já foi processado nesta sessão com o mesmo nome (ex.:
+    versão corrigida), revalida só o que mudou
+    (`revalidar_incremental`). Retorna um dict com df_final, colunas, avisos,
+    exportacoes (formato -> bytes, gerado na primeira vez que o formato é pedido),
+    mudancas (None sem processamento anterior) e diagnostico (None se
+    `com_diagnostico` for falso). Com `paralelo`, as validações usam todos os
+    núcleos (por subcategoria). `progresso` vai para as funções do validador e
+    `ao_ler(df)` é chamado logo após a leitura (prévia). Como roda numa thread,
+    `cache` é alterado só com `trava`. Com `baixa_memoria`, processa no modo de
+    baixa memória do validador (sem revalidação incremental) e o resultado traz
+    `pico_memoria_mb` da leitura até a exportação. Com `faixas_referencia` (de
+    `carregar_indice_faixas`), os preços são validados contra o índice de
+    referência (também sem revalidação incremental). Levanta ColunasFaltandoError
+    e ProcessamentoCancelado.
+    """
+    trava = trava or threading.Lock()
+    with trava:
+        resultado = cache.get(chave)
+        if resultado is not None:
+            cache.move_to_end(chave)
+            anterior = None
+        else:
+            incremental = not baixa_memoria and faixas_referencia is None
+            anterior = _ultimo_resultado(cache, nome_upload(arquivo), chave) if incremental else None
+
+    with medir_pico_memoria() if baixa_memoria else nullcontext({}) as memoria:
+        resultado = _processar_e_exportar(resultado, anterior, arquivo, arquivo_aux, somente_necessarias, formato,
+                                          com_diagnostico, paralelo, progresso, ao_ler, baixa_memoria,
+                                          faixas_referencia)
+    if baixa_memoria:
+        resultado["pico_memoria_mb"] = max(resultado.get("pico_memoria_mb", 0), memoria["pico_memoria_mb"])
+
+    with trava:
+        cache[chave] = resultado
+        cache.move_to_end(chave)
+        # Descarta os resultados mais antigos acima dos limites (sempre mantém o atual)
+        while len(cache) > 1 and (
+            len(cache) > MAX_RESULTADOS_SESSAO
+            or sum(r["bytes"] for r in cache.values()) > MAX_BYTES_SESSAO
+        ):
+            cache.popitem(last=False)
+    return resultado
+
+
+def _processar_e_exportar(resultado, anterior, arquivo, arquivo_aux, somente_necessarias, formato,
+                          com_diagnostico, paralelo, progresso, ao_ler, baixa_memoria, faixas_referencia):
+    """Corpo de `processar_uploads` fora do cache: processa (se `resultado` é None) e exporta `formato`."""
+    if resultado is None:
+        diagnostico = novo_diagnostico(arquivo=nome_upload(arquivo)) if com_diagnostico else None
+        avisos = []
+        if isinstance(arquivo, list):
+            with etapa(diagnostico, "leitura", arquivos=len(arquivo)):
+                df, avisos_leitura = ler_arquivos_principais(
+                    arquivo, somente_necessarias=somente_necessarias or baixa_memoria, progresso=progresso
+                )
+            avisos.extend(avisos_leitura)
+        else:
+            avisar_progresso(progresso, "leitura", 0)
+            with etapa(diagnostico, "leitura"):
+                df = ler_arquivo_principal(arquivo, somente_necessarias=somente_necessarias or baixa_memoria)
+            avisar_progresso(progresso, "leitura", len(df), len(df))
+        if ao_ler is not None:
+            ao_ler(df)
+        indice_ean = None
+        if arquivo_aux is not None:
+            avisar_progresso(progresso, "base_auxiliar", 0)
+            with etapa(diagnostico, "base_auxiliar", arquivo=arquivo_aux.name):
+                indice_ean, avisos_aux = carregar_indice_ean(arquivo_aux, arquivo_aux.name)
+            avisar_progresso(progresso, "base_auxiliar", 1, 1)
+            avisos.extend(avisos_aux)
+
+        mudancas = None
+        if anterior is not None:
+            df_final, colunas, avisos_processamento, mudancas = revalidar_incremental(
+                df, anterior["df_final"], anterior["colunas"], indice_ean=indice_ean, diagnostico=diagnostico,
+                progresso=progresso,
+            )
+        else:
+            df_final, colunas, avisos_processamento = processar_dataframe(
+                df, indice_ean=indice_ean, diagnostico=diagnostico,
+                processos=os.cpu_count() if paralelo else None, progresso=progresso, baixa_memoria=baixa_memoria,
+                faixas_referencia=faixas_referencia,
+            )
+        avisos.extend(avisos_processamento)
+
+        resultado = {
+            "nome": nome_upload(arquivo),
+            "df_final": df_final,
+            "colunas": colunas,
+            "avisos": avisos,
+            "mudancas": mudancas,
+            "exportacoes": {},
+            "diagnostico": diagnostico,
+            "bytes": int(df_final.memory_usage(deep=True).sum()),
+        }
+
+    if formato not in resultado["exportacoes"]:
+        with etapa(resultado["diagnostico"], f"exportacao_{formato}", linhas=len(resultado["df_final"])):
+            dados = exportar_resultado(resultado["df_final"], resultado["colunas"]["vendas"], formato,
+                                       progresso=progresso)
+        resultado["exportacoes"][formato] = dados
+        resultado["bytes"] += len(dados)
+    return resultado
+
 
 # ----------------------------
-# Exportar para Excel
+# Processamento em segundo plano
 # ----------------------------
-def to_excel_com_resumo(df, coluna_vendas):
-    from io import BytesIO
-    output = BytesIO()
-
-    # ----------------------------
-    # Criar resumo
-    # ----------------------------
-    total_itens = len(df)
-    problemas_contenido = (df["ValidacaoContenido"] == "PROBLEMA").sum()
-    outliers_quartil = (df["ValidacionPrecio"] == "OUTLIER").sum()
-    outliers_mediana = (df["ValidacionPrecioMediana"] == "OUTLIER_MEDIANA").sum()
-
-    outliers_ambos = ((df["ValidacionPrecio"] == "OUTLIER") & 
-                      (df["ValidacaoContenido"] != "PROBLEMA") & 
-                      (df["ValidacionPrecioMediana"] == "OUTLIER_MEDIANA")).sum()
-    outliers_somente_mediana = ((df["ValidacionPrecio"] != "OUTLIER") & 
-                                (df["ValidacaoContenido"] != "PROBLEMA") & 
-                                (df["ValidacionPrecioMediana"] == "OUTLIER_MEDIANA")).sum()
-    outliers_somente_quartil = ((df["ValidacionPrecio"] == "OUTLIER") & 
-                                (df["ValidacaoContenido"] != "PROBLEMA") & 
-                                (df["ValidacionPrecioMediana"] != "OUTLIER_MEDIANA")).sum()
-
-    problemas_valor_bruto = problemas_contenido + outliers_ambos + outliers_somente_mediana + outliers_somente_quartil
-    problemas_valor_perc = problemas_valor_bruto / total_itens * 100 if total_itens else 0
-
-    volume_total = df[coluna_vendas].sum()
-    df_problemas = df[
-        (df["ValidacaoContenido"] == "PROBLEMA") |
-        (df["ValidacionPrecio"] == "OUTLIER") |
-        (df["ValidacionPrecioMediana"] == "OUTLIER_MEDIANA")
-    ]
-    volume_problemas = df_problemas[coluna_vendas].sum()
-    volume_problemas_perc = volume_problemas / volume_total * 100 if volume_total else 0
-
-    df_resumo = pd.DataFrame({
-        "Métrica": [
-            "Qtd total de SKUs/Itens",
-            "1. Skus com possíveis problemas de contenido",
-            "2. Outliers idenficados exclusivamente através da mediana (5x) e quartil (5%)",
-            "3. Outilers exclusivos apenas mediana (5x)",
-            "4. Outliers exclusivos apenas quartil (5%)",
-            "Qtd de SKUs/itens com possíveis problemas",
-            "'%' de SKUs/itens com possíveis problemas",
-            "Volume de vendas total",
-            "Volume de vendas dos skus com possíveis problemas",
-            "% Volume de vendas dos skus com possíveis problemas"
-        ],
-        "Valor": [
-            total_itens,
-            problemas_contenido,
-            outliers_ambos,
-            outliers_somente_mediana,
-            outliers_somente_quartil,
-            problemas_valor_bruto,
-            round(problemas_valor_perc, 2),
-            volume_total,
-            volume_problemas,
-            round(volume_problemas_perc, 2)
-        ]
-    })
-
-
-
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        # --- Aba Detalhes ---
-        df.to_excel(writer, index=False, sheet_name="Detalhes")
-
-        # --- Aba Resumo ---
-        df_resumo.to_excel(writer, index=False, sheet_name="Resumo", startrow=1)
-
-        workbook = writer.book
-        worksheet = writer.sheets["Resumo"]
-
-        # ----------------------------
-        # FORMATOS
-        # ----------------------------
-        header_format = workbook.add_format({
-            "bold": True, "align": "center", "valign": "vcenter",
-            "bg_color": "#D9D9D9", "border": 1
-        })
-
-        normal_format = workbook.add_format({"border": 1})
-        bold_format = workbook.add_format({"bold": True, "border": 1})
-        orange_bold_format = workbook.add_format({
-            "bold": True, "border": 1, "font_color": "#E36C0A"
-        })
-        gray_format = workbook.add_format({
-            "bg_color": "#F2F2F2", "border": 1, "bold": True
-        })
-        percent_format = workbook.add_format({
-            "num_format": "0.0%", "border": 1
-        })
-        number_format = workbook.add_format({
-            "num_format": "#,##0", "border": 1
-        })
-        empty_format = workbook.add_format()  # para linhas em branco
-
-        # ----------------------------
-        # AJUSTE DE LARGURAS
-        # ----------------------------
-        worksheet.set_column("A:A", 60)
-        worksheet.set_column("B:B", 25)
+# O processamento roda numa thread da sessão; a página só acompanha o progresso
+# (reexecutando a cada INTERVALO_PROGRESSO segundos) e pode cancelá-lo. Um job
+# por arquivo+opções: reexecuções e cliques repetidos reaproveitam o job em
+# andamento em vez de iniciar outro.
+INTERVALO_PROGRESSO = 0.5
+ROTULOS_ETAPAS = {
+    "leitura": "Leitura do arquivo (linhas lidas)",
+    "leitura_arquivos": "Leitura dos arquivos (arquivos lidos)",
+    "base_auxiliar": "Base validadora",
+    "extrair_peso": "Extração de peso das descrições (linhas)",
+    "validar_precos": "Validação de preços (subcategorias)",
+    "validacoes_paralelas": "Validações em paralelo (subcategorias)",
+    "cruzamento_ean": "Cruzamento por EAN (linhas)",
+    "exportacao": "Geração do arquivo para download (linhas escritas)",
+}
+
+
+def chave_processamento(uploaded_file, uploaded_aux, somente_necessarias, com_diagnostico, baixa_memoria=False,
+                        faixas_referencia=None):
+    # Índice de referência atualizado = outro processamento
+    referencia = faixas_referencia["atualizado_em"] if faixas_referencia is not None else None
+    return (hash_upload(uploaded_file), hash_upload(uploaded_aux), somente_necessarias, com_diagnostico,
+            baixa_memoria, referencia)
+
+
+def _copia_upload(arquivo):
+    """Cópia independente do upload para a thread (o objeto do Streamlit muda a cada reexecução)."""
+    if arquivo is None:
+        return None
+    if isinstance(arquivo, list):
+        return [_copia_upload(item) for item in arquivo]
+    copia = BytesIO(arquivo.getvalue())
+    copia.name = arquivo.name
+    return copia
+
+
+def _executar_job(job, *args, **kwargs):
+    def progresso(nome, feito, total):
+        if job["cancelar"].is_set():
+            raise ProcessamentoCancelado()
+        job["etapas"][nome] = (feito, total)
+
+    def ao_ler(df):
+        job["previa"] = df.head(20)
+
+    try:
+        job["resultado"] = processar_uploads(*args, progresso=progresso, ao_ler=ao_ler, **kwargs)
+        job["estado"] = "concluido"
+    except ProcessamentoCancelado:
+        job["estado"] = "cancelado"
+    except Exception as e:
+        job["erro"] = e
+        job["estado"] = "erro"
+
+
+def iniciar_job(uploaded_file, uploaded_aux, somente_necessarias, formato, com_diagnostico, paralelo,
+                baixa_memoria=False, faixas_referencia=None):
+    """Job (dict) para estes arquivos e opções: o já existente na sessão ou um novo, iniciado numa thread.
+
+    Ao iniciar um novo job, os outros em andamento na sessão são cancelados (a
+    página só acompanha um arquivo por vez).
+    """
+    jobs = st.session_state.setdefault("jobs", {})
+    trava = st.session_state.setdefault("trava_resultados", threading.Lock())
+    chave = chave_processamento(uploaded_file, uploaded_aux, somente_necessarias, com_diagnostico, baixa_memoria,
+                                faixas_referencia)
+    chave_job = chave + (formato,)
+    if chave_job in jobs:
+        return jobs[chave_job]
+
+    for outro in jobs.values():
+        outro["cancelar"].set()
+    job = {"estado": "processando", "etapas": {}, "previa": None, "resultado": None, "erro": None,
+           "cancelar": threading.Event()}
+    job["thread"] = threading.Thread(
+        target=_executar_job,
+        args=(job, _cache_sessao(), chave, _copia_upload(uploaded_file), _copia_upload(uploaded_aux)),
+        kwargs={"somente_necessarias": somente_necessarias, "formato": formato,
+                "com_diagnostico": com_diagnostico, "paralelo": paralelo, "trava": trava,
+                "baixa_memoria": baixa_memoria, "faixas_referencia": faixas_referencia},
+        daemon=True,
+    )
+    jobs.clear()
+    jobs[chave_job] = job
+    job["thread"].start()
+    return job
 
-        # ----------------------------
-        # CABEÇALHOS
-        # ----------------------------
-        worksheet.write("A1", "Métrica", header_format)
-        worksheet.write("B1", "Números", header_format)
-
-        # 1️⃣ Escreve a primeira linha do df_resumo na linha 2
-        worksheet.write(1, 0, df_resumo["Métrica"].iloc[0], normal_format)
-        worksheet.write(1, 1, df_resumo["Valor"].iloc[0], number_format)
-
-        # 2️⃣ Cabeçalho na linha 3
-        worksheet.write(2, 0, "Métrica", header_format)
-        worksheet.write(2, 1, "Valor", header_format)
-
-        # Linha inicial para escrever os dados (começando na linha 4, pois linha 3 é cabeçalho)
-        linha_inicial = 3
-
-        for i, (metrica, valor) in enumerate(zip(df_resumo["Métrica"][1:], df_resumo["Valor"][1:])):
-            
-            linha_atual = linha_inicial + i
-            
-            # Se chegamos à linha 8 (percentual), aplicamos o formato percentual
-            if linha_atual == 8:
-                worksheet.write_number(linha_atual, 1, valor / 100, percent_format)
-            else:
-                worksheet.write(linha_atual, 1, valor, number_format)
-            
-            # Escreve a métrica na coluna A
-            worksheet.write(linha_atual, 0, metrica, normal_format)
-
-
-        # Inserir linha vazia após a linha 8 (que será a linha 9)
-        worksheet.write_blank(9, 0, None, normal_format)
-        worksheet.write_blank(9, 1, None, number_format)
-
-        # Corrigir o valor da célula B11 (shift manual após o blank)
-        worksheet.write(10, 1, df_resumo["Valor"].iloc[7], number_format)
-        worksheet.write(11, 1, df_resumo["Valor"].iloc[8], number_format)            
-        # ----------------------------
-        # BLOCOS COLORIDOS
-        # ----------------------------
-        # 1️⃣ Critérios na linha 3
-        worksheet.merge_range("A3:B3", "Critérios de itens com possíveis problemas", gray_format)
 
-        # 2️⃣ Linhas laranja — na mesma linha correta
-        worksheet.write("A9", "% de SKUs/itens com possíveis problemas", orange_bold_format)
-        worksheet.write("B9", df_resumo.loc[6, "Valor"] / 100, percent_format)  # Qtd total problemas
+def mostrar_progresso(job):
+    for nome, (feito, total) in list(job["etapas"].items()):
+        rotulo = ROTULOS_ETAPAS.get(nome, nome)
+        if total:
+            st.progress(min(feito / total, 1.0), text=f"{rotulo}: {feito:,} de {total:,}".replace(",", "."))
+        else:
+            st.progress(0, text=f"{rotulo}: {feito:,}".replace(",", ".") if feito else f"{rotulo}...")
 
-        worksheet.write("A13", "% Volume de vendas dos skus com possíveis problemas", orange_bold_format)
-        worksheet.write_number("B13", df_resumo.loc[9, "Valor"] / 100, percent_format)
 
-        # # 3️⃣ Remove destaque do “Volume de vendas total” e insere linha em branco antes do “com problema”
-        # worksheet.write("A10", "", empty_format)
-        # worksheet.write("B10", "", empty_format)
+OPCOES_EXPORTACAO = {
+    "Excel (.xlsx) com Detalhes e Resumo": "xlsx",
+    "Zip: Resumo (.xlsx) + Detalhes em CSV": "csv",
+    "Zip: Resumo (.xlsx) + Detalhes em Parquet": "parquet",
+}
 
-    return output.getvalue()
 
 # ----------------------------
-# Upload do arquivo principal
+# Explorador de linhas sinalizadas
 # ----------------------------
-uploaded_file = st.file_uploader("Selecione o arquivo Excel ou CSV **Bruto** com a categoria em questão", type=["xlsx", "csv"])
+# Filtros e paginação rodam no servidor sobre os índices de `indexar_resultado`
+# (montados uma vez por resultado e guardados junto dele no cache da sessão);
+# o navegador recebe só a página atual, ordenada por volume de vendas.
+TAMANHOS_PAGINA = [20, 50, 100, 500]
+
+
+def indice_exploracao(resultado):
+    if "indice_exploracao" not in resultado:
+        colunas = resultado["colunas"]
+        resultado["indice_exploracao"] = indexar_resultado(resultado["df_final"], colunas["vendas"],
+                                                           colunas["categoria"])
+    return resultado["indice_exploracao"]
+
+
+def _formatar_opcao(grupos):
+    return lambda valor: f"{valor} ({len(grupos[valor]):,})".replace(",", ".")
+
+
+def mostrar_explorador(resultado):
+    """Filtros por status e subcategoria e a página escolhida das linhas filtradas."""
+    indice = indice_exploracao(resultado)
+    coluna_categoria = resultado["colunas"]["categoria"]
+    prefixo = f"explorar_{id(resultado)}"  # filtros de outro resultado não valem para este
+
+    filtros = {}
+    colunas_status = [c for c in indice["valores"] if c != coluna_categoria]
+    for campo, coluna in zip(st.columns(len(colunas_status)), colunas_status):
+        grupos = indice["valores"][coluna]
+        padrao = ["RISCO"] if coluna == "StatusGeral" and "RISCO" in grupos else []
+        rotulo = "Arquivo de origem" if coluna == COLUNA_ORIGEM else coluna
+        filtros[coluna] = campo.multiselect(rotulo, sorted(grupos, key=lambda v, g=grupos: -len(g[v])),
+                                            default=padrao, format_func=_formatar_opcao(grupos),
+                                            key=f"{prefixo}_{coluna}")
+    if coluna_categoria in indice["valores"]:
+        grupos = indice["valores"][coluna_categoria]
+        filtros[coluna_categoria] = st.multiselect("Subcategoria", sorted(grupos, key=str),
+                                                   format_func=_formatar_opcao(grupos),
+                                                   key=f"{prefixo}_{coluna_categoria}")
+    selecao = filtrar_resultado(indice, filtros)
+
+    campo_tamanho, campo_pagina = st.columns(2)
+    tamanho = campo_tamanho.selectbox("Linhas por página", TAMANHOS_PAGINA, index=1, key=f"{prefixo}_tamanho")
+    paginas = max(1, -(-len(selecao) // tamanho))
+    # A chave muda com os filtros: ao filtrar, volta para a primeira página
+    pagina = campo_pagina.number_input(f"Página (de {paginas:,})".replace(",", "."), min_value=1,
+                                       max_value=paginas, value=1,
+                                       key=f"{prefixo}_pagina_{hash(repr(sorted(filtros.items(), key=str)))}_{tamanho}")
+    inicio = (pagina - 1) * tamanho
+    faixa = f"{len(selecao):,} linhas; mostrando {min(inicio + 1, len(selecao)):,}–{min(inicio + tamanho, len(selecao)):,}"
+    st.caption(faixa.replace(",", ".") + " (da maior para a menor venda)")
+    st.dataframe(pagina_resultado(resultado["df_final"], indice, selecao, pagina, tamanho))
 
-if uploaded_file is not None:
-    nome_base = uploaded_file.name.rsplit(".", 1)[0]
 
-# 🔹 Novo: Upload da base auxiliar
-uploaded_aux = st.file_uploader("**APENAS PARA O TIME DE DATA EXCELLENCE:** Selecione a base validadora (para cruzar por EAN)", type=["xlsx", "csv"])
+# ----------------------------
+# Índice de referência de faixas de preço
+# ----------------------------
+def mostrar_indice_referencia(resultado, faixas_referencia):
+    """Botão para acrescentar os preços deste resultado ao índice salvo e a situação do índice."""
+    if st.button("➕ Acrescentar os preços deste arquivo ao índice de referência"):
+        indice = carregar_indice_faixas() or novo_indice_faixas()
+        colunas = resultado["colunas"]
+        if atualizar_indice_faixas(indice, resultado["df_final"], colunas["preco"], colunas["categoria"],
+                                   origem=resultado["nome"]):
+            salvar_indice_faixas(indice)
+            st.success(f"✅ Índice atualizado: {len(indice['faixas'])} subcategorias.")
+        else:
+            st.info("ℹ️ Os preços deste arquivo já estão no índice de referência.")
+        faixas_referencia = indice
+    if faixas_referencia is None:
+        st.caption("Ainda não há índice de referência; acrescente um arquivo validado para criá-lo.")
+        return
+    st.caption(f"{len(faixas_referencia['faixas'])} subcategorias de {len(faixas_referencia['origens'])} "
+               f"arquivos; criado em {faixas_referencia['construido_em']}, atualizado em "
+               f"{faixas_referencia['atualizado_em']}.")
+    st.dataframe(faixas_referencia["faixas"])
 
-if uploaded_file is not None:
-    st.info("Processando arquivo...")
 
+# ----------------------------
+# Página
+# ----------------------------
+def main():
+    """Monta a página; o Streamlit executa este arquivo como __main__ a cada interação."""
     # ----------------------------
-    # Leitura do arquivo principal
+    # Configurações do app
     # ----------------------------
-    if uploaded_file.name.endswith(".csv"):
-        try:
-            df = pd.read_csv(uploaded_file, encoding="latin-1", sep=None, engine="python")
-        except UnicodeDecodeError:
-            df = pd.read_csv(uploaded_file, encoding="utf-8", sep=None, engine="python")
-    else:
-        df = pd.read_excel(uploaded_file, header=0)
-
-    # 🔹 Novo: leitura da base auxiliar (se enviada)
-    # 🔹 Novo: leitura da base auxiliar (se enviada) - lê especificamente a aba "Planilha Validadora"
-    df_aux = None
-    if uploaded_aux is not None:
-        try:
-            filename_aux_lower = uploaded_aux.name.lower()
-            # Se for CSV, lemos normalmente (CSV não tem sheets)
-            if filename_aux_lower.endswith(".csv"):
-                df_aux = pd.read_csv(uploaded_aux, encoding="utf-8", sep=None, engine="python")
-                st.info("🔁 Base auxiliar lida como CSV (nenhuma aba disponível).")
-            else:
-                # Tenta ler a aba "Planilha Validadora"
-                try:
-                    df_aux = pd.read_excel(uploaded_aux, sheet_name="PLANILHA VALIDADORA")
-                    st.info('✅ Aba "Planilha Validadora" encontrada e carregada da base auxiliar.')
-                except ValueError:
-                    # aba não encontrada — fallback para a primeira aba e aviso
-                    try:
-                        df_aux = pd.read_excel(uploaded_aux, sheet_name=0)
-                        st.warning('⚠️ Aba "Planilha Validadora" não encontrada — carregada a primeira aba como fallback.')
-                    except Exception as e_inner:
-                        st.warning(f"⚠️ Erro ao ler a base auxiliar (fallback): {e_inner}")
-                        df_aux = None
-        except Exception as e:
-            st.warning(f"⚠️ Não foi possível ler a base auxiliar: {e}")
-            df_aux = None
-
+    st.set_page_config(
+        page_title="Validador de Embalagens e Preços",
+        layout="wide"
+    )
 
-    # ----------------------------
-    # Normalização de nomes
-    # ----------------------------
-    df.columns = df.columns.str.strip().str.lower()
-    if df_aux is not None:
-        df_aux.columns = df_aux.columns.str.strip().str.lower()
-    df.columns = df.columns.str.strip().str.lower()
+    st.markdown("<h1 style='text-align: center;'>Validador de Mapeio e Preços</h1>", unsafe_allow_html=True)
+    st.markdown("""
+    Para o funcionamento correto da ferramenta, são necessárias colunas que **tenham nomes semelhantes** aos seguintes:
+    - **Descrição:** `Descripcion`, `PROD_NOMBRE_ORIGINAL`, `Nome SKU`
+    - **Contenido:** `Contenido`, `Qtd Conteúdo SKU`
+    - **Preço Kg/Lt:** `Precio KG/LT`, `Preço convertido kg/lt R$`, `Preço kg/lt`
+    - **Subcategoria:** `Est Mer 7 (Subcategoria)`, `NIVEL1`
+    - **Venda em volume:** `Imp Vta (Ult.24 Meses)`, `Vendas em volume`
+
+    A ferramenta faz:
+    - Validação da quantidade de embalagem (`QtdEmbalagem` e `QtdEmbalagemGramas`)
+    - Validação de conteúdo (`ValidacaoContenido`)
+    - Detecção de preços fora do padrão por subcategoria (`ValidacionPrecio`)
+    - Detecção adicional de preços extremos baseados na mediana (`ValidacionPrecioMediana`)
+    - Download do Excel processado
+    """)
 
     # ----------------------------
-    # Mapeamento flexível de colunas
+    # Upload do arquivo principal
     # ----------------------------
-    mapa_colunas = {
-        "descricao": ["descripcion", "prod_nombre_original", "nome sku"],
-        "contenido": ["contenido", "qtd conteúdo sku"],
-        "preco": ["precio kg/lt", "preço convertido kg/lt r$", "preço kg/lt"],
-        "categoria": ["est mer 7 (subcategoria)", "nivel1", "est mer 7 descripcion"],
-        "vendas": ["imp vta (ult.24 meses)", "vendas em volume", "imp vta (ult 24meses)"]
-    }
-
-    def encontrar_coluna(possiveis):
-        for nome in possiveis:
-            if nome in df.columns:
-                return nome
-        return None
+    uploaded_files = st.file_uploader(
+        "Selecione o arquivo Excel ou CSV **Bruto** com a categoria em questão (vários arquivos, ex.: extrações "
+        "regionais, são validados juntos em um único relatório)",
+        type=["xlsx", "csv"], accept_multiple_files=True,
+    )
+    # Um arquivo: o upload; vários: a lista (ver `processar_uploads`)
+    uploaded_file = uploaded_files[0] if len(uploaded_files) == 1 else (uploaded_files or None)
 
-    coluna_descricao = encontrar_coluna(mapa_colunas["descricao"])
-    coluna_contenido = encontrar_coluna(mapa_colunas["contenido"])
-    coluna_preco = encontrar_coluna(mapa_colunas["preco"])
-    coluna_categoria = encontrar_coluna(mapa_colunas["categoria"])
-    coluna_vendas = encontrar_coluna(mapa_colunas["vendas"])
+    if uploaded_file is not None:
+        nome_base = uploaded_files[0].name.rsplit(".", 1)[0]
+        if len(uploaded_files) > 1:
+            nome_base += "_combinado"
 
-    # ----------------------------
-    # Validação de colunas obrigatórias
-    # ----------------------------
-    colunas_necessarias = {
-        "Descrição": coluna_descricao,
-        "Conteúdo": coluna_contenido,
-        "Preço": coluna_preco,
-        "Categoria": coluna_categoria,
-        "Vendas": coluna_vendas
-    }
-
-    colunas_faltando = [nome for nome, valor in colunas_necessarias.items() if valor is None]
-
-    if colunas_faltando:
-        st.error(
-            f"❌ Não foi possível identificar as seguintes colunas no arquivo: "
-            f"{', '.join(colunas_faltando)}"
-        )
-        st.stop()
+    # 🔹 Novo: Upload da base auxiliar
+    uploaded_aux = st.file_uploader("**APENAS PARA O TIME DE DATA EXCELLENCE:** Selecione a base validadora (para cruzar por EAN)", type=["xlsx", "csv"])
 
-    # ----------------------------
-    # Conversão da coluna de vendas
-    # ----------------------------
-    df[coluna_vendas] = (
-        df[coluna_vendas]
-        .astype(str)
-        .str.replace(r"[^\d,.-]", "", regex=True)
-        .str.replace(".", "", regex=False)
-        .str.replace(",", ".", regex=False)
+    somente_necessarias = st.checkbox(
+        "Ler apenas as colunas usadas na validação (mais rápido; o Excel gerado terá só essas colunas)"
     )
-    df[coluna_vendas] = pd.to_numeric(df[coluna_vendas], errors="coerce")
-    df = df[df[coluna_vendas] > 0]
-
-    # ----------------------------
-    # Processamento principal
-    # ----------------------------
-    df[["QtdEmbalagem", "QtdEmbalagemGramas"]] = df[coluna_descricao].apply(
-        lambda x: pd.Series(extrair_peso(x))
+    paralelo = st.checkbox(
+        "Processar em paralelo por subcategoria (arquivos muito grandes; usa todos os núcleos do servidor)"
     )
-
-    def comparar_contenido(qtd_embalagem_gramas, contenido):
-        try:
-            if pd.isna(qtd_embalagem_gramas) or pd.isna(contenido):
-                return "PROBLEMA"
-            contenido_val = float(str(contenido).replace(",", "."))
-            return "OK" if abs(qtd_embalagem_gramas - contenido_val) < 1 else "PROBLEMA"
-        except Exception:
-            return "PROBLEMA"
-
-    df["ValidacaoContenido"] = df.apply(
-        lambda row: comparar_contenido(row["QtdEmbalagemGramas"], row[coluna_contenido]),
-        axis=1
+    baixa_memoria = st.checkbox(
+        "Modo de baixa memória (arquivos muito grandes; lê só as colunas usadas e mostra o pico de memória)"
     )
 
-    # ----------------------------
-    # Validações de preço
-    # ----------------------------
-    df["ValidacionPrecio"] = validar_precio_por_categoria(df, coluna_preco, coluna_categoria)
-    df["ValidacionPrecioMediana"] = validar_precio_mediana(df, coluna_preco, coluna_categoria)
-
-    df["StatusGeral"] = df.apply(
-        lambda x: "RISCO"
-        if (
-            x["ValidacaoContenido"] != "OK"
-            or x["ValidacionPrecio"] != "OK"
-            or x["ValidacionPrecioMediana"] != "OK"
-        )
-        else "OK",
-        axis=1
+    faixas_referencia = carregar_indice_faixas()
+    usar_referencia = st.checkbox(
+        "Validar preços contra o índice de referência de faixas (faixas de arquivos anteriores, "
+        "em vez de só as do arquivo enviado)",
+        disabled=faixas_referencia is None,
+        help=f"Índice em {CAMINHO_INDICE_FAIXAS}" if faixas_referencia is not None else
+             "Nenhum índice de referência salvo ainda",
     )
 
-    # ===================================================
-    # 🔹 NOVO BLOCO: Cruzamento com base auxiliar por EAN
-    # ===================================================
-    df_final = df.copy()
-
-    if df_aux is not None:
-        try:
-            # Normaliza nome da coluna de código de barras
-            possiveis_ean_df = ["codigo barras", "código barras", "ean"]
-            possiveis_ean_aux = ["codigo barras", "código barras", "ean", "codigo_barras"]
-
-            def encontrar_ean(df_ref, lista_nomes):
-                for nome in lista_nomes:
-                    if nome in df_ref.columns:
-                        return nome
-                return None
-
-            col_ean_df = encontrar_ean(df, possiveis_ean_df)
-            col_ean_aux = encontrar_ean(df_aux, possiveis_ean_aux)
-
-            if col_ean_df and col_ean_aux:
-                # Seleciona apenas colunas R, W e Y (independente de maiúsculas/minúsculas)
-                colunas_aux_interesse = ["analise preço kg/lt", "mapeio pack", "localiza se há conteúdo no descritivo atual", 
-                                        "fórmula dun -> ean","localiza se há marca no descritivo atual", 
-                                        "localiza se há categoria no descritivo atual"]
-                colunas_aux_existentes = [
-                    c for c in df_aux.columns if c.lower() in colunas_aux_interesse
-                ]
-
-                if colunas_aux_existentes:
-                    # Faz o merge mantendo todas as linhas do df principal
-                    df_final = df.merge(
-                        df_aux[[col_ean_aux] + colunas_aux_existentes],
-                        how="left",
-                        left_on=col_ean_df,
-                        right_on=col_ean_aux,
-                        suffixes=("", "_aux")
-                    )
-
-                    # 🔹 Garante que a coluna de EAN original da base principal seja preservada
-                    if col_ean_df not in df_final.columns:
-                        # Se por algum motivo sumiu, recria a partir do right_on
-                        df_final[col_ean_df] = df[col_ean_df]
-
-                    # 🔹 Evita perda de EAN quando as colunas tinham o mesmo nome
-                    if col_ean_aux in df_final.columns and col_ean_aux != col_ean_df:
-                        # Mantém o EAN da base principal, remove apenas o duplicado
-                        df_final = df_final.drop(columns=[col_ean_aux])
-
-                    st.success(
-                        f"✅ Bases cruzadas com sucesso por '{col_ean_df}'. "
-                        f"Colunas adicionadas: {', '.join(colunas_aux_existentes)}"
-                    )
-                else:
-                    st.warning("⚠️ Nenhuma das colunas de interesse foi encontrada na base auxiliar. "
-                            "Verifique os nomes: " + ", ".join(colunas_aux_interesse))
-            else:
-                st.warning("⚠️ Não foi possível localizar a coluna de EAN em uma das bases.")
-
-        except Exception as e:
-            st.warning(f"⚠️ Erro ao cruzar as bases: {e}")
-            df_final = df
-
-
-    # ===================================================
-    # Resultado final
-    # ===================================================
-    st.success("✅ Processamento concluído com sucesso!")
-    st.dataframe(df_final.head(20))
-
-###########################################################################
-### FUNÇÃO PARA GERAR ABA NO EXCEL COM RESUMO DOS PROBLEMAS ENCONTRADOS ###
-###########################################################################
-    def gerar_resumo(df, coluna_vendas="vendas", col_validacao_contenido="ValidacaoContenido",
-                 col_outlier_quartil="ValidacionPrecio", col_outlier_mediana="ValidacionPrecioMediana"):
-        
-        # Cria um DataFrame resumo com métricas consolidadas:
-        # - Quantidade de SKUs/itens
-        # - Problemas de conteúdo
-        # - Outliers em comum e exclusivos
-        # - Totais e % de problemas em valor e volume
-
-        resumo = {}
-
-        # Total de SKUs/itens
-        resumo["Qtd Total SKUs/Itens"] = len(df)
-
-        # Problemas de conteúdo
-        resumo["Qtd Problemas Conteúdo"] = (df[col_validacao_contenido] == "PROBLEMA").sum()
-
-        # Outliers
-        outlier_quartil = df[col_outlier_quartil] == "OUTLIER"
-        outlier_mediana = df[col_outlier_mediana] == "OUTLIER_MEDIANA"
-
-        resumo["Qtd Outliers em comum (Quartil e Mediana)"] = (outlier_quartil & outlier_mediana).sum()
-        resumo["Qtd Outliers apenas Mediana"] = (outlier_mediana & ~outlier_quartil).sum()
-        resumo["Qtd Outliers apenas Quartil"] = (outlier_quartil & ~outlier_mediana).sum()
-
-        # Totais e %
-        resumo["Qtd Total SKUs com problema (conteúdo ou preço)"] = (
-            (df[col_validacao_contenido] != "PROBLEMA") | outlier_quartil | outlier_mediana
-        ).sum()
-        resumo["% SKUs com problema"] = resumo["Qtd Total SKUs com problema (conteúdo ou preço)"] / len(df) * 100
-
-        # Volume de vendas
-        if coluna_vendas in df.columns:
-            resumo["Volume Total Vendas"] = df[coluna_vendas].sum()
-            resumo["Volume Vendas com problema"] = df.loc[
-                (df[col_validacao_contenido] == "PROBLEMA") | outlier_quartil | outlier_mediana,
-                coluna_vendas
-            ].sum()
-            resumo["% Volume Vendas com problema"] = resumo["Volume Vendas com problema"] / resumo["Volume Total Vendas"] * 100
-        else:
-            resumo["Volume Total Vendas"] = np.nan
-            resumo["Volume Vendas com problema"] = np.nan
-            resumo["% Volume Vendas com problema"] = np.nan
-
-        # Retorna como DataFrame (uma linha)
-        return pd.DataFrame([resumo])
-
-
-    # Após processar o DataFrame df
-    df_resumo = gerar_resumo(df_final, coluna_vendas=coluna_vendas)
+    formato = OPCOES_EXPORTACAO[st.selectbox("Formato do arquivo para download", list(OPCOES_EXPORTACAO))]
 
-    st.download_button(
-    label="📥 Baixar Excel Processado com Resumo",
-    data=to_excel_com_resumo(df_final, coluna_vendas),
-    file_name=f"{nome_base}_analise_risco.xlsx",
-    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
+    com_diagnostico = st.checkbox("Mostrar diagnóstico de desempenho (tempo e memória por etapa)")
+    if com_diagnostico:
+        configurar_log_json()  # também no log do servidor, uma linha JSON por etapa
 
+    if uploaded_file is not None:
+        # ----------------------------
+        # Leitura, processamento (mapeamento de colunas, validações e cruzamento
+        # por EAN) e geração do Excel — em segundo plano e reaproveitados entre
+        # reexecuções
+        # ----------------------------
+        job = iniciar_job(uploaded_file, uploaded_aux, somente_necessarias, formato, com_diagnostico, paralelo,
+                          baixa_memoria, faixas_referencia if usar_referencia else None)
+        if job["estado"] == "processando":
+            aviso = st.info("Processando arquivo...")
+            botao = st.empty()
+            botao.button("⏹️ Cancelar processamento", on_click=job["cancelar"].set)
+            acompanhamento = st.empty()
+            while job["thread"].is_alive():
+                with acompanhamento.container():
+                    mostrar_progresso(job)
+                    if job["previa"] is not None:
+                        st.caption("Prévia das primeiras linhas lidas (antes das validações)")
+                        st.dataframe(job["previa"])
+                time.sleep(INTERVALO_PROGRESSO)
+            for elemento in (aviso, botao, acompanhamento):
+                elemento.empty()
+
+        if job["estado"] == "cancelado":
+            st.warning("⏹️ Processamento cancelado.")
+            st.button("🔄 Processar novamente", on_click=st.session_state["jobs"].clear)
+            st.stop()
+        if job["estado"] == "erro":
+            if isinstance(job["erro"], ColunasFaltandoError):
+                st.error(str(job["erro"]))
+                st.stop()
+            st.session_state["jobs"].clear()  # erro inesperado: tenta de novo na próxima interação
+            raise job["erro"]
+        resultado = job["resultado"]
+        mostrar_avisos(resultado["avisos"])
+        df_final = resultado["df_final"]
+        coluna_vendas = resultado["colunas"]["vendas"]
+
+
+        # ===================================================
+        # Resultado final
+        # ===================================================
+        st.success("✅ Processamento concluído com sucesso!")
+        if "pico_memoria_mb" in resultado:
+            st.caption(f"Pico de memória do processamento: {resultado['pico_memoria_mb']:,.1f} MB")
+
+        st.subheader("Explorar linhas")
+        mostrar_explorador(resultado)
+
+        # Mesmas métricas da aba Resumo do Excel
+        st.subheader("Resumo")
+        st.dataframe(calcular_resumo(df_final, coluna_vendas), hide_index=True)
+        resumo_origens = tabela_resumo_por_origem(df_final, coluna_vendas)
+        if resumo_origens is not None:
+            st.caption("Por arquivo de origem")
+            st.dataframe(resumo_origens, hide_index=True)
+
+        if formato == "xlsx":
+            st.download_button(
+            label="📥 Baixar Excel Processado com Resumo",
+            data=resultado["exportacoes"][formato],
+            file_name=f"{nome_base}_analise_risco.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            )
+        else:
+            st.download_button(
+            label="📥 Baixar Resumo e Detalhes (.zip)",
+            data=resultado["exportacoes"][formato],
+            file_name=f"{nome_base}_analise_risco.zip",
+            mime="application/zip"
+            )
+
+        with st.expander("📚 Índice de referência de faixas de preço"):
+            mostrar_indice_referencia(resultado, faixas_referencia)
+
+        if resultado["mudancas"] is not None:
+            st.subheader(f"Linhas com status alterado desde o último processamento ({len(resultado['mudancas'])})")
+            st.dataframe(resultado["mudancas"], hide_index=True)
+            st.download_button(
+            label="📥 Baixar linhas alteradas (.csv)",
+            data=resultado["mudancas"].to_csv(index=False, sep=";", decimal=",").encode("utf-8-sig"),
+            file_name=f"{nome_base}_mudancas.csv",
+            mime="text/csv"
+            )
+
+        if resultado["diagnostico"] is not None:
+            with st.expander("🔎 Diagnóstico de desempenho", expanded=True):
+                etapas, regras = tabela_diagnostico(resultado["diagnostico"])
+                st.caption(f"Tempo total: {etapas['segundos'].sum():.2f}s")
+                st.dataframe(etapas, hide_index=True)
+                st.caption("Descrições resolvidas por cada regra de extração de peso")
+                st.dataframe(regras, hide_index=True)
+
+
+if __name__ == "__main__":
+    main()
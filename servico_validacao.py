@@ -0,0 +1,433 @@
+"""Serviço HTTP local, sem interface, para validar arquivos de categoria.
+
+Exemplos:
+    python servico_validacao.py --base-aux validadora.xlsx --workers 4 --fila 8
+    curl --data-binary @cat.xlsx "http://127.0.0.1:8765/jobs?nome=cat.xlsx"
+    curl http://127.0.0.1:8765/jobs/<id>
+    curl -o cat_analise_risco.xlsx http://127.0.0.1:8765/jobs/<id>/resultado
+
+Cada envio vira um job processado por um pool de processos (mesmo pipeline de
+`validar_lote.processar_arquivo`: leitura, validações de conteúdo e preço,
+cruzamento por EAN e Excel com Resumo). A fila é limitada: com `--workers`
+jobs em andamento e `--fila` esperando, novos envios recebem 429 com
+`Retry-After` até liberar espaço.
+
+Rotas:
+    POST   /jobs?nome=<arquivo.xlsx|csv>[&formato=][&backend=][&baixa_memoria=1]
+           corpo = conteúdo do arquivo; responde 202 com o id do job
+    GET    /jobs/<id>            estado (na_fila, processando, concluido, erro,
+                                 cancelado) e, ao terminar, a linha do resumo
+    GET    /jobs/<id>/resultado  baixa o xlsx/zip do job concluído
+    DELETE /jobs/<id>            cancela (se ainda na fila) e apaga os arquivos
+    GET    /saude                workers, ocupação da fila e capacidade
+"""
+import argparse
+import json
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from validador_mapeio import BACKENDS, FORMATOS_DETALHES, POLARS_DISPONIVEL, carregar_indice_ean
+from validar_lote import EXTENSOES, _inicializar_worker, processar_arquivo
+
+TIPOS_SAIDA = {
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ".zip": "application/zip",
+}
+TAMANHO_PEDACO = 1024 * 1024
+MAX_JOBS_GUARDADOS = 200
+# Gravado pelo worker na pasta do job quando começa a processá-lo (ver `iniciado_em`)
+MARCA_INICIO = ".iniciado"
+
+
+# ----------------------------
+# Fila de jobs
+# ----------------------------
+def criar_servico(pasta, workers=2, fila=4, indice_ean=None, max_mb=500):
+    """Monta o estado do serviço: pool de processos, jobs e limites da fila.
+
+    Cabem no máximo `workers + fila` jobs pendentes (na fila ou processando);
+    acima disso `submeter_job` recusa o envio (back-pressure).
+    """
+    os.makedirs(pasta, exist_ok=True)
+    return {
+        "pasta": pasta,
+        "workers": workers,
+        "capacidade": workers + fila,
+        "max_bytes": int(max_mb * 1024 * 1024),
+        "executor": ProcessPoolExecutor(max_workers=workers, initializer=_inicializar_worker_servico,
+                                        initargs=(indice_ean,)),
+        "jobs": {},
+        "reservas": 0,
+        "trava": threading.Lock(),
+        "segundos_medios": None,
+    }
+
+
+def _inicializar_worker_servico(indice_ean):
+    # Ctrl+C encerra só o servidor; os workers terminam pelo shutdown do pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _inicializar_worker(indice_ean)
+
+
+def _processar_job(caminho, pasta_saida, **opcoes):
+    """Roda no worker: marca o início do job e valida o arquivo (`processar_arquivo`)."""
+    open(os.path.join(pasta_saida, MARCA_INICIO), "w").close()
+    return processar_arquivo(caminho, pasta_saida, **opcoes)
+
+
+def iniciado_em(job):
+    """Quando um worker começou o job (None se ainda não começou).
+
+    `Future.running()` não serve para isso: o pool marca como em execução os jobs
+    já passados à fila interna dos workers, antes de algum worker pegá-los.
+    """
+    try:
+        return os.path.getmtime(os.path.join(job["pasta"], MARCA_INICIO))
+    except OSError:
+        return None
+
+
+def _pendentes(servico):
+    return sum(1 for job in servico["jobs"].values() if not job["futuro"].done())
+
+
+def reservar_vaga(servico):
+    """Reserva uma vaga na fila; retorna o id do novo job ou None se está cheia."""
+    with servico["trava"]:
+        if _pendentes(servico) + servico["reservas"] >= servico["capacidade"]:
+            return None
+        servico["reservas"] += 1
+    return uuid.uuid4().hex[:12]
+
+
+def liberar_reserva(servico):
+    with servico["trava"]:
+        servico["reservas"] -= 1
+
+
+def submeter_job(servico, id_job, caminho, formato="xlsx", backend="pandas", baixa_memoria=False):
+    """Envia ao pool o arquivo já gravado em `caminho` (consome a reserva de `reservar_vaga`).
+
+    Se o pool recusar o envio (RuntimeError, inclusive BrokenProcessPool), a
+    reserva continua feita e cabe a quem chamou liberá-la.
+    """
+    pasta_saida = os.path.dirname(caminho)
+    futuro = servico["executor"].submit(_processar_job, caminho, pasta_saida, formato=formato,
+                                        backend=backend, baixa_memoria=baixa_memoria)
+    job = {
+        "id": id_job,
+        "nome": os.path.basename(caminho),
+        "pasta": pasta_saida,
+        "futuro": futuro,
+        "criado_em": time.time(),
+        "concluido_em": None,
+    }
+    futuro.add_done_callback(lambda _: _job_terminou(servico, job))
+    with servico["trava"]:
+        servico["reservas"] -= 1
+        servico["jobs"][id_job] = job
+    _descartar_antigos(servico)
+    return job
+
+
+def _job_terminou(servico, job):
+    job["concluido_em"] = time.time()
+    if job["futuro"].cancelled():
+        return
+    segundos = job["concluido_em"] - job["criado_em"]
+    with servico["trava"]:
+        media = servico["segundos_medios"]
+        servico["segundos_medios"] = segundos if media is None else 0.8 * media + 0.2 * segundos
+
+
+def _descartar_antigos(servico):
+    """Apaga os jobs terminados mais antigos além de MAX_JOBS_GUARDADOS."""
+    with servico["trava"]:
+        terminados = sorted((j for j in servico["jobs"].values() if j["futuro"].done()),
+                            key=lambda j: j["criado_em"])
+        excesso = terminados[:max(0, len(servico["jobs"]) - MAX_JOBS_GUARDADOS)]
+        for job in excesso:
+            del servico["jobs"][job["id"]]
+    for job in excesso:
+        shutil.rmtree(job["pasta"], ignore_errors=True)
+
+
+def estado_job(job):
+    """Estado do job para a API; ao terminar inclui a linha do resumo (sem caminhos locais)."""
+    futuro = job["futuro"]
+    resposta = {"id": job["id"], "arquivo": job["nome"], "criado_em": job["criado_em"]}
+    if futuro.cancelled():
+        resposta["estado"] = "cancelado"
+    elif futuro.done():
+        if futuro.exception() is not None:
+            linha = {"status": "ERRO", "erro": f"{type(futuro.exception()).__name__}: {futuro.exception()}"}
+        else:
+            linha = {k: v for k, v in futuro.result().items() if k not in ("arquivo", "saida")}
+        resposta["estado"] = "erro" if linha["status"] == "ERRO" else "concluido"
+        resposta["concluido_em"] = job["concluido_em"]
+        resposta["resumo"] = linha
+    else:
+        inicio = iniciado_em(job)
+        resposta["estado"] = "na_fila" if inicio is None else "processando"
+        if inicio is not None:
+            resposta["iniciado_em"] = inicio
+    return resposta
+
+
+def caminho_resultado(job):
+    """Arquivo gerado pelo job concluído, ou None."""
+    futuro = job["futuro"]
+    if not futuro.done() or futuro.cancelled() or futuro.exception() is not None:
+        return None
+    saida = futuro.result().get("saida")
+    return saida if saida and os.path.exists(saida) else None
+
+
+def remover_job(servico, id_job):
+    """Cancela o job (se ainda na fila) e apaga seus arquivos; em processamento retorna False."""
+    with servico["trava"]:
+        job = servico["jobs"].get(id_job)
+        if job is None:
+            return None
+        if not job["futuro"].done() and not job["futuro"].cancel():
+            return False
+        del servico["jobs"][id_job]
+    shutil.rmtree(job["pasta"], ignore_errors=True)
+    return True
+
+
+def saude(servico):
+    with servico["trava"]:
+        jobs = list(servico["jobs"].values())
+        media = servico["segundos_medios"]
+    pendentes = [j for j in jobs if not j["futuro"].done()]
+    processando = sum(1 for j in pendentes if iniciado_em(j) is not None)
+    return {
+        "workers": servico["workers"],
+        "capacidade": servico["capacidade"],
+        "processando": processando,
+        "na_fila": len(pendentes) - processando,
+        "jobs_guardados": len(jobs),
+        "segundos_medios_job": round(media, 2) if media is not None else None,
+    }
+
+
+def _segundos_espera(servico):
+    """Sugestão de Retry-After: tempo médio de um job (mín. 1s, padrão 5s)."""
+    media = servico["segundos_medios"]
+    return max(1, round(media)) if media is not None else 5
+
+
+# ----------------------------
+# HTTP
+# ----------------------------
+class ManipuladorValidacao(BaseHTTPRequestHandler):
+    """Rotas do serviço; o estado fica em `self.server.servico` (ver `criar_servico`)."""
+
+    server_version = "ValidacaoMapeio/1.0"
+
+    def log_message(self, formato, *args):
+        if not getattr(self.server, "silencioso", False):
+            super().log_message(formato, *args)
+
+    def _responder_json(self, status, corpo, cabecalhos=None):
+        dados = json.dumps(corpo, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(dados)))
+        for nome, valor in (cabecalhos or {}).items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def _erro(self, status, mensagem, cabecalhos=None):
+        # O corpo do pedido pode não ter sido lido: fecha a conexão para não misturar requisições
+        self.close_connection = True
+        self._responder_json(status, {"erro": mensagem}, cabecalhos)
+
+    def _rota(self):
+        partes = [p for p in urlsplit(self.path).path.split("/") if p]
+        return partes, parse_qs(urlsplit(self.path).query)
+
+    def _job(self, id_job):
+        with self.server.servico["trava"]:
+            job = self.server.servico["jobs"].get(id_job)
+        if job is None:
+            self._erro(HTTPStatus.NOT_FOUND, f"job {id_job} não encontrado")
+        return job
+
+    def do_GET(self):
+        partes, _ = self._rota()
+        servico = self.server.servico
+        if partes == ["saude"]:
+            self._responder_json(HTTPStatus.OK, saude(servico))
+        elif len(partes) == 2 and partes[0] == "jobs":
+            job = self._job(partes[1])
+            if job is not None:
+                self._responder_json(HTTPStatus.OK, estado_job(job))
+        elif len(partes) == 3 and partes[0] == "jobs" and partes[2] == "resultado":
+            job = self._job(partes[1])
+            if job is not None:
+                self._enviar_resultado(job)
+        else:
+            self._erro(HTTPStatus.NOT_FOUND, "rota inexistente")
+
+    def _enviar_resultado(self, job):
+        saida = caminho_resultado(job)
+        if saida is None:
+            estado = estado_job(job)["estado"]
+            status = HTTPStatus.CONFLICT if estado in ("na_fila", "processando") else HTTPStatus.GONE
+            self._erro(status, f"resultado indisponível (job {estado})")
+            return
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", TIPOS_SAIDA[os.path.splitext(saida)[1]])
+        self.send_header("Content-Length", str(os.path.getsize(saida)))
+        self.send_header("Content-Disposition", f'attachment; filename="{os.path.basename(saida)}"')
+        self.end_headers()
+        with open(saida, "rb") as f:
+            shutil.copyfileobj(f, self.wfile, TAMANHO_PEDACO)
+
+    def do_DELETE(self):
+        partes, _ = self._rota()
+        if len(partes) != 2 or partes[0] != "jobs":
+            self._erro(HTTPStatus.NOT_FOUND, "rota inexistente")
+            return
+        removido = remover_job(self.server.servico, partes[1])
+        if removido is None:
+            self._erro(HTTPStatus.NOT_FOUND, f"job {partes[1]} não encontrado")
+        elif not removido:
+            self._erro(HTTPStatus.CONFLICT, "job já entregue a um worker não pode ser cancelado")
+        else:
+            self._responder_json(HTTPStatus.OK, {"id": partes[1], "removido": True})
+
+    def do_POST(self):
+        partes, parametros = self._rota()
+        servico = self.server.servico
+        if partes != ["jobs"]:
+            self._erro(HTTPStatus.NOT_FOUND, "rota inexistente")
+            return
+
+        nome = os.path.basename(parametros.get("nome", [""])[0])
+        formato = parametros.get("formato", ["xlsx"])[0]
+        backend = parametros.get("backend", ["pandas"])[0]
+        baixa_memoria = parametros.get("baixa_memoria", ["0"])[0].lower() in ("1", "true", "sim")
+        if not nome.lower().endswith(EXTENSOES) or nome.startswith("~$"):
+            self._erro(HTTPStatus.BAD_REQUEST, "informe ?nome=<arquivo.xlsx|.csv>")
+            return
+        if formato not in FORMATOS_DETALHES or backend not in BACKENDS:
+            self._erro(HTTPStatus.BAD_REQUEST, f"formato deve ser um de {FORMATOS_DETALHES} "
+                                               f"e backend um de {BACKENDS}")
+            return
+        if backend == "polars" and not POLARS_DISPONIVEL:
+            self._erro(HTTPStatus.BAD_REQUEST, "backend polars requer os pacotes polars e pyarrow")
+            return
+        tamanho = self.headers.get("Content-Length")
+        if tamanho is None:
+            self._erro(HTTPStatus.LENGTH_REQUIRED, "Content-Length obrigatório")
+            return
+        try:
+            tamanho = int(tamanho)
+        except ValueError:
+            tamanho = -1
+        if tamanho < 0:
+            self._erro(HTTPStatus.BAD_REQUEST, "Content-Length inválido")
+            return
+        if tamanho > servico["max_bytes"]:
+            self._erro(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                       f"arquivo acima de {servico['max_bytes'] // (1024 * 1024)} MB")
+            return
+
+        id_job = reservar_vaga(servico)
+        if id_job is None:
+            espera = _segundos_espera(servico)
+            self._erro(HTTPStatus.TOO_MANY_REQUESTS, f"fila cheia, tente de novo em {espera}s",
+                       {"Retry-After": str(espera)})
+            return
+        pasta_job = os.path.join(servico["pasta"], id_job)
+        try:
+            os.makedirs(pasta_job)
+            caminho = os.path.join(pasta_job, nome)
+            with open(caminho, "wb") as f:
+                restante = tamanho
+                while restante:
+                    pedaco = self.rfile.read(min(TAMANHO_PEDACO, restante))
+                    if not pedaco:
+                        raise ConnectionError("corpo incompleto")
+                    f.write(pedaco)
+                    restante -= len(pedaco)
+        except OSError as e:
+            liberar_reserva(servico)
+            shutil.rmtree(pasta_job, ignore_errors=True)
+            self._erro(HTTPStatus.BAD_REQUEST, f"falha ao receber o arquivo: {e}")
+            return
+
+        try:
+            job = submeter_job(servico, id_job, caminho, formato, backend, baixa_memoria)
+        except RuntimeError as e:
+            # Pool encerrado ou quebrado (BrokenProcessPool): o job não entrou na fila
+            liberar_reserva(servico)
+            shutil.rmtree(pasta_job, ignore_errors=True)
+            self._erro(HTTPStatus.SERVICE_UNAVAILABLE, f"pool de validação indisponível: {e}")
+            return
+        self._responder_json(HTTPStatus.ACCEPTED, estado_job(job),
+                             {"Location": f"/jobs/{id_job}"})
+
+
+def criar_servidor(servico, host="127.0.0.1", porta=8765, silencioso=False):
+    """Servidor HTTP (uma thread por conexão) ligado ao `servico`; a validação roda no pool."""
+    servidor = ThreadingHTTPServer((host, porta), ManipuladorValidacao)
+    servidor.daemon_threads = True
+    servidor.servico = servico
+    servidor.silencioso = silencioso
+    return servidor
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serviço HTTP local de validação de arquivos de categoria.")
+    parser.add_argument("--host", default="127.0.0.1", help="endereço (padrão: só localhost)")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--base-aux", help="base validadora para cruzar por EAN em todos os jobs")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="jobs processados ao mesmo tempo (processos; padrão: metade dos núcleos)")
+    parser.add_argument("--fila", type=int, default=8,
+                        help="jobs aguardando além dos em andamento; acima disso responde 429")
+    parser.add_argument("--max-mb", type=float, default=500, help="tamanho máximo de cada arquivo enviado")
+    parser.add_argument("--pasta", help="onde guardar envios e resultados (padrão: pasta temporária)")
+    parser.add_argument("--silencioso", action="store_true", help="não registra cada requisição")
+    args = parser.parse_args(argv)
+    if args.workers < 1 or args.fila < 0:
+        parser.error("--workers deve ser >= 1 e --fila >= 0")
+
+    indice_ean = None
+    if args.base_aux:
+        indice_ean, avisos_aux = carregar_indice_ean(args.base_aux)
+        for _, mensagem in avisos_aux:
+            print(mensagem)
+
+    pasta = args.pasta or tempfile.mkdtemp(prefix="validacao_mapeio_")
+    servico = criar_servico(pasta, args.workers, args.fila, indice_ean, args.max_mb)
+    servidor = criar_servidor(servico, args.host, args.porta, args.silencioso)
+    print(f"Servindo em http://{args.host}:{servidor.server_address[1]} "
+          f"({args.workers} workers, fila {args.fila}, arquivos em {pasta})")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        servico["executor"].shutdown(wait=True, cancel_futures=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,18 @@
+import os
+import sys
+import tempfile
+
+# O cache em disco (pesos, índice de faixas, resultados) é lido de
+# MAPEIO_CACHE_DIR na importação; os testes usam uma pasta temporária.
+os.environ.setdefault("MAPEIO_CACHE_DIR", tempfile.mkdtemp(prefix="mapeio_testes_"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+from benchmark_mapeio import gerar_dados  # noqa: E402
+
+
+@pytest.fixture
+def dados():
+    """(df_principal, df_aux) sintéticos com os nomes de coluna das extrações reais."""
+    return gerar_dados(3000, seed=1)
@@ -0,0 +1,47 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import validador_mapeio as vm
+
+DESCRICOES = pd.Series(["BISC C/12", "OLEO SOJA 900ML", None, "SABAO 6X500G", "BISC C/12"])
+
+
+@pytest.fixture
+def conexoes(monkeypatch):
+    """Registra as conexões abertas pelo cache para conferir se foram fechadas."""
+    abertas = []
+    conectar = sqlite3.connect
+
+    class Conexao(sqlite3.Connection):
+        fechada = False
+
+        def close(self):
+            self.fechada = True
+            super().close()
+
+    def conectar_registrando(*args, **kwargs):
+        conn = conectar(*args, factory=Conexao, **kwargs)
+        abertas.append(conn)
+        return conn
+
+    monkeypatch.setattr(sqlite3, "connect", conectar_registrando)
+    return abertas
+
+
+def test_cache_corrompido_fecha_conexao(tmp_path, conexoes):
+    caminho = tmp_path / "extrair_peso.sqlite"
+    caminho.write_bytes(b"isto nao e um banco sqlite" * 100)
+    resultado = vm.extrair_peso_com_cache(DESCRICOES, caminho_cache=str(caminho))
+    pd.testing.assert_frame_equal(resultado, vm.extrair_peso_lote(DESCRICOES))
+    assert conexoes and all(conn.fechada for conn in conexoes)
+
+
+def test_cache_reaproveitado(tmp_path, conexoes):
+    caminho = str(tmp_path / "extrair_peso.sqlite")
+    primeira = vm.extrair_peso_com_cache(DESCRICOES, caminho_cache=caminho, incluir_regra=True)
+    segunda = vm.extrair_peso_com_cache(DESCRICOES, caminho_cache=caminho, incluir_regra=True)
+    pd.testing.assert_frame_equal(primeira, segunda)
+    pd.testing.assert_frame_equal(primeira, vm.extrair_peso_lote(DESCRICOES, incluir_regra=True))
+    assert all(conn.fechada for conn in conexoes)
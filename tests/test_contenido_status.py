@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+import validador_mapeio as vm
+
+
+def _comparar_contenido_original(qtd_embalagem_gramas, contenido):
+    try:
+        if pd.isna(qtd_embalagem_gramas) or pd.isna(contenido):
+            return "PROBLEMA"
+        contenido_val = float(str(contenido).replace(",", "."))
+        return "OK" if abs(qtd_embalagem_gramas - contenido_val) < 1 else "PROBLEMA"
+    except Exception:
+        return "PROBLEMA"
+
+
+def _status_original(linha):
+    validacoes = (linha["ValidacaoContenido"], linha["ValidacionPrecio"], linha["ValidacionPrecioMediana"])
+    return "RISCO" if any(v != "OK" for v in validacoes) else "OK"
+
+
+def test_contenido_igual_ao_original():
+    gramas = pd.Series([500, 500, 500, 500, np.nan, 12, 1000, np.nan], index=list("abcdefgh"), dtype=float)
+    contenido = pd.Series([500, 500.99, 501, 499.5, 500, np.nan, 1000.0, np.nan], index=list("abcdefgh"))
+    esperado = pd.Series([_comparar_contenido_original(g, c) for g, c in zip(gramas, contenido)],
+                         index=gramas.index, dtype=object)
+    pd.testing.assert_series_equal(vm.comparar_contenido(gramas, contenido), esperado)
+    assert esperado.tolist() == ["OK", "OK", "PROBLEMA", "OK", "PROBLEMA", "PROBLEMA", "OK", "PROBLEMA"]
+
+
+def test_status_geral_igual_ao_original():
+    rng = np.random.default_rng(6)
+    n = 500
+    df = pd.DataFrame({
+        "ValidacaoContenido": rng.choice(["OK", "PROBLEMA"], size=n),
+        "ValidacionPrecio": rng.choice(np.array(["OK", "OUTLIER", np.nan], dtype=object), size=n),
+        "ValidacionPrecioMediana": rng.choice(np.array(["OK", "OUTLIER_MEDIANA", np.nan], dtype=object), size=n),
+    }, index=rng.permutation(n))
+    esperado = df.apply(_status_original, axis=1)
+    pd.testing.assert_series_equal(vm.calcular_status_geral(df), esperado.astype(object))
+
+
+def test_status_geral_com_category():
+    df = pd.DataFrame({coluna: pd.Categorical(["OK", "OK", "OUTLIER"], categories=vm.CATEGORIAS_STATUS)
+                       for coluna in vm.COLUNAS_VALIDACAO})
+    df.loc[1, "ValidacaoContenido"] = "PROBLEMA"
+    assert vm.calcular_status_geral(df).tolist() == ["OK", "RISCO", "RISCO"]
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import validador_mapeio as vm
+
+
+@pytest.mark.parametrize("texto, preco, vendas", [
+    ("R$ 1.234,56", 1234.56, 1234.56),
+    ("R$1.234.567,8", 1234567.8, 1234567.8),
+    ("1,234.56", 1234.56, 1234.56),
+    ("12,5", 12.5, 12.5),
+    ("-3,5", -3.5, -3.5),
+    ("1.000.000", 1_000_000, 1_000_000),
+    ("1,000,000", 1_000_000, 1_000_000),
+    # ponto único: decimal no preço, milhar nas vendas
+    ("1.000", 1.0, 1000.0),
+    ("1.5", 1.5, 15.0),
+    (" 10 ", 10.0, 10.0),
+])
+def test_formatos_br_e_us(texto, preco, vendas):
+    serie = pd.Series([texto], dtype=object)
+    assert vm.converter_numero(serie).iloc[0] == pytest.approx(preco)
+    assert vm.converter_numero(serie, ponto_milhar=True).iloc[0] == pytest.approx(vendas)
+
+
+def test_vazios_texto_e_numeros_misturados():
+    serie = pd.Series(["", "abc", None, np.nan, 7, 2.5, "3,5"], dtype=object)
+    resultado = vm.converter_numero(serie)
+    assert resultado.dtype == np.float64
+    np.testing.assert_array_equal(resultado.to_numpy(), [np.nan, np.nan, np.nan, np.nan, 7, 2.5, 3.5])
+
+
+def test_coluna_numerica_mantida():
+    serie = pd.Series([1, 2, 3], index=[5, 6, 7])
+    pd.testing.assert_series_equal(vm.converter_numero(serie), serie.astype(float))
+
+
+def test_contenido_nao_remove_texto():
+    resultado = vm.converter_numero(pd.Series(["500 g", "1 000,5", "900"]), remover_texto=False)
+    np.testing.assert_array_equal(resultado.to_numpy(), [np.nan, 1000.5, 900])
+
+
+def test_vendas_igual_a_limpeza_original():
+    textos = pd.Series(["1.234", "1.234,5", "12", "0", "-5", "3,25", "R$ 10.000"])
+    original = pd.to_numeric(
+        textos.str.replace(r"[^\d,.-]", "", regex=True)
+        .str.replace(".", "", regex=False)
+        .str.replace(",", ".", regex=False),
+        errors="coerce",
+    )
+    pd.testing.assert_series_equal(vm.converter_numero(textos, ponto_milhar=True), original)
+
+
+def test_normalizar_conta_falhas():
+    df = pd.DataFrame({"preco": ["R$ 1,50", "sem preço", None, ""], "vendas": ["1.000", "2", "3", "4"]})
+    falhas = vm.normalizar_colunas_numericas(df, {"preco": {}, "vendas": {"ponto_milhar": True}})
+    assert falhas == {"preco": 1, "vendas": 0}
+    assert df["vendas"].tolist() == [1000.0, 2.0, 3.0, 4.0]
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import validador_mapeio as vm
+
+
+@pytest.fixture
+def resultado():
+    rng = np.random.default_rng(7)
+    n = 503
+    vendas = rng.integers(1, 60, n).astype(float)
+    vendas[::17] = np.nan
+    return pd.DataFrame({
+        "StatusGeral": rng.choice(["OK", "ALERTA", "ERRO"], n),
+        "ValidacionPrecio": rng.choice(["OK", "Fora da faixa", None], n),
+        "Est Mer 7 (Subcategoria)": rng.choice(["A", "B", "C", "D"], n),
+        "vendas": vendas,
+    }, index=rng.permutation(n) * 10)
+
+
+def _indice(df):
+    return vm.indexar_resultado(df, "vendas", "Est Mer 7 (Subcategoria)")
+
+
+def _esperado(df, filtros):
+    mascara = np.ones(len(df), dtype=bool)
+    for coluna, aceitos in filtros.items():
+        if aceitos:
+            mascara &= df[coluna].isin(aceitos).to_numpy()
+    return df[mascara].sort_values("vendas", ascending=False, kind="stable", na_position="last")
+
+
+@pytest.mark.parametrize("filtros", [
+    {},
+    {"StatusGeral": ["ERRO"]},
+    {"StatusGeral": ["ERRO", "ALERTA"]},
+    {"StatusGeral": ["ERRO", "ALERTA"], "Est Mer 7 (Subcategoria)": ["B", "D"]},
+    {"StatusGeral": ["OK"], "ValidacionPrecio": ["Fora da faixa"], "Est Mer 7 (Subcategoria)": ["A"]},
+    {"StatusGeral": [], "Est Mer 7 (Subcategoria)": ["C", "inexistente"]},
+])
+def test_filtro_igual_a_mascara_e_ordenado_por_vendas(resultado, filtros):
+    indice = _indice(resultado)
+    selecao = vm.filtrar_resultado(indice, filtros)
+    esperado = _esperado(resultado, filtros)
+    obtido = vm.pagina_resultado(resultado, indice, selecao, tamanho_pagina=len(resultado))
+    pd.testing.assert_frame_equal(obtido, esperado)
+    vendas = obtido["vendas"].to_numpy()
+    validas = vendas[~np.isnan(vendas)]
+    assert (np.diff(validas) <= 0).all() and np.isnan(vendas[len(validas):]).all()
+
+
+def test_valor_sem_linhas_e_nulos(resultado):
+    indice = _indice(resultado)
+    assert len(vm.filtrar_resultado(indice, {"StatusGeral": ["inexistente"]})) == 0
+    assert len(vm.filtrar_resultado(indice, {"StatusGeral": ["OK"], "Est Mer 7 (Subcategoria)": ["X"]})) == 0
+    # Nulos não viram um valor de filtro
+    grupos = indice["valores"]["ValidacionPrecio"]
+    assert set(grupos) == {"OK", "Fora da faixa"}
+    assert sum(map(len, grupos.values())) == resultado["ValidacionPrecio"].notna().sum()
+
+
+def test_paginas(resultado):
+    indice = _indice(resultado)
+    selecao = vm.filtrar_resultado(indice, {"StatusGeral": ["ERRO", "ALERTA"]})
+    esperado = _esperado(resultado, {"StatusGeral": ["ERRO", "ALERTA"]})
+    tamanho = 50
+    paginas = -(-len(selecao) // tamanho)
+    juntas = pd.concat([vm.pagina_resultado(resultado, indice, selecao, p, tamanho) for p in range(1, paginas + 1)])
+    pd.testing.assert_frame_equal(juntas, esperado)
+
+    ultima = vm.pagina_resultado(resultado, indice, selecao, paginas, tamanho)
+    assert len(ultima) == len(selecao) - (paginas - 1) * tamanho
+    assert 0 < len(ultima) <= tamanho
+    pd.testing.assert_frame_equal(ultima, esperado.iloc[(paginas - 1) * tamanho:])
+
+    alem = vm.pagina_resultado(resultado, indice, selecao, paginas + 1, tamanho)
+    assert alem.empty and list(alem.columns) == list(resultado.columns)
+
+    vazia = vm.filtrar_resultado(indice, {"StatusGeral": ["inexistente"]})
+    assert vm.pagina_resultado(resultado, indice, vazia, 1, tamanho).empty
+
+
+def test_sem_coluna_de_vendas_mantem_ordem_original(resultado):
+    indice = vm.indexar_resultado(resultado.drop(columns="vendas"))
+    assert (indice["ordem"] == np.arange(len(resultado))).all()
+    selecao = vm.filtrar_resultado(indice, {"StatusGeral": ["OK"]})
+    obtido = vm.pagina_resultado(resultado, indice, selecao, tamanho_pagina=len(resultado))
+    pd.testing.assert_frame_equal(obtido, resultado[resultado["StatusGeral"] == "OK"])
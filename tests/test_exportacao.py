@@ -0,0 +1,63 @@
+import io
+import zipfile
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pytest
+
+import validador_mapeio as vm
+
+
+@pytest.fixture
+def resultado(dados):
+    df, df_aux = dados
+    df_final, colunas, _ = vm.processar_dataframe(df, df_aux)
+    return df_final, colunas
+
+
+def _abas(conteudo):
+    return pd.read_excel(io.BytesIO(conteudo), sheet_name=None)
+
+
+def test_infinito_vira_texto_como_no_to_excel(resultado):
+    df_final, colunas = resultado
+    df_final = df_final.head(3).copy()
+    df_final[colunas["preco"]] = [np.inf, -np.inf, 1.5]
+    planilha = openpyxl.load_workbook(io.BytesIO(vm.to_excel_com_resumo(df_final, colunas["vendas"])))["Detalhes"]
+    coluna = list(df_final.columns).index(colunas["preco"]) + 1
+    assert [planilha.cell(linha, coluna).value for linha in (2, 3, 4)] == ["inf", "-inf", 1.5]
+
+
+def test_detalhes_divididos_em_abas(resultado, monkeypatch):
+    df_final, colunas = resultado
+    monkeypatch.setattr(vm, "MAX_LINHAS_ABA", 1000)
+    abas = _abas(vm.to_excel_com_resumo(df_final, colunas["vendas"]))
+    detalhes = [nome for nome in abas if nome.startswith("Detalhes")]
+    assert detalhes == ["Detalhes"] + [f"Detalhes_{i}" for i in range(2, len(detalhes) + 1)]
+    assert len(detalhes) == -(-len(df_final) // 1000)
+    assert [len(abas[nome]) for nome in detalhes[:-1]] == [1000] * (len(detalhes) - 1)
+    assert sum(len(abas[nome]) for nome in detalhes) == len(df_final)
+    juntas = pd.concat([abas[nome] for nome in detalhes], ignore_index=True)
+    assert juntas[colunas["descricao"]].tolist() == df_final[colunas["descricao"]].tolist()
+
+
+@pytest.mark.parametrize("formato", ["csv", "parquet"])
+def test_zip_com_detalhes_e_resumo(resultado, formato):
+    if formato == "parquet":
+        pytest.importorskip("pyarrow")
+    df_final, colunas = resultado
+    xlsx = _abas(vm.exportar_resultado(df_final, colunas["vendas"], "xlsx"))
+    with zipfile.ZipFile(io.BytesIO(vm.exportar_resultado(df_final, colunas["vendas"], formato))) as zf:
+        assert sorted(zf.namelist()) == sorted(["resumo.xlsx", f"detalhes.{formato}"])
+        resumo = _abas(zf.read("resumo.xlsx"))
+        with zf.open(f"detalhes.{formato}") as f:
+            if formato == "csv":
+                detalhes = pd.read_csv(f, sep=";", decimal=",", encoding="utf-8-sig",
+                                       dtype={c: str for c in df_final.columns if df_final[c].dtype == object})
+            else:
+                detalhes = pd.read_parquet(f)
+
+    assert list(resumo) == ["Resumo"]
+    pd.testing.assert_frame_equal(resumo["Resumo"], xlsx["Resumo"])
+    pd.testing.assert_frame_equal(detalhes, df_final.reset_index(drop=True), check_dtype=False)
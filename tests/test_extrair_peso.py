@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import validador_mapeio as vm
+from benchmark_mapeio import gerar_dados
+
+DESCRICOES = [
+    # pack com unidade final, inclusive com unidade intermediária e vírgula
+    "BISCOITO 6X500G", "REFRIG 2 UN X 6 X 350ML", "CERVEJA 12X350ML", "SUCO 3X4X200ML", "AGUA 6 X 1,5L",
+    # peso/volume simples e conversão kg/l
+    "ARROZ 5KG", "OLEO SOJA 900ML", "LEITE 1L", "CAFE 500GR", "ACUCAR 1 KILO", "DETERGENTE 0,5 LT",
+    # unidades, C/xx e C/xxXyy
+    "OVOS 12 UN", "COPO 2X50UN", "BISC C/12", "BALA C.4X12", "FOSFORO C 10", "PAPEL HIG 12X30R",
+    "PAPEL HIG L12P11", "GUARDANAPO 3X12", "VELA PCT 8",
+    # faixas, sem número, números fora do limite
+    "SABAO 200-300G", "SHAMPOO 350 A 400ML", "PRODUTO SEM PESO", "COD 123456", "", "   ", "sabonete 90g",
+]
+
+
+def _por_linha(serie):
+    linhas = [vm.extrair_peso(texto) if pd.notna(texto) else (None, None) for texto in serie]
+    return pd.DataFrame(linhas, columns=["QtdEmbalagem", "QtdEmbalagemGramas"], index=serie.index)
+
+
+def _comparar(serie):
+    esperado = _por_linha(serie)
+    resultado = vm.extrair_peso_lote(serie)
+    assert resultado["QtdEmbalagem"].tolist() == esperado["QtdEmbalagem"].tolist()
+    np.testing.assert_array_equal(resultado["QtdEmbalagemGramas"].to_numpy(),
+                                  esperado["QtdEmbalagemGramas"].astype(float).to_numpy())
+
+
+def test_lote_igual_por_linha_em_padroes_conhecidos():
+    _comparar(pd.Series(DESCRICOES + [None, np.nan], index=range(100, 100 + len(DESCRICOES) + 2)))
+
+
+def test_lote_igual_por_linha_em_dados_sinteticos():
+    df, _ = gerar_dados(2000, seed=4)
+    _comparar(df["Descripcion"])
+
+
+@pytest.mark.parametrize("descricao, bloco, gramas, regra", [
+    ("BISCOITO 6X500G", "6X500G", 3000, "multi"),
+    ("ARROZ 5KG", "5KG", 5000, "simples"),
+    ("BISC C/12", "C/12", 12, "c"),
+    ("PRODUTO SEM PESO", None, None, None),
+])
+def test_regra_que_resolveu(descricao, bloco, gramas, regra):
+    linha = vm.extrair_peso_lote(pd.Series([descricao]), incluir_regra=True).iloc[0]
+    assert linha["QtdEmbalagem"] == bloco and linha["RegraPeso"] == regra
+    assert linha["QtdEmbalagemGramas"] == gramas or (gramas is None and np.isnan(linha["QtdEmbalagemGramas"]))
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+import validador_mapeio as vm
+from benchmark_mapeio import gerar_dados
+
+
+def _revisar(df):
+    """Arquivo reenviado: preços e descrições corrigidos, linhas removidas e novas."""
+    revisado = df.copy()
+    revisado.loc[10:40, "Precio KG/LT"] = "R$ 9.999,00"
+    revisado.loc[50:60, "Descripcion"] = "PRODUTO CORRIGIDO 2X500G"
+    revisado.loc[70, "Imp Vta (Ult.24 Meses)"] = 0
+    novas, _ = gerar_dados(50, seed=9)
+    return pd.concat([revisado.drop(index=range(100, 130)), novas], ignore_index=True)
+
+
+def test_incremental_igual_ao_completo(dados):
+    df, df_aux = dados
+    anterior, colunas, _ = vm.processar_dataframe(df, df_aux)
+    revisado = _revisar(df)
+
+    incremental, _, avisos, mudancas = vm.revalidar_incremental(revisado, anterior, colunas, df_aux)
+    completo, _, _ = vm.processar_dataframe(revisado, df_aux)
+
+    assert not any("validado por completo" in mensagem for _, mensagem in avisos)
+    pd.testing.assert_frame_equal(incremental.reset_index(drop=True), completo.reset_index(drop=True),
+                                  check_dtype=False)
+    assert set(mudancas["Situacao"]) == {"NOVA", "REMOVIDA", "ALTERADA"}
+
+
+def test_sem_mudancas(dados):
+    df, df_aux = dados
+    anterior, colunas, _ = vm.processar_dataframe(df, df_aux)
+    incremental, _, _, mudancas = vm.revalidar_incremental(df, anterior, colunas, df_aux)
+    pd.testing.assert_frame_equal(incremental.reset_index(drop=True), anterior.reset_index(drop=True),
+                                  check_dtype=False)
+    assert mudancas.empty
+
+
+def test_colunas_diferentes_valida_tudo(dados):
+    df, df_aux = dados
+    anterior, colunas, _ = vm.processar_dataframe(df, df_aux)
+    incremental, _, avisos, _ = vm.revalidar_incremental(df.assign(Extra=np.arange(len(df))), anterior, colunas)
+    assert any("validado por completo" in mensagem for _, mensagem in avisos)
+    assert len(incremental) == len(anterior)
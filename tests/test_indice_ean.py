@@ -0,0 +1,112 @@
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import validador_mapeio as vm
+
+
+def _com_digito(doze):
+    """EAN-13 (int) a partir dos 12 primeiros dígitos."""
+    digitos = [int(d) for d in f"{doze:012d}"]
+    soma = sum(d * (3 if i % 2 else 1) for i, d in enumerate(digitos))
+    return doze * 10 + (10 - soma % 10) % 10
+
+
+def _dun(ean, indicador=1):
+    """DUN-14 do EAN-13: indicador + 12 primeiros dígitos + novo verificador."""
+    doze = ean // 10 + indicador * 10 ** 12
+    digitos = [int(d) for d in f"{doze:013d}"]
+    soma = sum(d * (1 if i % 2 else 3) for i, d in enumerate(digitos))
+    return doze * 10 + (10 - soma % 10) % 10
+
+
+EAN = _com_digito(789100010010)
+UPC = _com_digito(12345678901)  # EAN-13 com zero à esquerda
+
+
+def test_formatos_de_entrada():
+    serie = pd.Series([f"{UPC:013d}", f"0{UPC:013d}", float(UPC), f"{UPC}.0", f"{UPC:.11E}", UPC,
+                       f" {EAN} ", f"{EAN:.12E}", None, "", "SEM EAN"], dtype=object)
+    codigos, estatisticas = vm.normalizar_ean(serie)
+    assert codigos.tolist() == [UPC] * 6 + [EAN] * 2 + [0] * 3
+    assert estatisticas["validos"] == 8 and estatisticas["vazios_ou_invalidos"] == 3
+    assert vm.normalizar_ean(pd.Series([UPC, EAN]))[0].tolist() == [UPC, EAN]
+
+
+def test_dun14_convertido_e_digito_invalido():
+    serie = pd.Series([str(_dun(EAN)), str(_dun(EAN, 8)), str(EAN), str(EAN + 1 if EAN % 10 != 9 else EAN - 1)])
+    codigos, estatisticas = vm.normalizar_ean(serie)
+    assert codigos[:3].tolist() == [EAN] * 3
+    assert estatisticas["dun_convertidos"] == 2
+    assert estatisticas["digito_invalido"] == 1
+
+
+def _base(eans, valores):
+    return pd.DataFrame({"EAN": eans, "Mapeio Pack": valores, "Outra coluna": range(len(eans))})
+
+
+def test_ean_repetido_na_base_nao_duplica_linhas():
+    indice = vm.construir_indice_ean(_base([str(EAN), f"{EAN}.0", str(_dun(EAN)), str(UPC)],
+                                           ["PRIMEIRO", "SEGUNDO", "TERCEIRO", "UPC"]))
+    assert indice["estatisticas"]["duplicados"] == 2
+    assert indice["colunas"] == ["mapeio pack"]
+    df = pd.DataFrame({"ean": [EAN, UPC, 123, EAN], "descripcion": list("abcd")})
+    final, avisos = vm.cruzar_por_indice_ean(df, indice)
+    assert len(final) == len(df)
+    assert final["mapeio pack"].tolist()[:2] == ["PRIMEIRO", "UPC"]
+    assert pd.isna(final["mapeio pack"].iloc[2]) and final["mapeio pack"].iloc[3] == "PRIMEIRO"
+    assert "3 de 4 linhas" in avisos[0][1]
+
+
+def _indices_salvos(pasta):
+    return sorted(glob.glob(os.path.join(pasta, "indice_ean_*.pkl")))
+
+
+def test_indice_reaproveitado_e_refeito(tmp_path):
+    pasta = str(tmp_path / "cache")
+    caminho = tmp_path / "base.csv"
+    _base([str(EAN)], ["A"]).to_csv(caminho, index=False)
+
+    indice, avisos = vm.carregar_indice_ean(str(caminho), pasta_cache=pasta)
+    assert not any("reaproveitado" in m for _, m in avisos) and len(_indices_salvos(pasta)) == 1
+    indice, avisos = vm.carregar_indice_ean(str(caminho), pasta_cache=pasta)
+    assert any("reaproveitado" in m for _, m in avisos)
+    assert indice["indice"]["mapeio pack"].tolist() == ["A"]
+
+    _base([str(EAN)], ["B"]).to_csv(caminho, index=False)
+    indice, avisos = vm.carregar_indice_ean(str(caminho), pasta_cache=pasta)
+    assert not any("reaproveitado" in m for _, m in avisos)
+    assert indice["indice"]["mapeio pack"].tolist() == ["B"]
+    assert len(_indices_salvos(pasta)) == 2
+
+
+def test_descarta_indices_alem_do_limite(tmp_path, monkeypatch):
+    monkeypatch.setattr(vm, "MAX_INDICES_EAN", 3)
+    pasta = str(tmp_path / "cache")
+    for i in range(5):
+        caminho = tmp_path / f"base_{i}.csv"
+        _base([str(EAN)], [f"V{i}"]).to_csv(caminho, index=False)
+        vm.carregar_indice_ean(str(caminho), pasta_cache=pasta)
+        atual = os.path.join(pasta, f"indice_ean_{vm.hash_arquivo(str(caminho))}.pkl")
+        assert atual in _indices_salvos(pasta)
+        assert len(_indices_salvos(pasta)) == min(i + 1, 3)
+    # O mais antigo foi descartado: a base 0 volta a ser lida
+    _, avisos = vm.carregar_indice_ean(str(tmp_path / "base_0.csv"), pasta_cache=pasta)
+    assert not any("reaproveitado" in m for _, m in avisos)
+    _, avisos = vm.carregar_indice_ean(str(tmp_path / "base_4.csv"), pasta_cache=pasta)
+    assert any("reaproveitado" in m for _, m in avisos)
+
+
+def test_sem_coluna_ean():
+    assert vm.construir_indice_ean(pd.DataFrame({"mapeio pack": ["A"]})) is None
+    df = pd.DataFrame({"descripcion": ["a"]})
+    final, avisos = vm.cruzar_por_indice_ean(df, None)
+    assert final is df and avisos[0][0] == "warning"
+
+
+@pytest.mark.parametrize("valor", [np.nan, 0, 10 ** 14])
+def test_fora_da_faixa(valor):
+    assert vm.normalizar_ean(pd.Series([valor]))[0].tolist() == [0]
@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import validador_mapeio as vm
+
+
+@pytest.fixture
+def resultado(dados):
+    df, _ = dados
+    df_final, colunas, _ = vm.processar_dataframe(df)
+    return df_final, colunas
+
+
+def test_mesmo_conteudo_nao_soma_duas_vezes(resultado):
+    df_final, colunas = resultado
+    indice = vm.novo_indice_faixas()
+    assert vm.atualizar_indice_faixas(indice, df_final, colunas["preco"], colunas["categoria"], "jan.csv")
+    faixas = indice["faixas"].copy()
+    assert not vm.atualizar_indice_faixas(indice, df_final.copy(), colunas["preco"], colunas["categoria"], "de novo")
+    assert len(indice["origens"]) == 1
+    pd.testing.assert_frame_equal(indice["faixas"], faixas)
+    assert indice["faixas"]["n"].sum() == len(df_final)
+
+
+def test_arquivos_diferentes_se_somam(resultado):
+    df_final, colunas = resultado
+    metade = len(df_final) // 2
+    indice = vm.novo_indice_faixas()
+    for parte in (df_final.iloc[:metade], df_final.iloc[metade:]):
+        assert vm.atualizar_indice_faixas(indice, parte, colunas["preco"], colunas["categoria"])
+    inteiro = vm.novo_indice_faixas()
+    vm.atualizar_indice_faixas(inteiro, df_final, colunas["preco"], colunas["categoria"])
+    colunas_faixa = ["n", "mediana", "quantil_inf", "quantil_sup", "mediana_inf", "mediana_sup"]
+    pd.testing.assert_frame_equal(indice["faixas"][colunas_faixa].sort_index(),
+                                  inteiro["faixas"][colunas_faixa].sort_index())
+
+
+def test_salvar_e_carregar(resultado, tmp_path):
+    df_final, colunas = resultado
+    indice = vm.novo_indice_faixas()
+    vm.atualizar_indice_faixas(indice, df_final, colunas["preco"], colunas["categoria"])
+    caminho = str(tmp_path / "faixas.pkl")
+    vm.salvar_indice_faixas(indice, caminho)
+    carregado = vm.carregar_indice_faixas(caminho)
+    pd.testing.assert_frame_equal(carregado["faixas"], indice["faixas"])
+    assert vm.carregar_indice_faixas(str(tmp_path / "nao_existe.pkl")) is None
+    vm.salvar_indice_faixas({**indice, "versao": vm.VERSAO_INDICE_FAIXAS + 1}, caminho)
+    assert vm.carregar_indice_faixas(caminho) is None
+
+
+def test_referencia_nao_marca_o_que_o_arquivo_aceita(resultado):
+    df_final, colunas = resultado
+    indice = vm.novo_indice_faixas()
+    vm.atualizar_indice_faixas(indice, df_final, colunas["preco"], colunas["categoria"])
+    com_referencia = vm.validar_precos(df_final, colunas["preco"], colunas["categoria"],
+                                       faixas_referencia=indice["faixas"])
+    for coluna in ["ValidacionPrecio", "ValidacionPrecioMediana"]:
+        assert (com_referencia.loc[df_final[coluna] == "OK", coluna] == "OK").all()
+
+
+def test_subcategoria_sem_referencia_usa_faixas_do_arquivo(resultado):
+    df_final, colunas = resultado
+    categorias = df_final[colunas["categoria"]]
+    conhecida = categorias.value_counts().index[0]
+    indice = vm.novo_indice_faixas()
+    vm.atualizar_indice_faixas(indice, df_final[categorias == conhecida], colunas["preco"], colunas["categoria"])
+
+    com_referencia = vm.validar_precos(df_final, colunas["preco"], colunas["categoria"],
+                                       faixas_referencia=indice["faixas"])
+    sem_referencia = vm.validar_precos(df_final, colunas["preco"], colunas["categoria"])
+    novas = (categorias != conhecida).to_numpy()
+    pd.testing.assert_frame_equal(com_referencia[novas], sem_referencia[novas])
+
+    avisos = vm.avisos_faixas_referencia(df_final, colunas["categoria"], indice)
+    assert [nivel for nivel, _ in avisos] == ["info", "warning"]
+    assert f"{categorias[novas].nunique()} subcategorias sem faixa" in avisos[1][1]
+    _, _, sem_faixa = vm.faixas_com_referencia(df_final, colunas["preco"], colunas["categoria"], indice["faixas"])
+    assert set(sem_faixa) == set(categorias[novas].astype(str))
+    assert conhecida in indice["faixas"].index
+
+
+def test_subcategoria_lida_como_int_ou_float(resultado, tmp_path):
+    df_final, colunas = resultado
+    codigos = {c: 100 + i for i, c in enumerate(df_final[colunas["categoria"]].unique())}
+    df_final = df_final.assign(**{colunas["categoria"]: df_final[colunas["categoria"]].map(codigos)})
+    inteiros = df_final.copy()
+    com_vazio = df_final.copy()
+    com_vazio.iloc[0, com_vazio.columns.get_loc(colunas["categoria"])] = np.nan
+    assert inteiros[colunas["categoria"]].dtype == np.int64 and com_vazio[colunas["categoria"]].dtype == np.float64
+
+    indice = vm.novo_indice_faixas()
+    vm.atualizar_indice_faixas(indice, inteiros, colunas["preco"], colunas["categoria"])
+    assert "100" in indice["faixas"].index
+    for lido in (com_vazio, com_vazio.astype({colunas["categoria"]: "category"})):
+        assert [n for n, _ in vm.avisos_faixas_referencia(lido, colunas["categoria"], indice)] == ["info"]
+        _, chaves, sem_faixa = vm.faixas_com_referencia(lido, colunas["preco"], colunas["categoria"], indice["faixas"])
+        assert sem_faixa == [] and chaves.iloc[1:].tolist() == inteiros[colunas["categoria"]].iloc[1:].astype(str).tolist()
+        pd.testing.assert_frame_equal(
+            vm.validar_precos(lido, colunas["preco"], colunas["categoria"], faixas_referencia=indice["faixas"]).iloc[1:],
+            vm.validar_precos(inteiros, colunas["preco"], colunas["categoria"],
+                              faixas_referencia=indice["faixas"]).iloc[1:])
+    # Mesmo conteúdo, só o tipo da leitura mudou: não é somado de novo
+    como_float = inteiros.astype({colunas["categoria"]: float})
+    assert not vm.atualizar_indice_faixas(indice, como_float, colunas["preco"], colunas["categoria"])
+
+
+def test_quantis_da_referencia_pelo_n_acumulado():
+    rng = np.random.default_rng(3)
+    precos = rng.lognormal(3, 0.5, 2500)
+    indice = vm.novo_indice_faixas()
+    vm.atualizar_indice_faixas(indice, pd.DataFrame({"preco": precos, "cat": "X"}), "preco", "cat")
+    faixa = indice["faixas"].loc["X"]
+    assert faixa["n"] == 2500
+    assert faixa["quantil_inf"] == pytest.approx(np.quantile(precos, 0.02), rel=0.003)
+    assert faixa["quantil_sup"] == pytest.approx(np.quantile(precos, 0.98), rel=0.003)
+    # Um arquivo com poucas linhas da subcategoria usa a faixa madura (2-98%), não a de 5-95%
+    pequeno = pd.DataFrame({"preco": precos[:50], "cat": "X"})
+    faixas, _, _ = vm.faixas_com_referencia(pequeno, "preco", "cat", indice["faixas"])
+    assert faixas.loc["X", "quantil_inf"] == faixa["quantil_inf"]
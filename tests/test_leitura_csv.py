@@ -0,0 +1,39 @@
+import io
+
+import pandas as pd
+import pytest
+
+import validador_mapeio as vm
+
+
+def _csv_utf8_com_cauda_latin1():
+    # Início UTF-8 maior que a amostra de detecção, última linha em latin-1
+    cabeca = "descripcion;precio\nÁGUA COM GÁS;1,5\n" + "".join(
+        f"AGUA {i};1,5\n" for i in range(8000)
+    )
+    dados = cabeca.encode("utf-8") + "AÇÚCAR 1;2,5\n".encode("latin-1")
+    assert len(dados) > vm.TAMANHO_AMOSTRA_CSV
+    return dados
+
+
+@pytest.mark.parametrize("engine", ["pyarrow", "c"])
+def test_cauda_latin1_vira_texto(monkeypatch, engine):
+    if engine == "pyarrow":
+        pytest.importorskip("pyarrow")
+    monkeypatch.setattr(vm, "ENGINE_CSV", engine)
+    df = vm.ler_csv(io.BytesIO(_csv_utf8_com_cauda_latin1()))
+    assert len(df) == 8002
+    assert df["descripcion"].iloc[0] == "ÁGUA COM GÁS"
+    assert df["descripcion"].iloc[-1] == "AÇÚCAR 1"
+    assert not df["descripcion"].map(lambda v: isinstance(v, bytes)).any()
+
+
+def test_cauda_latin1_em_blocos():
+    blocos = vm.ler_csv(io.BytesIO(_csv_utf8_com_cauda_latin1()), tamanho_bloco=3000)
+    df = pd.concat(list(blocos))
+    assert df["descripcion"].iloc[-1] == "AÇÚCAR 1"
+
+
+def test_detecta_separador_e_latin1():
+    dados = "descripcion,precio\nAÇÚCAR,2.5\n".encode("latin-1")
+    assert vm.detectar_formato_csv(dados) == ("latin-1", ",")
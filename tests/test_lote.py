@@ -0,0 +1,23 @@
+import pandas as pd
+
+import validar_lote
+from benchmark_mapeio import gerar_dados
+
+
+def test_ignora_arquivos_gerados_pelo_lote(tmp_path):
+    for nome in ["cat.csv", "outra.xlsx", "cat_analise_risco.xlsx", "cat_analise_risco.zip", "resumo_lote.csv",
+                 "cat_mudancas.csv", "~$outra.xlsx", "notas.txt"]:
+        (tmp_path / nome).write_bytes(b"")
+    assert validar_lote.listar_entradas([str(tmp_path)]) == [str(tmp_path / "cat.csv"), str(tmp_path / "outra.xlsx")]
+    assert validar_lote.listar_entradas([str(tmp_path / "*.csv")]) == [str(tmp_path / "cat.csv")]
+
+
+def test_rodar_duas_vezes_na_mesma_pasta(tmp_path, capsys):
+    df, _ = gerar_dados(300, seed=10)
+    df.to_csv(tmp_path / "cat.csv", sep=";", index=False)
+    argumentos = [str(tmp_path), "--saida", str(tmp_path), "--processos", "1", "--incremental"]
+    for _ in range(2):
+        assert validar_lote.main(argumentos) == 0
+        resumo = pd.read_csv(tmp_path / validar_lote.NOME_RESUMO, sep=";", encoding="utf-8-sig")
+        assert resumo["arquivo"].tolist() == [str(tmp_path / "cat.csv")]
+    assert (tmp_path / "cat_mudancas.csv").exists()
@@ -0,0 +1,91 @@
+import io
+
+import openpyxl
+import pandas as pd
+import pytest
+
+import validador_mapeio as vm
+
+ALTERNATIVOS = {
+    "Descripcion": "Nome SKU",
+    "Contenido": "Qtd Conteúdo SKU",
+    "Precio KG/LT": "Preço KG/LT",
+    "Est Mer 7 (Subcategoria)": "Nivel1",
+    "Imp Vta (Ult.24 Meses)": "Vendas em volume",
+}
+
+
+@pytest.fixture
+def arquivos(dados, tmp_path):
+    df, _ = dados
+    primeiro, segundo = df.iloc[:1800], df.iloc[1800:].rename(columns=ALTERNATIVOS)
+    (tmp_path / "norte").mkdir()
+    (tmp_path / "sul").mkdir()
+    caminhos = [tmp_path / "norte" / "cat.csv", tmp_path / "sul" / "cat.csv"]
+    primeiro.to_csv(caminhos[0], sep=";", index=False)
+    segundo.to_csv(caminhos[1], sep=";", index=False)
+    return [str(c) for c in caminhos]
+
+
+def test_nomes_alternativos_alinhados_ao_primeiro(dados, arquivos):
+    df, _ = dados
+    combinado, avisos = vm.ler_arquivos_principais(arquivos)
+    esperado = vm.normalizar_nomes_colunas(vm.ler_arquivo_principal(arquivos[0]))
+    assert list(combinado.columns) == [vm.COLUNA_ORIGEM] + list(esperado.columns)
+    assert len(combinado) == len(df)
+    assert not combinado.isna().all().any()
+    assert not any(nivel == "warning" for nivel, _ in avisos)
+    # As linhas do segundo arquivo ficam com os valores dele, sob os nomes do primeiro
+    segundo = vm.ler_arquivo_principal(arquivos[1])
+    pd.testing.assert_series_equal(combinado["descripcion"].iloc[1800:].reset_index(drop=True),
+                                   segundo["Nome SKU"], check_names=False)
+
+
+def test_nomes_repetidos_numerados(arquivos):
+    combinado, avisos = vm.ler_arquivos_principais(arquivos)
+    origem = combinado[vm.COLUNA_ORIGEM]
+    assert list(origem.cat.categories) == ["cat.csv", "cat.csv (2)"]
+    assert origem.value_counts().to_dict() == {"cat.csv": 1800, "cat.csv (2)": 1200}
+    assert (origem.iloc[:1800] == "cat.csv").all() and (origem.iloc[1800:] == "cat.csv (2)").all()
+    assert "cat.csv (1800 linhas), cat.csv (2) (1200 linhas)" in avisos[0][1]
+
+
+def test_coluna_faltando_indica_o_arquivo(dados, tmp_path):
+    df, _ = dados
+    caminhos = [tmp_path / "a.csv", tmp_path / "b.csv"]
+    df.iloc[:100].to_csv(caminhos[0], sep=";", index=False)
+    df.iloc[100:200].drop(columns="Precio KG/LT").to_csv(caminhos[1], sep=";", index=False)
+    with pytest.raises(vm.ColunasFaltandoError) as erro:
+        vm.ler_arquivos_principais([str(c) for c in caminhos])
+    assert erro.value.colunas_faltando == ["Preço (b.csv)"]
+
+
+def test_aba_resumo_por_origem(dados, arquivos):
+    _, df_aux = dados
+    combinado, _ = vm.ler_arquivos_principais(arquivos)
+    df_final, colunas, _ = vm.processar_dataframe(combinado, df_aux)
+    planilha = openpyxl.load_workbook(io.BytesIO(vm.to_excel_com_resumo(df_final, colunas["vendas"])))
+    aba = planilha["Resumo"]
+    assert aba.cell(15, 1).value == "Resumo por arquivo de origem"
+
+    tabela = vm.tabela_resumo_por_origem(df_final, colunas["vendas"])
+    assert [aba.cell(16, j + 1).value for j in range(len(tabela.columns))] == list(tabela.columns)
+    por_origem = vm.metricas_por_origem(df_final, colunas["vendas"])
+    assert list(por_origem) == ["cat.csv", "cat.csv (2)"]
+    for i, (origem, metricas) in enumerate(por_origem.items(), 17):
+        assert aba.cell(i, 1).value == origem
+        assert aba.cell(i, 2).value == metricas["total_itens"]
+        assert aba.cell(i, 7).value == metricas["problemas_total"]
+        assert aba.cell(i, 8).value == pytest.approx(round(metricas["problemas_perc"], 2) / 100)
+        assert aba.cell(i, 9).value == pytest.approx(metricas["volume_total"])
+    assert aba.cell(19, 1).value is None
+    total = vm.calcular_metricas_resumo(df_final, colunas["vendas"])
+    assert sum(m["total_itens"] for m in por_origem.values()) == total["total_itens"]
+    assert sum(m["problemas_total"] for m in por_origem.values()) == total["problemas_total"]
+
+
+def test_arquivo_unico_sem_quebra(dados):
+    df, df_aux = dados
+    df_final, colunas, _ = vm.processar_dataframe(df, df_aux)
+    planilha = openpyxl.load_workbook(io.BytesIO(vm.to_excel_com_resumo(df_final, colunas["vendas"])))
+    assert planilha["Resumo"].cell(15, 1).value is None
@@ -0,0 +1,62 @@
+import concurrent.futures
+import os
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import validador_mapeio as vm
+
+
+@pytest.fixture
+def preparado(dados):
+    df, _ = dados
+    return vm._preparar_dataframe(df, [])
+
+
+def test_paralelo_igual_ao_serial(dados, preparado, tmp_path, monkeypatch):
+    monkeypatch.setattr(vm, "CACHE_PESO_DIR", str(tmp_path))
+    esperado, _, _ = vm.processar_dataframe(dados[0])
+    df, colunas = preparado
+    resultado = vm.validar_em_paralelo(df, colunas, 3)
+    pd.testing.assert_frame_equal(resultado, esperado[vm.COLUNAS_DERIVADAS], check_dtype=False)
+
+
+def test_so_o_processo_principal_grava_o_cache(preparado, tmp_path, monkeypatch):
+    monkeypatch.setattr(vm, "CACHE_PESO_DIR", str(tmp_path))
+    gravacoes = tmp_path / "gravacoes.txt"
+    gravar = vm._gravar_entradas_peso
+
+    def gravar_registrando(*args, **kwargs):
+        with open(gravacoes, "a") as f:
+            f.write(f"{os.getpid()}\n")
+        return gravar(*args, **kwargs)
+
+    monkeypatch.setattr(vm, "_gravar_entradas_peso", gravar_registrando)
+    df, colunas = preparado
+    for _ in range(2):  # a segunda rodada já encontra tudo no cache
+        vm.validar_em_paralelo(df, colunas, 3)
+
+    assert set(gravacoes.read_text().split()) == {str(os.getpid())}
+    with sqlite3.connect(tmp_path / "extrair_peso.sqlite") as conn:
+        gravados = {texto for (texto,) in conn.execute("SELECT texto FROM peso")}
+    assert gravados == set(df[colunas["descricao"]].astype(str).str.upper().str.strip())
+
+
+def test_cancelar_descarta_particoes_pendentes(preparado, monkeypatch):
+    chamadas = []
+
+    class Executor(concurrent.futures.ProcessPoolExecutor):
+        def shutdown(self, wait=True, *, cancel_futures=False):
+            chamadas.append(cancel_futures)
+            super().shutdown(wait=wait, cancel_futures=cancel_futures)
+
+    def progresso(nome, feito, total):
+        if feito:
+            raise vm.ProcessamentoCancelado()
+
+    monkeypatch.setattr(concurrent.futures, "ProcessPoolExecutor", Executor)
+    df, colunas = preparado
+    with pytest.raises(vm.ProcessamentoCancelado):
+        vm.validar_em_paralelo(df, colunas, 3, progresso=progresso)
+    assert chamadas[0] is True
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import validador_mapeio as vm
+
+
+@pytest.mark.parametrize("backend", vm.BACKENDS)
+def test_processar_nao_altera_entrada(dados, backend):
+    if backend == "polars" and not vm.POLARS_DISPONIVEL:
+        pytest.skip("polars não instalado")
+    df, df_aux = dados
+    original = df.copy()
+    vm.processar_dataframe(df, df_aux, backend=backend)
+    pd.testing.assert_frame_equal(df, original)
+
+
+def test_baixa_memoria_reaproveita_entrada(dados):
+    df, df_aux = dados
+    df_final, colunas, _ = vm.processar_dataframe(df, df_aux, baixa_memoria=True)
+    # Nomes normalizados e colunas não usadas podadas no próprio DataFrame
+    assert set(df.columns) <= vm.colunas_necessarias_principal()
+    assert pd.api.types.is_float_dtype(df[colunas["preco"]])
+    assert len(df_final) == (df[colunas["vendas"]] > 0).sum()
+
+
+def _decodificar(df):
+    """Categorias de volta para os rótulos e float32 para float64, como no modo normal."""
+    df = df.copy()
+    for coluna in df.columns:
+        if isinstance(df[coluna].dtype, pd.CategoricalDtype):
+            df[coluna] = df[coluna].astype(object)
+        elif df[coluna].dtype == np.float32:
+            df[coluna] = df[coluna].astype(np.float64)
+    return df
+
+
+def test_baixa_memoria_igual_ao_modo_normal(dados):
+    df, df_aux = dados
+    df = df.assign(**{"Coluna Extra": 1})
+    indice = vm.construir_indice_ean(df_aux.copy())
+    esperado, colunas, _ = vm.processar_dataframe(df, indice_ean=indice)
+    compacto, colunas_compacto, _ = vm.processar_dataframe(df.copy(), indice_ean=indice, baixa_memoria=True)
+    assert colunas_compacto == colunas
+    assert "coluna extra" in esperado.columns and "coluna extra" not in compacto.columns
+    assert isinstance(compacto["StatusGeral"].dtype, pd.CategoricalDtype)
+    pd.testing.assert_frame_equal(_decodificar(compacto), esperado[compacto.columns])
+
+
+def test_reduzir_tipos_sem_perda_de_precisao():
+    df = pd.DataFrame({
+        "vendas": [16_777_217.0, 1.0, np.nan],         # 2**24 + 1 não cabe em float32
+        "centavos": [1e12 + 0.25, 3.5, 0.0],
+        "exatos": [0.5, 1024.0, np.nan],
+        "inteiros_grandes": [2 ** 40, 1, -3],
+        "pequenos": [1, 2, 127],
+    })
+    original = df.copy()
+    vm.reduzir_tipos_numericos(df)
+    assert df["vendas"].dtype == np.float64 and df["centavos"].dtype == np.float64
+    assert df["exatos"].dtype == np.float32 and df["pequenos"].dtype == np.int8
+    assert df["inteiros_grandes"].dtype == np.int64
+    pd.testing.assert_frame_equal(df.astype(original.dtypes), original)
@@ -0,0 +1,20 @@
+import pandas as pd
+import pytest
+
+import validador_mapeio as vm
+
+pytestmark = pytest.mark.skipif(not vm.POLARS_DISPONIVEL, reason="polars não instalado")
+
+
+def test_regras_peso_cobertas():
+    from validador_polars import CALCULOS_PESO
+    assert [nome for nome, _, _ in vm.REGRAS_PESO if nome not in CALCULOS_PESO] == []
+
+
+def test_polars_igual_ao_pandas(dados):
+    df, df_aux = dados
+    indice = vm.construir_indice_ean(df_aux.copy())
+    esperado, colunas_pandas, _ = vm.processar_dataframe(df, indice_ean=indice)
+    obtido, colunas_polars, _ = vm.processar_dataframe(df, indice_ean=indice, backend="polars")
+    assert colunas_polars == colunas_pandas
+    pd.testing.assert_frame_equal(obtido, esperado)
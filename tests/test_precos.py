@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import validador_mapeio as vm
+
+
+def _por_categoria_original(df, coluna_preco, coluna_categoria):
+    """`validar_precio_por_categoria` antes do motor agrupado (transform + apply por elemento)."""
+    def marcar_outliers(grupo):
+        n = len(grupo)
+        if n < 1000:
+            limite_inferior, limite_superior = grupo.quantile(0.05), grupo.quantile(0.95)
+        elif n < 2000:
+            limite_inferior, limite_superior = grupo.quantile(0.03), grupo.quantile(0.97)
+        else:
+            limite_inferior, limite_superior = grupo.quantile(0.02), grupo.quantile(0.98)
+        return grupo.apply(lambda x: "OK" if limite_inferior <= x <= limite_superior else "OUTLIER")
+    return df.groupby(coluna_categoria)[coluna_preco].transform(marcar_outliers)
+
+
+def _mediana_original(df, coluna_preco, coluna_categoria):
+    def marcar_por_mediana(grupo):
+        mediana = grupo.median()
+        return grupo.apply(lambda x: "OK" if mediana / 5 <= x <= mediana * 5 else "OUTLIER_MEDIANA")
+    return df.groupby(coluna_categoria)[coluna_preco].transform(marcar_por_mediana)
+
+
+@pytest.fixture
+def precos():
+    # Um grupo em cada faixa de tamanho (< 1000, < 2000, >= 2000), um grupo de
+    # uma linha, preços ausentes e linhas sem subcategoria
+    rng = np.random.default_rng(5)
+    categorias = np.repeat(["PEQUENA", "MEDIA", "GRANDE", "UNICA"], [300, 1500, 2500, 1]).astype(object)
+    preco = rng.lognormal(2, 0.8, size=len(categorias))
+    preco[rng.random(len(preco)) < 0.01] = np.nan
+    categorias[rng.random(len(categorias)) < 0.01] = None
+    ordem = rng.permutation(len(preco))
+    return pd.DataFrame({"preco": preco[ordem], "categoria": categorias[ordem]}, index=ordem * 10)
+
+
+def test_validar_precos_igual_ao_original(precos):
+    resultado = vm.validar_precos(precos, "preco", "categoria")
+    pd.testing.assert_series_equal(resultado["ValidacionPrecio"],
+                                   _por_categoria_original(precos, "preco", "categoria"), check_names=False)
+    pd.testing.assert_series_equal(resultado["ValidacionPrecioMediana"],
+                                   _mediana_original(precos, "preco", "categoria"), check_names=False)
+
+
+def test_faixas_pelo_tamanho_do_grupo(precos):
+    faixas = vm.calcular_faixas_preco(precos, "preco", "categoria")
+    for categoria, inf, sup in [("PEQUENA", 0.05, 0.95), ("MEDIA", 0.03, 0.97), ("GRANDE", 0.02, 0.98)]:
+        grupo = precos.loc[precos["categoria"] == categoria, "preco"]
+        assert faixas.loc[categoria, "n"] == len(grupo)
+        assert faixas.loc[categoria, "quantil_inf"] == pytest.approx(grupo.quantile(inf))
+        assert faixas.loc[categoria, "quantil_sup"] == pytest.approx(grupo.quantile(sup))
+        assert faixas.loc[categoria, "mediana_sup"] == pytest.approx(grupo.median() * vm.FATOR_MEDIANA)
+
+
+def test_categoria_como_category(precos):
+    esperado = vm.validar_precos(precos, "preco", "categoria")
+    compacto = precos.assign(categoria=precos["categoria"].astype("category"))
+    pd.testing.assert_frame_equal(vm.validar_precos(compacto, "preco", "categoria"), esperado)
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import validador_mapeio as vm
+
+
+def _metricas_originais(df, coluna_vendas):
+    """Máscaras do antigo `to_excel_com_resumo` (antes do motor único)."""
+    contenido = df["ValidacaoContenido"] == "PROBLEMA"
+    quartil = df["ValidacionPrecio"] == "OUTLIER"
+    mediana = df["ValidacionPrecioMediana"] == "OUTLIER_MEDIANA"
+    ambos = (quartil & ~contenido & mediana).sum()
+    somente_mediana = (~quartil & ~contenido & mediana).sum()
+    somente_quartil = (quartil & ~contenido & ~mediana).sum()
+    problemas = contenido.sum() + ambos + somente_mediana + somente_quartil
+    volume_total = df[coluna_vendas].sum()
+    volume_problemas = df.loc[contenido | quartil | mediana, coluna_vendas].sum()
+    return {
+        "total_itens": len(df),
+        "problemas_contenido": contenido.sum(),
+        "outliers_quartil": quartil.sum(),
+        "outliers_mediana": mediana.sum(),
+        "outliers_ambos": ambos,
+        "outliers_somente_mediana": somente_mediana,
+        "outliers_somente_quartil": somente_quartil,
+        "problemas_total": problemas,
+        "problemas_perc": problemas / len(df) * 100,
+        "volume_total": volume_total,
+        "volume_problemas": volume_problemas,
+        "volume_problemas_perc": volume_problemas / volume_total * 100,
+    }
+
+
+@pytest.fixture
+def resultado():
+    rng = np.random.default_rng(7)
+    n = 2000
+    vendas = rng.gamma(1.5, 500, size=n)
+    vendas[rng.random(n) < 0.02] = np.nan
+    return pd.DataFrame({
+        "ValidacaoContenido": rng.choice(["OK", "PROBLEMA"], size=n, p=[0.7, 0.3]),
+        "ValidacionPrecio": rng.choice(np.array(["OK", "OUTLIER", np.nan], dtype=object), size=n, p=[0.8, 0.15, 0.05]),
+        "ValidacionPrecioMediana": rng.choice(["OK", "OUTLIER_MEDIANA"], size=n, p=[0.85, 0.15]),
+        "vendas": vendas,
+        vm.COLUNA_ORIGEM: rng.choice(["jan.csv", "fev.csv", "mar.csv"], size=n),
+    })
+
+
+def test_metricas_iguais_as_mascaras_originais(resultado):
+    metricas = vm.calcular_metricas_resumo(resultado, "vendas")
+    for nome, valor in _metricas_originais(resultado, "vendas").items():
+        assert metricas[nome] == pytest.approx(valor), nome
+
+
+def test_status_como_category(resultado):
+    compacto = resultado.copy()
+    for coluna in vm.COLUNAS_VALIDACAO:
+        compacto[coluna] = pd.Categorical(compacto[coluna], categories=vm.CATEGORIAS_STATUS)
+    assert vm.calcular_metricas_resumo(compacto, "vendas") == vm.calcular_metricas_resumo(resultado, "vendas")
+
+
+def test_contagens_somadas_entre_blocos(resultado):
+    contagem = np.zeros(8, dtype=np.int64)
+    volume = np.zeros(8)
+    for inicio in range(0, len(resultado), 450):
+        bloco = resultado.iloc[inicio:inicio + 450]
+        codigos = vm.codigos_status(bloco)
+        contagem += np.bincount(codigos, minlength=8)
+        volume += np.bincount(codigos, weights=np.nan_to_num(bloco["vendas"].to_numpy()), minlength=8)
+    esperado = vm.calcular_metricas_resumo(resultado, "vendas")
+    assert vm.metricas_de_contagens(contagem, volume) == pytest.approx(esperado)
+
+
+def test_metricas_por_origem(resultado):
+    por_origem = vm.metricas_por_origem(resultado, "vendas")
+    assert list(por_origem) == list(pd.unique(resultado[vm.COLUNA_ORIGEM]))
+    for origem, metricas in por_origem.items():
+        assert metricas == pytest.approx(vm.calcular_metricas_resumo(
+            resultado[resultado[vm.COLUNA_ORIGEM] == origem], "vendas"))
+
+
+def test_gerar_resumo_sem_vendas(resultado):
+    resumo = vm.gerar_resumo(resultado.drop(columns="vendas"))
+    assert resumo["Qtd Total SKUs com problema (conteúdo ou preço)"].iloc[0] == \
+        _metricas_originais(resultado, "vendas")["problemas_total"]
+    assert np.isnan(resumo["Volume Total Vendas"].iloc[0])
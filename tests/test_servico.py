@@ -0,0 +1,145 @@
+import http.client
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+import servico_validacao
+from benchmark_mapeio import gerar_dados
+from servico_validacao import (criar_servico, criar_servidor, estado_job, liberar_reserva, reservar_vaga, saude,
+                               submeter_job)
+
+
+@pytest.fixture
+def servidor(tmp_path):
+    servico = criar_servico(str(tmp_path / "jobs"), workers=1, fila=0)
+    servidor = criar_servidor(servico, porta=0, silencioso=True)
+    thread = threading.Thread(target=servidor.serve_forever, daemon=True)
+    thread.start()
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+    servico["executor"].shutdown(wait=True, cancel_futures=True)
+
+
+def _pedir(servidor, metodo, caminho, corpo=None):
+    conexao = http.client.HTTPConnection("127.0.0.1", servidor.server_address[1], timeout=60)
+    try:
+        conexao.request(metodo, caminho, body=corpo)
+        resposta = conexao.getresponse()
+        return resposta.status, dict(resposta.getheaders()), resposta.read()
+    finally:
+        conexao.close()
+
+
+def _pedir_cru(servidor, cabecalhos):
+    """POST com cabeçalhos escritos à mão (http.client não manda Content-Length inválido)."""
+    with socket.create_connection(("127.0.0.1", servidor.server_address[1]), timeout=10) as s:
+        s.sendall(("POST /jobs?nome=cat.csv HTTP/1.1\r\nHost: x\r\n" + cabecalhos + "\r\n").encode())
+        return int(s.recv(4096).split(b" ")[1])
+
+
+@pytest.fixture
+def csv_categoria(tmp_path):
+    df, _ = gerar_dados(200, seed=2)
+    caminho = tmp_path / "cat.csv"
+    df.to_csv(caminho, sep=";", index=False)
+    return caminho.read_bytes()
+
+
+def test_envio_estado_resultado_e_remocao(servidor, csv_categoria):
+    status, cabecalhos, corpo = _pedir(servidor, "POST", "/jobs?nome=cat.csv", csv_categoria)
+    assert status == 202
+    id_job = json.loads(corpo)["id"]
+    assert cabecalhos["Location"] == f"/jobs/{id_job}"
+
+    limite = time.time() + 120
+    while True:
+        status, _, corpo = _pedir(servidor, "GET", f"/jobs/{id_job}")
+        estado = json.loads(corpo)
+        if estado["estado"] not in ("na_fila", "processando") or time.time() > limite:
+            break
+        time.sleep(0.2)
+    assert status == 200 and estado["estado"] == "concluido", estado
+    assert estado["resumo"]["linhas"] > 0
+
+    status, cabecalhos, corpo = _pedir(servidor, "GET", f"/jobs/{id_job}/resultado")
+    assert status == 200
+    assert cabecalhos["Content-Type"].endswith("spreadsheetml.sheet")
+    assert corpo[:2] == b"PK" and len(corpo) == int(cabecalhos["Content-Length"])
+
+    assert _pedir(servidor, "DELETE", f"/jobs/{id_job}")[0] == 200
+    assert _pedir(servidor, "GET", f"/jobs/{id_job}")[0] == 404
+    assert _pedir(servidor, "DELETE", f"/jobs/{id_job}")[0] == 404
+
+
+def test_fila_cheia_responde_429(servidor, csv_categoria):
+    servico = servidor.servico
+    assert reservar_vaga(servico) is not None  # ocupa a única vaga (workers=1, fila=0)
+    try:
+        status, cabecalhos, _ = _pedir(servidor, "POST", "/jobs?nome=cat.csv", csv_categoria)
+    finally:
+        liberar_reserva(servico)
+    assert status == 429
+    assert int(cabecalhos["Retry-After"]) >= 1
+
+
+@pytest.mark.parametrize("valor", ["abc", "-5"])
+def test_content_length_invalido(servidor, valor):
+    assert _pedir_cru(servidor, f"Content-Length: {valor}\r\n") == 400
+    assert servidor.servico["reservas"] == 0
+
+
+def test_pool_indisponivel_libera_reserva(servidor, csv_categoria):
+    servico = servidor.servico
+    servico["executor"].shutdown(wait=True)
+    status, _, _ = _pedir(servidor, "POST", "/jobs?nome=cat.csv", csv_categoria)
+    assert status == 503
+    assert servico["reservas"] == 0
+    assert servico["jobs"] == {}
+
+
+def _esperar(condicao, segundos=60):
+    limite = time.time() + segundos
+    while not condicao():
+        assert time.time() < limite, "tempo esgotado"
+        time.sleep(0.05)
+
+
+def test_job_na_fila_interna_do_pool_nao_aparece_processando(tmp_path, monkeypatch):
+    liberar = tmp_path / "liberar"
+
+    def processar_lento(caminho, pasta_saida, **opcoes):
+        while not liberar.exists():
+            time.sleep(0.02)
+        return {"arquivo": caminho, "status": "OK", "saida": None}
+
+    # Os workers são criados por fork depois do monkeypatch e herdam a versão lenta
+    monkeypatch.setattr(servico_validacao, "processar_arquivo", processar_lento)
+    servico = criar_servico(str(tmp_path / "jobs"), workers=1, fila=2)
+    try:
+        jobs = []
+        for i in range(3):
+            id_job = reservar_vaga(servico)
+            pasta = tmp_path / "jobs" / id_job
+            pasta.mkdir()
+            (pasta / f"cat{i}.csv").write_text("x")
+            jobs.append(submeter_job(servico, id_job, str(pasta / f"cat{i}.csv")))
+
+        _esperar(lambda: estado_job(jobs[0])["estado"] == "processando")
+        time.sleep(0.3)
+        # O segundo job já está na fila interna do pool (running() é True), mas nenhum worker o pegou
+        assert jobs[1]["futuro"].running()
+        assert [estado_job(j)["estado"] for j in jobs] == ["processando", "na_fila", "na_fila"]
+        assert "iniciado_em" in estado_job(jobs[0]) and "iniciado_em" not in estado_job(jobs[1])
+        assert (saude(servico)["processando"], saude(servico)["na_fila"]) == (1, 2)
+
+        liberar.touch()
+        _esperar(lambda: all(j["futuro"].done() for j in jobs))
+        assert [estado_job(j)["estado"] for j in jobs] == ["concluido"] * 3
+        assert (saude(servico)["processando"], saude(servico)["na_fila"]) == (0, 0)
+    finally:
+        liberar.touch()
+        servico["executor"].shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,64 @@
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import validador_mapeio as vm
+
+ALFA = vm.ERRO_RELATIVO_SKETCH
+COLUNAS_FAIXA = ["mediana", "quantil_inf", "quantil_sup", "mediana_inf", "mediana_sup"]
+
+
+@pytest.fixture
+def precos():
+    rng = np.random.default_rng(8)
+    categorias = pd.Series(np.repeat(["A", "B", "C", "D"], [50, 900, 1500, 2600]))
+    preco = pd.Series(rng.lognormal(2, 1, size=len(categorias)).round(2))
+    return preco, categorias
+
+
+def test_faixas_do_sketch_dentro_do_erro(precos):
+    preco, categorias = precos
+    exatas = vm.calcular_faixas_preco(pd.DataFrame({"p": preco, "c": categorias}), "p", "c")
+    estimadas = vm.faixas_do_sketch(vm.atualizar_sketch(vm.novo_sketch_precos(), preco, categorias))
+    estimadas = estimadas.loc[exatas.index]
+    assert (estimadas["n"] == exatas["n"]).all()
+    for coluna in COLUNAS_FAIXA:
+        erro = (estimadas[coluna] - exatas[coluna]).abs() / exatas[coluna].abs()
+        assert (erro <= ALFA * (1 + 1e-9)).all(), coluna
+
+
+def test_sketches_combinados_iguais_ao_inteiro(precos):
+    preco, categorias = precos
+    inteiro = vm.atualizar_sketch(vm.novo_sketch_precos(), preco, categorias)
+    partes = [vm.atualizar_sketch(vm.novo_sketch_precos(), preco.iloc[i:i + 1000], categorias.iloc[i:i + 1000])
+              for i in range(0, len(preco), 1000)]
+    pd.testing.assert_frame_equal(vm.faixas_do_sketch(vm.combinar_sketches(*partes)).sort_index(),
+                                  vm.faixas_do_sketch(inteiro).sort_index())
+    with pytest.raises(ValueError):
+        vm.combinar_sketches(inteiro, vm.novo_sketch_precos(ALFA * 2))
+
+
+def test_blocos_iguais_ao_completo_exceto_perto_do_limite(dados, tmp_path):
+    df, _ = dados
+    caminho = tmp_path / "cat.csv"
+    df.to_csv(caminho, sep=";", index=False)
+    destino = tmp_path / "saida.zip"
+    metricas, colunas, _ = vm.validar_csv_em_blocos(str(caminho), str(destino), tamanho_bloco=700)
+
+    completo, _, _ = vm.processar_dataframe(df)
+    with zipfile.ZipFile(destino) as zf, zf.open("detalhes.csv") as f:
+        blocos = pd.read_csv(f, sep=";", decimal=",", encoding="utf-8-sig")
+    assert len(blocos) == len(completo) == metricas["total_itens"]
+    assert (blocos["ValidacaoContenido"].to_numpy() == completo["ValidacaoContenido"].to_numpy()).all()
+
+    faixas = vm.calcular_faixas_preco(completo, colunas["preco"], colunas["categoria"])
+    for coluna, limites in [("ValidacionPrecio", ("quantil_inf", "quantil_sup")),
+                            ("ValidacionPrecioMediana", ("mediana_inf", "mediana_sup"))]:
+        diferentes = completo[blocos[coluna].to_numpy() != completo[coluna].to_numpy()]
+        assert len(diferentes) <= len(completo) * 0.01
+        for _, linha in diferentes.iterrows():
+            preco = linha[colunas["preco"]]
+            distancia = min(abs(preco - faixas.loc[linha[colunas["categoria"]], limite]) for limite in limites)
+            assert distancia <= ALFA * abs(preco) * 1.01
@@ -0,0 +1,2742 @@
+"""Regras de validação de mapeio e preços, sem dependência do Streamlit.
+
+Usado pelo app (`check_mapeio_preco_streamlit.py`) e pelo processamento em lote
+(`validar_lote.py`). Para usar em outros jobs:
+
+    from validador_mapeio import validar, validar_arquivo
+
+    resultado = validar(df)                  # DataFrame bruto já lido
+    resultado = validar_arquivo("cat.xlsx")  # ou direto do arquivo
+    resultado["df"], resultado["resumo"]     # linhas anotadas e aba Resumo
+
+Só pandas e NumPy são importados junto com o módulo; o resto (xlsxwriter,
+sqlite3, multiprocessing) é importado na primeira função que precisa dele.
+"""
+import re
+import os
+import csv
+import codecs
+import glob
+import importlib.util
+import io
+import json
+import logging
+import pickle
+import time
+import tracemalloc
+import zipfile
+import hashlib
+from contextlib import contextmanager
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+# ----------------------------
+# Funções auxiliares
+# ----------------------------
+def extrair_peso(texto):
+    if pd.isna(texto):
+        return None, None
+
+    texto = str(texto).upper().strip()
+
+    # -------------------------------------------------
+    # 1️⃣ Tenta capturar formatos de PESO / VOLUME (Kg, L, etc)
+    # -------------------------------------------------
+    unidades_intermed = r"(?:UN|UNID|CJ|CX|DS|PCT|FD|SC)?"
+    unidade_final = r"(KILOS|KILO|KG|G|GR|GRS|GRAMAS|GRAMA|ML|L|LT|LTS|LITROS|LITRO)"
+    
+    # Casos compostos tipo 3x200G ou 2x500ML
+    match_multi = re.search(rf"((?:\d+\s*{unidades_intermed}\s*[xX]\s*)+\d+[.,]?\d*\s*{unidade_final})", texto, re.IGNORECASE)
+    if match_multi:
+        bloco = match_multi.group(1)
+        unidade = match_multi.group(len(match_multi.groups())).lower()
+        numeros = [float(n.replace(",", ".")) for n in re.findall(r"\d+[.,]?\d*", bloco)]
+        multiplicadores = numeros[:-1] if len(numeros) > 1 else []
+        peso = numeros[-1]
+        if unidade in ["kg","kilos", "kilo", "lt", "l", "lts", "litros", "litro"]:
+            peso *= 1000
+        total = peso
+        for n in multiplicadores:
+            total *= n
+        return bloco, int(total)
+
+    # Casos como 3x4x200ML
+    match_3d = re.search(rf"(\d+)\s*[xX]\s*(\d+)\s*[xX]\s*(\d+[.,]?\d*)\s*{unidade_final}\b", texto, re.IGNORECASE)
+    if match_3d:
+        n1 = int(match_3d.group(1))
+        n2 = int(match_3d.group(2))
+        valor = float(match_3d.group(3).replace(",", "."))
+        unidade = match_3d.group(4).lower()
+        if unidade in ["kg","kilos", "kilo", "lt", "l", "lts", "litros", "litro"]:
+            valor *= 1000
+        return match_3d.group(0), int(n1 * n2 * valor)
+
+    # Casos como 3x200ML
+    match_2d = re.search(rf"(\d+)\s*[xX]\s*(\d+[.,]?\d*)\s*{unidade_final}\b", texto, re.IGNORECASE)
+    if match_2d:
+        n1 = int(match_2d.group(1))
+        valor = float(match_2d.group(2).replace(",", "."))
+        unidade = match_2d.group(3).lower()
+        if unidade in ["kg","kilos", "kilo", "lt", "l", "lts", "litros", "litro"]:
+            valor *= 1000
+        return match_2d.group(0), int(n1 * valor)
+
+    # Casos simples como "200ML", "1L", "500G"
+    match = re.search(rf"(\d+[.,]?\d*)\s*{unidade_final}\b", texto, re.IGNORECASE)
+    if match:
+        valor = float(match.group(1).replace(",", "."))
+        unidade = match.group(2).lower()
+        if unidade in ["kg","kilos", "kilo", "lt", "l", "lts", "litros", "litro"]:
+            valor *= 1000
+        return match.group(0), int(valor)
+
+    # -------------------------------------------------
+    # 2️⃣ Caso não tenha achado peso/volume → tenta UNIDADES (robusto, cobre C/XX, C/XXxYY e XXxYY)
+    # -------------------------------------------------
+
+    # 1) Padrões com número antes do sufixo: "3x12UN", "24 UN", "12UN", "2x24 UN"
+    match_un = re.search(
+        r"(?:(\d+)\s*[xX]\s*)?(\d+)\s*(?:UN|UNID|UND|UNIDADE|UNIDADES|CJ|CX|PCT|FD|SC)\b",
+        texto,
+        re.IGNORECASE
+    )
+    if match_un:
+        mult = int(match_un.group(1)) if match_un.group(1) else 1
+        qtd = int(match_un.group(2))
+        return match_un.group(0), mult * qtd
+
+    # 2) Padrões tipo "C/3X24", "C 2X6", "C.4X12"
+    match_c_pack = re.search(r"C[\s./]?(\d+)\s*[xX]\s*(\d+)\b", texto, re.IGNORECASE)
+    if match_c_pack:
+        mult = int(match_c_pack.group(1))
+        qtd = int(match_c_pack.group(2))
+        return match_c_pack.group(0), mult * qtd
+
+    # 3) Padrões simples "C/32", "C 32", "C.32", "C32"
+    match_c = re.search(r"C[\s./]?(\d{1,4})\b", texto, re.IGNORECASE)
+    if match_c:
+        return match_c.group(0), int(match_c.group(1))
+
+    # -------------------------------------------------
+    # 3️⃣ Papel Higiênico (Rolos e Leve/Pague)
+    # -------------------------------------------------
+    match_rolos = re.search(r"(\d+)[xX](\d+)R\b", texto)
+    if match_rolos:
+        qtd_total = int(match_rolos.group(1)) * int(match_rolos.group(2))
+        return match_rolos.group(0), qtd_total
+
+    match_leve_pague = re.search(r"L(\d+)\s*P\d+", texto, re.IGNORECASE)
+    if match_leve_pague:
+        qtd = int(match_leve_pague.group(1))
+        return match_leve_pague.group(0), qtd
+
+    # ------------------------------------------------------
+    # 3️⃣ Fallback - identificar casos sem unidade de medida
+    # ------------------------------------------------------
+
+    # 4) Padrões "3X12", "2X6", "4X24" sem UN no final
+    match_pack = re.search(r"(\d+)\s*[xX]\s*(\d+)\b", texto, re.IGNORECASE)
+    if match_pack:
+        mult = int(match_pack.group(1))
+        qtd = int(match_pack.group(2))
+        return match_pack.group(0), mult * qtd
+
+    # 5) Fallback: último número do texto (pode capturar casos residuais)
+    nums = re.findall(r"\d+", texto)
+    if nums:
+        last = int(nums[-1])
+        if 0 < last <= 10000:
+            return str(last), last
+        
+    # -------------------------------------------------
+    # 3️⃣ Caso nada encontrado
+    # -------------------------------------------------
+    return None, None
+
+
+# ----------------------------
+# Extração de peso em lote (cascata de regras vetorizada)
+# ----------------------------
+# Mesmas regras de `extrair_peso`, na mesma ordem, mas compiladas uma única vez.
+# Cada regra roda com `str.extract` apenas sobre as linhas que ainda não casaram
+# com nenhuma regra anterior, então o resultado é idêntico ao da função por linha.
+_UNIDADES_INTERMED = r"(?:UN|UNID|CJ|CX|DS|PCT|FD|SC)?"
+_UNIDADE_FINAL = r"(?:KILOS|KILO|KG|G|GR|GRS|GRAMAS|GRAMA|ML|L|LT|LTS|LITROS|LITRO)"
+_UNIDADES_MIL = ["kg", "kilos", "kilo", "lt", "l", "lts", "litros", "litro"]
+
+
+def _numero(serie):
+    return serie.str.replace(",", ".", regex=False).astype(float)
+
+
+def _fator_unidade(unidade):
+    return np.where(unidade.str.lower().isin(_UNIDADES_MIL), 1000.0, 1.0)
+
+
+def _calc_multi(grupos):
+    # Replica a ordem das multiplicações do loop original (peso * fator * n1 * n2 ...)
+    numeros = _numero(grupos["bloco"].str.extractall(r"(\d+[.,]?\d*)")[0]).unstack()
+    numeros = numeros.reindex(grupos.index)
+    valores = numeros.to_numpy(dtype=float)
+    qtd = numeros.notna().sum(axis=1).to_numpy()
+    total = valores[np.arange(len(valores)), qtd - 1] * _fator_unidade(grupos["unidade"])
+    for j in range(valores.shape[1] - 1):
+        total = np.where(j < qtd - 1, total * valores[:, j], total)
+    return grupos["bloco"], np.trunc(total)
+
+
+def _calc_3d(grupos):
+    valor = _numero(grupos["valor"]) * _fator_unidade(grupos["unidade"])
+    return grupos["bloco"], np.trunc(_numero(grupos["n1"]) * _numero(grupos["n2"]) * valor)
+
+
+def _calc_2d(grupos):
+    valor = _numero(grupos["valor"]) * _fator_unidade(grupos["unidade"])
+    return grupos["bloco"], np.trunc(_numero(grupos["n1"]) * valor)
+
+
+def _calc_simples(grupos):
+    valor = _numero(grupos["valor"]) * _fator_unidade(grupos["unidade"])
+    return grupos["bloco"], np.trunc(valor)
+
+
+def _calc_produto(grupos):
+    mult = _numero(grupos["mult"].fillna("1"))
+    return grupos["bloco"], mult * _numero(grupos["qtd"])
+
+
+def _calc_qtd(grupos):
+    return grupos["bloco"], _numero(grupos["qtd"])
+
+
+def _calc_ultimo_numero(grupos):
+    ultimo = _numero(grupos["qtd"])
+    valido = (ultimo > 0) & (ultimo <= 10000)
+    bloco = ultimo[valido].astype(np.int64).astype(str).reindex(grupos.index)
+    return bloco, ultimo.where(valido)
+
+
+REGRAS_PESO = [
+    ("multi", re.compile(
+        rf"(?P<bloco>(?:\d+\s*{_UNIDADES_INTERMED}\s*[xX]\s*)+\d+[.,]?\d*\s*(?P<unidade>{_UNIDADE_FINAL}))",
+        re.IGNORECASE), _calc_multi),
+    ("3d", re.compile(
+        rf"(?P<bloco>(?P<n1>\d+)\s*[xX]\s*(?P<n2>\d+)\s*[xX]\s*(?P<valor>\d+[.,]?\d*)\s*(?P<unidade>{_UNIDADE_FINAL})\b)",
+        re.IGNORECASE), _calc_3d),
+    ("2d", re.compile(
+        rf"(?P<bloco>(?P<n1>\d+)\s*[xX]\s*(?P<valor>\d+[.,]?\d*)\s*(?P<unidade>{_UNIDADE_FINAL})\b)",
+        re.IGNORECASE), _calc_2d),
+    ("simples", re.compile(
+        rf"(?P<bloco>(?P<valor>\d+[.,]?\d*)\s*(?P<unidade>{_UNIDADE_FINAL})\b)",
+        re.IGNORECASE), _calc_simples),
+    ("un", re.compile(
+        r"(?P<bloco>(?:(?P<mult>\d+)\s*[xX]\s*)?(?P<qtd>\d+)\s*(?:UN|UNID|UND|UNIDADE|UNIDADES|CJ|CX|PCT|FD|SC)\b)",
+        re.IGNORECASE), _calc_produto),
+    ("c_pack", re.compile(r"(?P<bloco>C[\s./]?(?P<mult>\d+)\s*[xX]\s*(?P<qtd>\d+)\b)", re.IGNORECASE), _calc_produto),
+    ("c", re.compile(r"(?P<bloco>C[\s./]?(?P<qtd>\d{1,4})\b)", re.IGNORECASE), _calc_qtd),
+    ("rolos", re.compile(r"(?P<bloco>(?P<mult>\d+)[xX](?P<qtd>\d+)R\b)"), _calc_produto),
+    ("leve_pague", re.compile(r"(?P<bloco>L(?P<qtd>\d+)\s*P\d+)", re.IGNORECASE), _calc_qtd),
+    ("pack", re.compile(r"(?P<bloco>(?P<mult>\d+)\s*[xX]\s*(?P<qtd>\d+)\b)", re.IGNORECASE), _calc_produto),
+    ("ultimo_numero", re.compile(r"(?P<bloco>(?P<qtd>\d+)\D*$)"), _calc_ultimo_numero),
+]
+
+
+def extrair_peso_lote(serie, incluir_regra=False):
+    """Versão vetorizada de `extrair_peso` para uma coluna inteira.
+
+    Retorna um DataFrame com `QtdEmbalagem` e `QtdEmbalagemGramas`, no mesmo
+    índice da série de entrada. Com `incluir_regra`, inclui também `RegraPeso`
+    (nome da regra de REGRAS_PESO que resolveu a linha, ou None).
+    """
+    indice = serie.index
+    serie = serie.reset_index(drop=True)
+    blocos = pd.Series(None, index=serie.index, dtype=object)
+    gramas = pd.Series(np.nan, index=serie.index, dtype=float)
+    regras = pd.Series(None, index=serie.index, dtype=object)
+
+    validos = serie.notna()
+    pendentes = serie[validos].astype(str).str.upper().str.strip()
+
+    for nome, regex, calcular in REGRAS_PESO:
+        if pendentes.empty:
+            break
+        grupos = pendentes.str.extract(regex)
+        grupos = grupos[grupos["bloco"].notna()]
+        if grupos.empty:
+            continue
+        bloco, valor = calcular(grupos)
+        bloco = pd.Series(bloco, index=grupos.index)
+        valor = pd.Series(valor, index=grupos.index)
+        resolvidos = bloco.index[bloco.notna()]
+        blocos.loc[resolvidos] = bloco.loc[resolvidos]
+        gramas.loc[resolvidos] = valor.loc[resolvidos]
+        regras.loc[resolvidos] = nome
+        pendentes = pendentes.drop(resolvidos)
+
+    resultado = pd.DataFrame({"QtdEmbalagem": blocos.where(blocos.notna(), None), "QtdEmbalagemGramas": gramas})
+    if incluir_regra:
+        resultado["RegraPeso"] = regras.where(regras.notna(), None)
+    resultado.index = indice
+    return resultado
+
+
+# ----------------------------
+# Cache persistente de descrições já processadas
+# ----------------------------
+# As mesmas descrições aparecem em todo arquivo mensal da categoria. O cache guarda
+# texto normalizado (upper/strip) -> (bloco, gramas, regra) num SQLite local, para que
+# uploads repetidos só processem descrições novas.
+# Aumente VERSAO_REGRAS_PESO ao mudar o cálculo de alguma regra (os padrões já
+# entram na assinatura automaticamente); isso invalida o cache inteiro.
+VERSAO_REGRAS_PESO = 1
+CACHE_PESO_DIR = os.environ.get(
+    "MAPEIO_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "check_mapeio_preco")
+)
+CACHE_PESO_MAX_ENTRADAS = 1_000_000
+
+
+def _assinatura_regras_peso():
+    conteudo = str(VERSAO_REGRAS_PESO) + "".join(
+        nome + regex.pattern + str(regex.flags) for nome, regex, _ in REGRAS_PESO
+    )
+    return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+
+def _abrir_cache_peso(caminho, somente_leitura=False):
+    """Conexão com o cache, criando/atualizando o esquema; None se o cache não serve.
+
+    `somente_leitura`: abre sem nunca gravar (processos paralelos consultam o
+    mesmo arquivo sem disputar a trava de escrita); se o arquivo ainda não tem o
+    esquema ou foi gravado com outras regras, retorna None. Se algo falhar depois
+    de conectar, a conexão é fechada antes de a exceção subir.
+    """
+    import pathlib
+    import sqlite3
+
+    if somente_leitura:
+        conn = sqlite3.connect(pathlib.Path(caminho).absolute().as_uri() + "?mode=ro", uri=True)
+    else:
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        conn = sqlite3.connect(caminho)
+    try:
+        utilizavel = _preparar_cache_peso(conn, somente_leitura)
+    except Exception:
+        conn.close()
+        raise
+    if not utilizavel:
+        conn.close()
+        return None
+    return conn
+
+
+def _preparar_cache_peso(conn, somente_leitura):
+    """Cria/atualiza o esquema e confere a assinatura das regras; False se o cache não serve."""
+    assinatura = _assinatura_regras_peso()
+    if somente_leitura:
+        linha = conn.execute("SELECT valor FROM meta WHERE chave = 'assinatura'").fetchone()
+        colunas_peso = {linha[1] for linha in conn.execute("PRAGMA table_info(peso)")}
+        return linha is not None and linha[0] == assinatura and "regra" in colunas_peso
+
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor TEXT)")
+    # Caches antigos não guardavam a regra que resolveu cada texto
+    colunas_peso = {linha[1] for linha in conn.execute("PRAGMA table_info(peso)")}
+    if colunas_peso and "regra" not in colunas_peso:
+        conn.execute("DROP TABLE peso")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS peso ("
+        "texto TEXT PRIMARY KEY, bloco TEXT, gramas REAL, usado_em INTEGER, regra TEXT)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_peso_usado_em ON peso (usado_em)")
+
+    # Regras mudaram desde a última gravação -> descarta tudo
+    linha = conn.execute("SELECT valor FROM meta WHERE chave = 'assinatura'").fetchone()
+    if linha is None or linha[0] != assinatura:
+        conn.execute("DELETE FROM peso")
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('assinatura', ?)", (assinatura,))
+        conn.commit()
+    return True
+
+
+def extrair_peso_com_cache(serie, caminho_cache=None, max_entradas=CACHE_PESO_MAX_ENTRADAS,
+                           incluir_regra=False, entradas_cache=None):
+    """Igual a `extrair_peso_lote`, mas deduplica as descrições e consulta o cache em disco.
+
+    Se o cache não puder ser aberto (disco somente leitura, arquivo corrompido...),
+    processa tudo sem cache. Com uma lista em `entradas_cache`, o cache só é
+    lido: o resultado de cada descrição (do cache ou recém-calculado) é
+    acrescentado à lista para quem chamou gravar depois com `gravar_cache_peso`.
+    """
+    import sqlite3
+
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return _extrair_peso_categorias(serie, caminho_cache, max_entradas, incluir_regra, entradas_cache)
+
+    caminho_cache = caminho_cache or os.path.join(CACHE_PESO_DIR, "extrair_peso.sqlite")
+    somente_leitura = entradas_cache is not None
+    validos = serie.notna()
+    textos = serie[validos].astype(str).str.upper().str.strip()
+    unicos = pd.Series(textos.unique(), dtype=object)
+
+    try:
+        conn = _abrir_cache_peso(caminho_cache, somente_leitura)
+    except sqlite3.Error:
+        conn = None
+
+    if conn is None:
+        resultado_unicos = extrair_peso_lote(unicos, incluir_regra=True)
+    else:
+        try:
+            agora = int(time.time())
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS consulta (texto TEXT PRIMARY KEY)")
+            conn.execute("DELETE FROM consulta")
+            conn.executemany("INSERT INTO consulta VALUES (?)", ((t,) for t in unicos))
+            em_cache = pd.read_sql_query(
+                "SELECT p.texto, p.bloco, p.gramas, p.regra FROM peso p JOIN consulta c ON c.texto = p.texto",
+                conn,
+            ).set_index("texto")
+
+            novos = unicos[~unicos.isin(em_cache.index)]
+            novos_resultado = extrair_peso_lote(novos, incluir_regra=True)
+            novos_resultado.index = novos.to_numpy()
+            if not somente_leitura:
+                conn.execute(
+                    "UPDATE peso SET usado_em = ? WHERE texto IN (SELECT texto FROM consulta)", (agora,)
+                )
+                _gravar_entradas_peso(conn, novos_resultado, agora, max_entradas)
+
+            em_cache.columns = ["QtdEmbalagem", "QtdEmbalagemGramas", "RegraPeso"]
+            partes = [parte for parte in (em_cache, novos_resultado) if not parte.empty]
+            resultado_unicos = pd.concat(partes) if partes else novos_resultado
+            resultado_unicos["QtdEmbalagem"] = resultado_unicos["QtdEmbalagem"].astype(object)
+            resultado_unicos["QtdEmbalagemGramas"] = resultado_unicos["QtdEmbalagemGramas"].astype(float)
+            resultado_unicos["RegraPeso"] = resultado_unicos["RegraPeso"].astype(object)
+            resultado_unicos = resultado_unicos.reindex(unicos.to_numpy())
+        except sqlite3.Error:
+            resultado_unicos = extrair_peso_lote(unicos, incluir_regra=True)
+        finally:
+            conn.close()
+
+    resultado_unicos.index = unicos.to_numpy()
+    if somente_leitura:
+        entradas_cache.append(resultado_unicos)
+    resultado = pd.DataFrame(
+        {
+            "QtdEmbalagem": pd.Series(None, index=serie.index, dtype=object),
+            "QtdEmbalagemGramas": pd.Series(np.nan, index=serie.index, dtype=float),
+        }
+    )
+    resultado.loc[validos, "QtdEmbalagem"] = textos.map(resultado_unicos["QtdEmbalagem"]).to_numpy()
+    resultado.loc[validos, "QtdEmbalagemGramas"] = textos.map(resultado_unicos["QtdEmbalagemGramas"]).to_numpy()
+    resultado["QtdEmbalagem"] = resultado["QtdEmbalagem"].where(resultado["QtdEmbalagem"].notna(), None)
+    if incluir_regra:
+        regras = pd.Series(None, index=serie.index, dtype=object)
+        regras.loc[validos] = textos.map(resultado_unicos["RegraPeso"]).to_numpy()
+        resultado["RegraPeso"] = regras.where(regras.notna(), None)
+    return resultado
+
+
+def _gravar_entradas_peso(conn, resultado, agora, max_entradas):
+    """Grava `resultado` (índice = texto normalizado) e remove as entradas usadas há mais tempo."""
+    conn.executemany(
+        "INSERT OR REPLACE INTO peso VALUES (?, ?, ?, ?, ?)",
+        (
+            (texto, bloco, None if pd.isna(gramas) else float(gramas), agora, regra)
+            for texto, bloco, gramas, regra in zip(
+                resultado.index,
+                resultado["QtdEmbalagem"],
+                resultado["QtdEmbalagemGramas"],
+                resultado["RegraPeso"],
+            )
+        ),
+    )
+
+    # Limite de tamanho: remove as entradas usadas há mais tempo
+    excesso = conn.execute("SELECT COUNT(*) FROM peso").fetchone()[0] - max_entradas
+    if excesso > 0:
+        conn.execute(
+            "DELETE FROM peso WHERE texto IN "
+            "(SELECT texto FROM peso ORDER BY usado_em LIMIT ?)",
+            (excesso,),
+        )
+    conn.commit()
+
+
+def gravar_cache_peso(entradas, caminho_cache=None, max_entradas=CACHE_PESO_MAX_ENTRADAS):
+    """Grava de uma vez as `entradas_cache` juntadas por `extrair_peso_com_cache`.
+
+    Falhas do cache são ignoradas, como na consulta.
+    """
+    import sqlite3
+
+    entradas = [parte for parte in entradas if not parte.empty]
+    if not entradas:
+        return
+    resultado = pd.concat(entradas)
+    resultado = resultado[~resultado.index.duplicated()]
+    try:
+        conn = _abrir_cache_peso(caminho_cache or os.path.join(CACHE_PESO_DIR, "extrair_peso.sqlite"))
+    except sqlite3.Error:
+        return
+    try:
+        _gravar_entradas_peso(conn, resultado, int(time.time()), max_entradas)
+    except sqlite3.Error:
+        pass
+    finally:
+        conn.close()
+
+
+def _extrair_peso_categorias(serie, caminho_cache, max_entradas, incluir_regra, entradas_cache=None):
+    """`extrair_peso_com_cache` de uma coluna `category`: cada categoria usada é
+    processada uma vez e as linhas recebem o resultado pelo código, sem criar o
+    texto de cada linha."""
+    serie = serie.cat.remove_unused_categories()
+    categorias = pd.Series(serie.cat.categories, dtype=object)
+    if categorias.empty:
+        return extrair_peso_com_cache(serie.astype(object), caminho_cache, max_entradas, incluir_regra,
+                                      entradas_cache)
+    por_categoria = extrair_peso_com_cache(categorias, caminho_cache, max_entradas, incluir_regra, entradas_cache)
+    codigos = serie.cat.codes.to_numpy()
+    ausentes = codigos < 0
+    resultado = por_categoria.iloc[np.where(ausentes, 0, codigos)].set_axis(serie.index)
+    if ausentes.any():
+        resultado.loc[ausentes, "QtdEmbalagemGramas"] = np.nan
+        for coluna in ["QtdEmbalagem", "RegraPeso"] if incluir_regra else ["QtdEmbalagem"]:
+            resultado.loc[ausentes, coluna] = None
+    return resultado
+
+
+# ----------------------------
+# Conversão numérica (formato BR/LatAm)
+# ----------------------------
+_RE_VIRGULA_DECIMAL = re.compile(r"^(?=.*\.).*,[^.,]*$|^[^,]*,[^.,]*$")
+_RE_PONTO_DECIMAL = re.compile(r"^(?=.*,).*\.[^.,]*$|^[^.]*\.[^.,]*$")
+_RE_PONTO_MILHAR_DECIMAL = re.compile(r"^(?=.*,).*\.[^.,]*$")
+_SEM_PONTO_VIRGULA_PONTO = str.maketrans({".": None, ",": "."})
+_SEM_VIRGULA = str.maketrans({",": None})
+_SEM_SEPARADOR = str.maketrans({",": None, ".": None})
+
+
+def converter_numero(serie, ponto_milhar=False, remover_texto=True):
+    """Converte textos como "R$ 1.234,56", "1,234.56" ou "12,5" para float64.
+
+    O separador decimal é o último entre vírgula e ponto quando os dois aparecem.
+    Com um só tipo de separador, repetido ele é de milhar; único, é decimal
+    (exceto o ponto quando `ponto_milhar=True`, caso das colunas de vendas).
+    Valores que já são numéricos são mantidos. Com `remover_texto=False` só
+    espaços são removidos, e qualquer outro texto vira NaN.
+    """
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.astype(float)
+
+    e_texto = serie.map(type).eq(str)
+    resultado = pd.to_numeric(serie.where(~e_texto), errors="coerce").astype(float)
+    if not e_texto.any():
+        return resultado
+
+    # Cada texto distinto é convertido uma vez só
+    codigos, unicos = pd.factorize(serie[e_texto])
+    textos = pd.Series(unicos, dtype=object)
+    if remover_texto:
+        textos = textos.str.replace(r"[^\d,.-]", "", regex=True)
+    else:
+        textos = textos.str.replace(r"\s", "", regex=True)
+
+    # Vírgula decimal: é o último separador e há ponto antes ou é a única vírgula
+    virgula_decimal = textos.str.contains(_RE_VIRGULA_DECIMAL)
+    ponto_decimal = textos.str.contains(_RE_PONTO_MILHAR_DECIMAL if ponto_milhar else _RE_PONTO_DECIMAL)
+    sem_decimal = ~virgula_decimal & ~ponto_decimal
+
+    textos[virgula_decimal] = textos[virgula_decimal].str.translate(_SEM_PONTO_VIRGULA_PONTO)
+    textos[ponto_decimal] = textos[ponto_decimal].str.translate(_SEM_VIRGULA)
+    textos[sem_decimal] = textos[sem_decimal].str.translate(_SEM_SEPARADOR)
+
+    convertidos = pd.to_numeric(textos, errors="coerce").to_numpy(dtype=float)
+    resultado[e_texto] = convertidos[codigos]
+    return resultado
+
+
+def normalizar_colunas_numericas(df, colunas):
+    """Converte in-place as colunas numéricas de `df` uma única vez.
+
+    `colunas` mapeia nome da coluna -> kwargs de `converter_numero`. Retorna um
+    dict coluna -> quantidade de valores preenchidos que não puderam ser convertidos.
+    """
+    falhas = {}
+    for coluna, opcoes in colunas.items():
+        original = df[coluna]
+        convertido = converter_numero(original, **opcoes)
+        preenchido = original.notna() & original.astype(str).str.strip().ne("")
+        falhas[coluna] = int((preenchido & convertido.isna()).sum())
+        df[coluna] = convertido
+    return falhas
+
+
+# ----------------------------
+# Validador de preço por categoria (quantis 5-95%) e por mediana (5x)
+# ----------------------------
+# Quantis usados conforme o tamanho da subcategoria: (limite de linhas, inferior, superior)
+FAIXAS_QUANTIL = [
+    (1000, 0.05, 0.95),
+    (2000, 0.03, 0.97),
+    (None, 0.02, 0.98),
+]
+FATOR_MEDIANA = 5
+QUANTIS_FAIXAS = sorted({q for _, inf, sup in FAIXAS_QUANTIL for q in (inf, sup)})
+
+
+def calcular_faixas_preco(df, coluna_preco, coluna_categoria):
+    """Calcula, numa única agregação, as faixas de preço de cada subcategoria.
+
+    Retorna um DataFrame indexado pela subcategoria com `n`, `mediana`,
+    `quantil_inf`/`quantil_sup` (escolhidos pelo tamanho do grupo) e
+    `mediana_inf`/`mediana_sup`.
+    """
+    grupos = df.groupby(coluna_categoria, sort=False, observed=True)[coluna_preco]
+    faixas = grupos.agg(n="size", mediana="median")
+    tabela_quantis = grupos.quantile(QUANTIS_FAIXAS).unstack()
+    return _montar_faixas(faixas, tabela_quantis)
+
+
+def _montar_faixas(faixas, tabela_quantis):
+    """Completa `faixas` (com `n` e `mediana`) com os quantis escolhidos pelo tamanho do grupo."""
+    n = faixas["n"].to_numpy()
+    condicoes = [n < limite for limite, _, _ in FAIXAS_QUANTIL[:-1]]
+    faixas["quantil_inf"] = np.select(
+        condicoes,
+        [tabela_quantis[inf].to_numpy() for _, inf, _ in FAIXAS_QUANTIL[:-1]],
+        default=tabela_quantis[FAIXAS_QUANTIL[-1][1]].to_numpy(),
+    )
+    faixas["quantil_sup"] = np.select(
+        condicoes,
+        [tabela_quantis[sup].to_numpy() for _, _, sup in FAIXAS_QUANTIL[:-1]],
+        default=tabela_quantis[FAIXAS_QUANTIL[-1][2]].to_numpy(),
+    )
+    faixas["mediana_inf"] = faixas["mediana"] / FATOR_MEDIANA
+    faixas["mediana_sup"] = faixas["mediana"] * FATOR_MEDIANA
+    return faixas
+
+
+def marcar_precos(precos, codigos_grupo, faixas):
+    """Marca cada linha comparando o preço com as faixas do seu grupo (posição em `faixas`).
+
+    Linhas sem grupo (código -1, subcategoria vazia) ficam sem marcação, como no
+    `groupby().transform` original.
+    """
+    precos = np.asarray(precos, dtype=float)
+    codigos_grupo = np.asarray(codigos_grupo)
+    sem_grupo = codigos_grupo < 0
+    idx = np.where(sem_grupo, 0, codigos_grupo)
+
+    def _dentro(inf, sup):
+        if len(faixas) == 0:
+            return np.zeros(len(precos), dtype=bool)
+        inf = faixas[inf].to_numpy(dtype=float)[idx]
+        sup = faixas[sup].to_numpy(dtype=float)[idx]
+        return (inf <= precos) & (precos <= sup)
+
+    validacao = np.where(_dentro("quantil_inf", "quantil_sup"), "OK", "OUTLIER").astype(object)
+    validacao_mediana = np.where(_dentro("mediana_inf", "mediana_sup"), "OK", "OUTLIER_MEDIANA").astype(object)
+    validacao[sem_grupo] = np.nan
+    validacao_mediana[sem_grupo] = np.nan
+    return validacao, validacao_mediana
+
+
+def validar_precos(df, coluna_preco, coluna_categoria, progresso=None, faixas_referencia=None):
+    """Roda as duas validações de preço de uma vez.
+
+    Retorna um DataFrame com `ValidacionPrecio` e `ValidacionPrecioMediana`
+    alinhado ao índice de `df`. `progresso` recebe as subcategorias validadas.
+    Com `faixas_referencia` (as `faixas` de um índice de referência), as faixas
+    vêm dela e não das linhas de `df` (ver `faixas_com_referencia`).
+    """
+    avisar_progresso(progresso, "validar_precos", 0)
+    if not pd.api.types.is_numeric_dtype(df[coluna_preco]):
+        df = df.assign(**{coluna_preco: converter_numero(df[coluna_preco])})
+    if faixas_referencia is not None:
+        faixas, categorias, _ = faixas_com_referencia(df, coluna_preco, coluna_categoria, faixas_referencia)
+        codigos = faixas.index.get_indexer(categorias)
+    else:
+        faixas = calcular_faixas_preco(df, coluna_preco, coluna_categoria)
+        codigos = df.groupby(coluna_categoria, sort=False, observed=True).ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    validacao, validacao_mediana = marcar_precos(df[coluna_preco], codigos, faixas)
+    avisar_progresso(progresso, "validar_precos", len(faixas), len(faixas))
+    return pd.DataFrame(
+        {"ValidacionPrecio": validacao, "ValidacionPrecioMediana": validacao_mediana},
+        index=df.index,
+    )
+
+
+def validar_precio_por_categoria(df, coluna_preco, coluna_categoria):
+    return validar_precos(df, coluna_preco, coluna_categoria)["ValidacionPrecio"]
+
+
+# ----------------------------
+# Novo validador: outliers com base na mediana (5x acima ou 1/5 abaixo)
+# ----------------------------
+def validar_precio_mediana(df, coluna_preco, coluna_categoria):
+    return validar_precos(df, coluna_preco, coluna_categoria)["ValidacionPrecioMediana"]
+
+# ----------------------------
+# Validação de conteúdo e status geral
+# ----------------------------
+COLUNAS_VALIDACAO = ["ValidacaoContenido", "ValidacionPrecio", "ValidacionPrecioMediana"]
+COLUNAS_DERIVADAS = ["QtdEmbalagem", "QtdEmbalagemGramas"] + COLUNAS_VALIDACAO + ["StatusGeral"]
+COLUNAS_STATUS = COLUNAS_VALIDACAO + ["StatusGeral"]
+# Arquivo de cada linha quando vários arquivos são validados juntos (ver `ler_arquivos_principais`)
+COLUNA_ORIGEM = "arquivo_origem"
+
+
+def comparar_contenido(qtd_embalagem_gramas, contenido):
+    """OK quando o peso extraído da descrição difere menos de 1 do contenido.
+
+    Recebe as duas colunas já numéricas; qualquer valor ausente é PROBLEMA.
+    """
+    gramas = pd.to_numeric(qtd_embalagem_gramas, errors="coerce").to_numpy(dtype=float)
+    contenido = pd.to_numeric(contenido, errors="coerce").to_numpy(dtype=float)
+    with np.errstate(invalid="ignore"):
+        ok = np.abs(gramas - contenido) < 1
+    return pd.Series(np.where(ok, "OK", "PROBLEMA"), index=qtd_embalagem_gramas.index, dtype=object)
+
+
+def calcular_status_geral(df):
+    """RISCO quando qualquer uma das validações não é OK (inclusive vazia)."""
+    risco = np.zeros(len(df), dtype=bool)
+    for coluna in COLUNAS_VALIDACAO:
+        risco |= df[coluna].to_numpy(dtype=object) != "OK"
+    return pd.Series(np.where(risco, "RISCO", "OK"), index=df.index, dtype=object)
+
+
+# ----------------------------
+# Exportar para Excel
+# ----------------------------
+# O workbook é escrito pelo xlsxwriter em modo constant_memory: cada linha vai
+# para disco assim que a próxima começa, então as células de cada aba precisam
+# ser escritas em ordem de linha.
+MAX_LINHAS_ABA = 1_048_576 - 1  # limite do Excel, descontando o cabeçalho
+FORMATOS_DETALHES = ["xlsx", "csv", "parquet"]
+
+
+def calcular_resumo(df, coluna_vendas):
+    """Tabela Métrica/Valor da aba Resumo, a partir de `calcular_metricas_resumo`."""
+    return tabela_resumo(calcular_metricas_resumo(df, coluna_vendas))
+
+
+def tabela_resumo(m):
+    """Tabela Métrica/Valor da aba Resumo a partir das métricas já calculadas."""
+    return pd.DataFrame({
+        "Métrica": [
+            "Qtd total de SKUs/Itens",
+            "1. Skus com possíveis problemas de contenido",
+            "2. Outliers idenficados exclusivamente através da mediana (5x) e quartil (5%)",
+            "3. Outilers exclusivos apenas mediana (5x)",
+            "4. Outliers exclusivos apenas quartil (5%)",
+            "Qtd de SKUs/itens com possíveis problemas",
+            "'%' de SKUs/itens com possíveis problemas",
+            "Volume de vendas total",
+            "Volume de vendas dos skus com possíveis problemas",
+            "% Volume de vendas dos skus com possíveis problemas"
+        ],
+        "Valor": [
+            m["total_itens"],
+            m["problemas_contenido"],
+            m["outliers_ambos"],
+            m["outliers_somente_mediana"],
+            m["outliers_somente_quartil"],
+            m["problemas_total"],
+            round(m["problemas_perc"], 2),
+            m["volume_total"],
+            m["volume_problemas"],
+            round(m["volume_problemas_perc"], 2)
+        ]
+    })
+
+
+def _escrever_aba_resumo(workbook, df_resumo, df_origens=None):
+    worksheet = workbook.add_worksheet("Resumo")
+    metricas = df_resumo["Métrica"].tolist()
+    valores = df_resumo["Valor"].tolist()
+
+    # ----------------------------
+    # FORMATOS
+    # ----------------------------
+    header_format = workbook.add_format({
+        "bold": True, "align": "center", "valign": "vcenter",
+        "bg_color": "#D9D9D9", "border": 1
+    })
+
+    normal_format = workbook.add_format({"border": 1})
+    orange_bold_format = workbook.add_format({
+        "bold": True, "border": 1, "font_color": "#E36C0A"
+    })
+    gray_format = workbook.add_format({
+        "bg_color": "#F2F2F2", "border": 1, "bold": True
+    })
+    percent_format = workbook.add_format({
+        "num_format": "0.0%", "border": 1
+    })
+    number_format = workbook.add_format({
+        "num_format": "#,##0", "border": 1
+    })
+
+    # ----------------------------
+    # AJUSTE DE LARGURAS
+    # ----------------------------
+    worksheet.set_column("A:A", 60)
+    worksheet.set_column("B:B", 25)
+
+    # ----------------------------
+    # CABEÇALHOS
+    # ----------------------------
+    worksheet.write(0, 0, "Métrica", header_format)
+    worksheet.write(0, 1, "Números", header_format)
+
+    # Total de itens
+    worksheet.write(1, 0, metricas[0], normal_format)
+    worksheet.write(1, 1, valores[0], number_format)
+
+    # Critérios (linhas 4 a 8)
+    worksheet.merge_range("A3:B3", "Critérios de itens com possíveis problemas", gray_format)
+    for linha, i in zip(range(3, 8), range(1, 6)):
+        worksheet.write(linha, 0, metricas[i], normal_format)
+        worksheet.write(linha, 1, valores[i], number_format)
+
+    # Percentual de itens (linha laranja)
+    worksheet.write(8, 0, "% de SKUs/itens com possíveis problemas", orange_bold_format)
+    worksheet.write_number(8, 1, valores[6] / 100, percent_format)
+
+    # Linha em branco
+    worksheet.write_blank(9, 0, None, normal_format)
+    worksheet.write_blank(9, 1, None, number_format)
+
+    # Volumes
+    worksheet.write(10, 0, metricas[7], normal_format)
+    worksheet.write(10, 1, valores[7], number_format)
+    worksheet.write(11, 0, metricas[8], normal_format)
+    worksheet.write(11, 1, valores[8], number_format)
+
+    # Percentual de volume (linha laranja)
+    worksheet.write(12, 0, "% Volume de vendas dos skus com possíveis problemas", orange_bold_format)
+    worksheet.write_number(12, 1, valores[9] / 100, percent_format)
+
+    # Quebra por arquivo de origem (vários arquivos validados juntos)
+    if df_origens is not None:
+        worksheet.set_column(2, len(df_origens.columns) - 1, 18)
+        worksheet.merge_range(14, 0, 14, len(df_origens.columns) - 1, "Resumo por arquivo de origem", gray_format)
+        for j, coluna in enumerate(df_origens.columns):
+            worksheet.write(15, j, coluna, header_format)
+        for i, registro in enumerate(df_origens.itertuples(index=False), 16):
+            for j, (coluna, valor) in enumerate(zip(df_origens.columns, registro)):
+                if j == 0:
+                    worksheet.write(i, j, str(valor), normal_format)
+                elif coluna.startswith("%"):
+                    worksheet.write_number(i, j, valor / 100, percent_format)
+                else:
+                    worksheet.write_number(i, j, valor, number_format)
+
+
+def _valores_coluna(serie):
+    """Valores nativos do Python, com ausentes como None (célula vazia).
+
+    ±inf viram o texto "inf"/"-inf", como no `to_excel` do pandas (o xlsxwriter
+    não grava números não finitos).
+    """
+    valores = serie.astype(object)
+    valores = valores.where(serie.notna(), None)
+    if serie.dtype.kind == "f" or serie.dtype == object:
+        infinitos = valores.isin([np.inf, -np.inf])
+        if infinitos.any():
+            valores[infinitos] = np.where(valores[infinitos].astype(float) > 0, "inf", "-inf")
+    return valores.tolist()
+
+
+def _escrever_abas_detalhes(workbook, df, nome_aba="Detalhes", progresso=None):
+    """Escreve `df` linha a linha, dividindo em Detalhes, Detalhes_2, ... acima do limite do Excel."""
+    header_format = workbook.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"})
+    cabecalho = [str(c) for c in df.columns]
+    total = len(df)
+    avisar_progresso(progresso, "exportacao", 0, total)
+    for parte, inicio in enumerate(range(0, max(total, 1), MAX_LINHAS_ABA), 1):
+        worksheet = workbook.add_worksheet(nome_aba if parte == 1 else f"{nome_aba}_{parte}")
+        worksheet.write_row(0, 0, cabecalho, header_format)
+        bloco = df.iloc[inicio:inicio + MAX_LINHAS_ABA]
+        # Converte por blocos para não materializar a aba inteira como listas Python
+        for bloco_inicio in range(0, len(bloco), 50_000):
+            pedaco = bloco.iloc[bloco_inicio:bloco_inicio + 50_000]
+            colunas = [_valores_coluna(pedaco[c]) for c in pedaco.columns] if len(pedaco.columns) else []
+            for i, linha in enumerate(zip(*colunas), bloco_inicio + 1):
+                worksheet.write_row(i, 0, linha)
+                if progresso is not None and i % 10_000 == 0:
+                    avisar_progresso(progresso, "exportacao", inicio + i, total)
+    avisar_progresso(progresso, "exportacao", total, total)
+
+
+def to_excel_com_resumo(df, coluna_vendas, destino=None, incluir_detalhes=True, df_resumo=None, progresso=None):
+    """Gera o Excel com as abas Detalhes (divididas se necessário) e Resumo.
+
+    Se `destino` (caminho ou file-like) for informado, grava nele e retorna None;
+    senão retorna os bytes do arquivo. `df_resumo` (de `tabela_resumo`) substitui
+    o resumo calculado a partir de `df`. `progresso` recebe as linhas já escritas.
+    Se `df` tem COLUNA_ORIGEM (vários arquivos validados juntos), a aba Resumo
+    ganha a quebra por arquivo de `tabela_resumo_por_origem`.
+    """
+    import xlsxwriter
+
+    output = BytesIO() if destino is None else destino
+    workbook = xlsxwriter.Workbook(output, {
+        "constant_memory": True,
+        "default_date_format": "YYYY-MM-DD HH:MM:SS",
+    })
+    # --- Aba Detalhes ---
+    if incluir_detalhes:
+        _escrever_abas_detalhes(workbook, df, progresso=progresso)
+    # --- Aba Resumo ---
+    _escrever_aba_resumo(workbook, calcular_resumo(df, coluna_vendas) if df_resumo is None else df_resumo,
+                         tabela_resumo_por_origem(df, coluna_vendas))
+    workbook.close()
+
+    if destino is None:
+        return output.getvalue()
+    return None
+
+
+def exportar_resultado(df, coluna_vendas, formato="xlsx", destino=None, progresso=None):
+    """Exporta no formato escolhido (ver FORMATOS_DETALHES).
+
+    "xlsx" é o Excel completo de `to_excel_com_resumo`. "csv" e "parquet" geram um
+    zip com `resumo.xlsx` (só a aba Resumo) e os detalhes nesse formato, sem o
+    limite de linhas do Excel. Retorna os bytes quando `destino` é None.
+    `progresso` recebe as linhas de detalhes já escritas.
+    """
+    if formato == "xlsx":
+        return to_excel_com_resumo(df, coluna_vendas, destino, progresso=progresso)
+    if formato not in FORMATOS_DETALHES:
+        raise ValueError(f"Formato desconhecido: {formato}")
+    if formato == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        raise ValueError("Exportar em Parquet requer o pacote pyarrow.")
+
+    output = BytesIO() if destino is None else destino
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        with zf.open("resumo.xlsx", "w") as f:
+            to_excel_com_resumo(df, coluna_vendas, f, incluir_detalhes=False)
+        with zf.open(f"detalhes.{formato}", "w", force_zip64=True) as f:
+            avisar_progresso(progresso, "exportacao", 0, len(df))
+            if formato == "csv":
+                texto = io.TextIOWrapper(f, encoding="utf-8-sig", newline="")
+                for inicio in range(0, max(len(df), 1), LINHAS_POR_AVISO_PROGRESSO):
+                    df.iloc[inicio:inicio + LINHAS_POR_AVISO_PROGRESSO].to_csv(
+                        texto, index=False, sep=";", decimal=",", header=inicio == 0
+                    )
+                    avisar_progresso(progresso, "exportacao", min(inicio + LINHAS_POR_AVISO_PROGRESSO, len(df)),
+                                     len(df))
+                texto.flush()
+                texto.detach()
+            else:
+                df.to_parquet(f, index=False)
+                avisar_progresso(progresso, "exportacao", len(df), len(df))
+
+    if destino is None:
+        return output.getvalue()
+    return None
+
+
+###########################################################################
+### MÉTRICAS DO RESUMO (usadas na tela e na aba Resumo do Excel)        ###
+###########################################################################
+# Cada linha vira um código de 3 bits (conteúdo, quartil, mediana); todas as
+# contagens e volumes saem de um único bincount sobre esses 8 grupos.
+BIT_CONTENIDO = 1
+BIT_QUARTIL = 2
+BIT_MEDIANA = 4
+
+
+def codigos_status(df, col_validacao_contenido="ValidacaoContenido",
+                   col_outlier_quartil="ValidacionPrecio", col_outlier_mediana="ValidacionPrecioMediana"):
+    """Máscara de bits (uint8) por linha: problema de conteúdo, outlier de quartil e de mediana."""
+    codigos = np.zeros(len(df), dtype=np.uint8)
+    codigos |= (df[col_validacao_contenido].to_numpy(dtype=object) == "PROBLEMA").astype(np.uint8) * BIT_CONTENIDO
+    codigos |= (df[col_outlier_quartil].to_numpy(dtype=object) == "OUTLIER").astype(np.uint8) * BIT_QUARTIL
+    codigos |= (df[col_outlier_mediana].to_numpy(dtype=object) == "OUTLIER_MEDIANA").astype(np.uint8) * BIT_MEDIANA
+    return codigos
+
+
+def calcular_metricas_resumo(df, coluna_vendas, codigos=None, **colunas_validacao):
+    """Calcula todas as métricas do resumo em uma passada.
+
+    Os outliers "ambos" / "somente mediana" / "somente quartil" excluem os itens
+    que já têm problema de conteúdo, então os quatro critérios somam o total de
+    itens com problema.
+    """
+    if codigos is None:
+        codigos = codigos_status(df, **colunas_validacao)
+    contagem = np.bincount(codigos, minlength=8)
+    volume = None
+    if coluna_vendas in df.columns:
+        vendas = pd.to_numeric(df[coluna_vendas], errors="coerce").to_numpy(dtype=float)
+        volume = np.bincount(codigos, weights=np.nan_to_num(vendas), minlength=8)
+    return metricas_de_contagens(contagem, volume)
+
+
+def metricas_de_contagens(contagem, volume=None):
+    """Métricas do resumo a partir das contagens (e volumes) por código de status.
+
+    `contagem`/`volume` têm 8 posições (uma por código de `codigos_status`) e podem
+    ser somados entre blocos do mesmo arquivo antes de chamar esta função.
+    """
+    if volume is not None:
+        volume_total = float(volume.sum())
+        volume_problemas = float(volume[1:].sum())
+    else:
+        volume_total = volume_problemas = np.nan
+
+    def _qtd(com, sem=0):
+        return int(sum(contagem[c] for c in range(8) if c & com == com and not c & sem))
+
+    total_itens = int(contagem.sum())
+    problemas_total = int(contagem[1:].sum())
+    return {
+        "total_itens": total_itens,
+        "problemas_contenido": _qtd(BIT_CONTENIDO),
+        "outliers_quartil": _qtd(BIT_QUARTIL),
+        "outliers_mediana": _qtd(BIT_MEDIANA),
+        "outliers_ambos": _qtd(BIT_QUARTIL | BIT_MEDIANA, BIT_CONTENIDO),
+        "outliers_somente_mediana": _qtd(BIT_MEDIANA, BIT_CONTENIDO | BIT_QUARTIL),
+        "outliers_somente_quartil": _qtd(BIT_QUARTIL, BIT_CONTENIDO | BIT_MEDIANA),
+        "problemas_total": problemas_total,
+        "problemas_perc": problemas_total / total_itens * 100 if total_itens else 0,
+        "volume_total": volume_total,
+        "volume_problemas": volume_problemas,
+        "volume_problemas_perc": volume_problemas / volume_total * 100 if volume_total else 0,
+    }
+
+
+def metricas_por_origem(df, coluna_vendas, coluna_origem=COLUNA_ORIGEM, codigos=None):
+    """Métricas do resumo (de `metricas_de_contagens`) para cada arquivo de origem.
+
+    Um único bincount sobre (origem, código de status). Retorna {origem: métricas},
+    na ordem das origens.
+    """
+    if codigos is None:
+        codigos = codigos_status(df)
+    origens, nomes = pd.factorize(df[coluna_origem], sort=False)
+    validos = origens >= 0
+    grupos = origens[validos].astype(np.int64) * 8 + codigos[validos]
+    contagem = np.bincount(grupos, minlength=8 * len(nomes)).reshape(len(nomes), 8)
+    volume = None
+    if coluna_vendas in df.columns:
+        vendas = pd.to_numeric(df[coluna_vendas], errors="coerce").to_numpy(dtype=float)[validos]
+        volume = np.bincount(grupos, weights=np.nan_to_num(vendas), minlength=8 * len(nomes)).reshape(len(nomes), 8)
+    return {
+        nome: metricas_de_contagens(contagem[i], volume[i] if volume is not None else None)
+        for i, nome in enumerate(nomes)
+    }
+
+
+def tabela_resumo_por_origem(df, coluna_vendas, coluna_origem=COLUNA_ORIGEM):
+    """Uma linha por arquivo de origem com as métricas da aba Resumo (None sem COLUNA_ORIGEM)."""
+    if df is None or coluna_origem not in df.columns:
+        return None
+    return pd.DataFrame([{
+        "Arquivo": origem,
+        "Qtd SKUs/Itens": m["total_itens"],
+        "Problemas de contenido": m["problemas_contenido"],
+        "Outliers mediana e quartil": m["outliers_ambos"],
+        "Outliers apenas mediana": m["outliers_somente_mediana"],
+        "Outliers apenas quartil": m["outliers_somente_quartil"],
+        "SKUs com problema": m["problemas_total"],
+        "% SKUs com problema": round(m["problemas_perc"], 2),
+        "Volume de vendas": m["volume_total"],
+        "Volume com problema": m["volume_problemas"],
+        "% Volume com problema": round(m["volume_problemas_perc"], 2),
+    } for origem, m in metricas_por_origem(df, coluna_vendas, coluna_origem).items()])
+
+
+def gerar_resumo(df, coluna_vendas="vendas", col_validacao_contenido="ValidacaoContenido",
+                 col_outlier_quartil="ValidacionPrecio", col_outlier_mediana="ValidacionPrecioMediana"):
+    """Métricas consolidadas em um DataFrame de uma linha (mesmos números da aba Resumo)."""
+    m = calcular_metricas_resumo(
+        df, coluna_vendas,
+        col_validacao_contenido=col_validacao_contenido,
+        col_outlier_quartil=col_outlier_quartil,
+        col_outlier_mediana=col_outlier_mediana,
+    )
+    return pd.DataFrame([{
+        "Qtd Total SKUs/Itens": m["total_itens"],
+        "Qtd Problemas Conteúdo": m["problemas_contenido"],
+        "Qtd Outliers em comum (Quartil e Mediana)": m["outliers_ambos"],
+        "Qtd Outliers apenas Mediana": m["outliers_somente_mediana"],
+        "Qtd Outliers apenas Quartil": m["outliers_somente_quartil"],
+        "Qtd Total SKUs com problema (conteúdo ou preço)": m["problemas_total"],
+        "% SKUs com problema": m["problemas_perc"],
+        "Volume Total Vendas": m["volume_total"],
+        "Volume Vendas com problema": m["volume_problemas"],
+        "% Volume Vendas com problema": m["volume_problemas_perc"],
+    }])
+
+
+# ----------------------------
+# Exploração paginada do resultado
+# ----------------------------
+# Para navegar pelo resultado sem mandar o DataFrame inteiro ao navegador, as
+# linhas são ordenadas uma vez por volume de vendas (maior primeiro) e, para
+# cada valor das colunas de filtro, guarda-se o array ordenado das posições
+# (nessa ordem) das linhas com aquele valor. Filtrar é unir os arrays dos
+# valores escolhidos de cada coluna e intersectar entre colunas; o resultado
+# já sai na ordem de vendas e cada página é um `iloc` de poucas linhas.
+COLUNAS_FILTRO_EXPLORACAO = ["StatusGeral", "ValidacaoContenido", "ValidacionPrecio", "ValidacionPrecioMediana",
+                             COLUNA_ORIGEM]
+
+
+def _posicoes_por_valor(codigos, unicos):
+    """{valor: posições (int64, crescentes)} a partir dos códigos de `pd.factorize` (-1 = nulo)."""
+    ordem = np.argsort(codigos, kind="stable")
+    limites = np.cumsum(np.bincount(codigos[codigos >= 0], minlength=len(unicos)))
+    inicio = int((codigos < 0).sum())  # nulos (código -1) ficam no começo de `ordem`
+    grupos = np.split(ordem[inicio:], limites[:-1]) if len(unicos) else []
+    return {valor: grupo.astype(np.int64) for valor, grupo in zip(unicos, grupos)}
+
+
+def indexar_resultado(df, coluna_vendas=None, coluna_categoria=None, colunas_filtro=COLUNAS_FILTRO_EXPLORACAO):
+    """Índices para `filtrar_resultado`/`pagina_resultado`, montados uma vez por resultado.
+
+    Retorna um dict com `ordem` (posição no `df` de cada linha, da maior para a
+    menor venda; vendas vazias no fim) e `valores` ({coluna: {valor: posições na
+    ordem}}) para as colunas de filtro presentes e a de categoria.
+    """
+    if coluna_vendas in df.columns:
+        vendas = pd.to_numeric(df[coluna_vendas], errors="coerce").to_numpy(dtype=float)
+        ordem = np.argsort(-vendas, kind="stable")
+    else:
+        ordem = np.arange(len(df))
+    colunas = [c for c in colunas_filtro if c in df.columns]
+    if coluna_categoria in df.columns and coluna_categoria not in colunas:
+        colunas.append(coluna_categoria)
+    valores = {}
+    for coluna in colunas:
+        codigos, unicos = pd.factorize(df[coluna])
+        valores[coluna] = _posicoes_por_valor(codigos[ordem], unicos)
+    return {"ordem": ordem, "valores": valores}
+
+
+def filtrar_resultado(indice, filtros=None):
+    """Posições (na ordem de vendas) das linhas que atendem a `filtros`.
+
+    `filtros` é {coluna: valores aceitos}; valores de uma coluna se somam (ou) e
+    colunas se combinam (e). Colunas sem valores escolhidos não filtram.
+    """
+    selecao = None
+    for coluna, aceitos in (filtros or {}).items():
+        if not aceitos:
+            continue
+        grupos = indice["valores"][coluna]
+        partes = [grupos[valor] for valor in aceitos if valor in grupos]
+        posicoes = np.sort(np.concatenate(partes)) if partes else np.empty(0, dtype=np.int64)
+        selecao = posicoes if selecao is None else np.intersect1d(selecao, posicoes, assume_unique=True)
+    return np.arange(len(indice["ordem"])) if selecao is None else selecao
+
+
+def pagina_resultado(df, indice, selecao, pagina=1, tamanho_pagina=50):
+    """Linhas da `pagina` (a partir de 1) de `selecao` (ver `filtrar_resultado`), já ordenadas."""
+    inicio = (pagina - 1) * tamanho_pagina
+    return df.iloc[indice["ordem"][selecao[inicio:inicio + tamanho_pagina]]]
+
+
+# ----------------------------
+# Leitura dos arquivos
+# ----------------------------
+# As funções abaixo retornam, junto com o resultado, uma lista de avisos
+# (nível, mensagem) com nível "info", "success" ou "warning". O app mostra os
+# avisos na tela e o processamento em lote grava no log.
+def _nome_arquivo(arquivo, nome=None):
+    return nome or getattr(arquivo, "name", None) or str(arquivo)
+
+
+# Leitura de CSV: formato detectado numa amostra do início do arquivo e parse
+# com o engine C do pandas (ou pyarrow, se estiver instalado).
+TAMANHO_AMOSTRA_CSV = 64 * 1024
+SEPARADORES_CSV = ";,\t|"
+ENGINE_CSV = "pyarrow" if importlib.util.find_spec("pyarrow") else "c"
+
+
+def _rebobinar(arquivo):
+    if hasattr(arquivo, "seek"):
+        arquivo.seek(0)
+    return arquivo
+
+
+def _ler_amostra(arquivo, tamanho=TAMANHO_AMOSTRA_CSV):
+    if hasattr(arquivo, "read"):
+        _rebobinar(arquivo)
+        amostra = arquivo.read(tamanho)
+        _rebobinar(arquivo)
+        return amostra
+    with open(arquivo, "rb") as f:
+        return f.read(tamanho)
+
+
+def detectar_formato_csv(amostra):
+    """Retorna (encoding, separador) a partir dos primeiros bytes do arquivo.
+
+    UTF-8 quando a amostra decodifica sem erro (uma sequência cortada no fim da
+    amostra é tolerada), senão latin-1.
+    """
+    if amostra.startswith(codecs.BOM_UTF8):
+        encoding = "utf-8-sig"
+    else:
+        try:
+            codecs.getincrementaldecoder("utf-8")().decode(amostra, final=False)
+            encoding = "utf-8"
+        except UnicodeDecodeError:
+            encoding = "latin-1"
+
+    texto = amostra.decode(encoding, errors="ignore")
+    linhas = texto.splitlines()
+    if len(linhas) > 1 and len(amostra) >= TAMANHO_AMOSTRA_CSV:
+        linhas = linhas[:-1]  # última linha provavelmente cortada
+    try:
+        separador = csv.Sniffer().sniff("\n".join(linhas[:50]), delimiters=SEPARADORES_CSV).delimiter
+    except csv.Error:
+        cabecalho = linhas[0] if linhas else ""
+        separador = max(SEPARADORES_CSV, key=cabecalho.count) if cabecalho else ","
+        if not cabecalho.count(separador):
+            separador = ","
+    return encoding, separador
+
+
+# Bytes que não são UTF-8 válido são lidos como latin-1 (arquivos com cabeçalho
+# UTF-8 e linhas coladas de outra fonte em latin-1, por exemplo).
+ERROS_ENCODING_CSV = "mapeio_latin1"
+codecs.register_error(ERROS_ENCODING_CSV, lambda erro: (erro.object[erro.start:erro.end].decode("latin-1"), erro.end))
+
+
+def _tem_coluna_bytes(df):
+    """pyarrow ignora `encoding_errors`: a coluna com bytes inválidos vem inteira como `bytes`."""
+    for coluna in df.columns[df.dtypes == object]:
+        valores = df[coluna].dropna()
+        if len(valores) and isinstance(valores.iloc[0], bytes):
+            return True
+    return False
+
+
+def ler_csv(arquivo, colunas=None, tamanho_bloco=None, colunas_texto=()):
+    """Lê um CSV detectando encoding e separador.
+
+    `colunas`: conjunto de nomes normalizados (strip/lower) a manter; None lê tudo.
+    `colunas_texto`: nomes normalizados lidos como texto, para que números no
+    formato BR ("1.000") sejam convertidos por `converter_numero` e não pelo parser.
+    `tamanho_bloco`: se informado, retorna um iterador de DataFrames com esse
+    número de linhas (engine C), para arquivos que não cabem de uma vez.
+    O encoding vem só da amostra inicial; bytes inválidos mais adiante no
+    arquivo são lidos como latin-1 em vez de interromper a leitura.
+    """
+    encoding, separador = detectar_formato_csv(_ler_amostra(arquivo))
+    opcoes = {"sep": separador, "encoding": encoding, "encoding_errors": ERROS_ENCODING_CSV}
+    cabecalho = pd.read_csv(_rebobinar(arquivo), nrows=0, **opcoes).columns
+    if colunas is not None:
+        opcoes["usecols"] = [c for c in cabecalho if str(c).strip().lower() in colunas]
+    texto = {c: str for c in cabecalho if str(c).strip().lower() in colunas_texto}
+    if texto:
+        opcoes["dtype"] = texto
+
+    if tamanho_bloco:
+        return pd.read_csv(_rebobinar(arquivo), engine="c", chunksize=tamanho_bloco, **opcoes)
+
+    if ENGINE_CSV == "pyarrow":
+        df = pd.read_csv(_rebobinar(arquivo), engine="pyarrow", **opcoes)
+        if not _tem_coluna_bytes(df):
+            return df
+        # Amostra era UTF-8 válido mas o resto do arquivo não
+    return pd.read_csv(_rebobinar(arquivo), engine="c", low_memory=False, **opcoes)
+
+
+# Leitura de Excel: calamine (python-calamine, bem mais rápido) quando instalado,
+# senão openpyxl em modo somente leitura. O workbook é aberto uma vez só.
+ENGINE_EXCEL = "calamine" if importlib.util.find_spec("python_calamine") else "openpyxl"
+ABA_VALIDADORA = "PLANILHA VALIDADORA"
+
+
+def abrir_excel(arquivo):
+    try:
+        return pd.ExcelFile(_rebobinar(arquivo), engine=ENGINE_EXCEL)
+    except ValueError:
+        # pandas antigo sem suporte ao engine calamine
+        return pd.ExcelFile(_rebobinar(arquivo), engine="openpyxl")
+
+
+def ler_aba_excel(xls, aba=0, colunas=None):
+    """Lê uma aba de um `pd.ExcelFile` já aberto.
+
+    `colunas`: nomes normalizados (strip/lower) a manter, decididos pelo
+    cabeçalho; None lê todas.
+    """
+    usecols = None
+    if colunas is not None:
+        usecols = lambda nome: str(nome).strip().lower() in colunas  # noqa: E731
+    return xls.parse(aba, header=0, usecols=usecols)
+
+
+def colunas_necessarias_principal():
+    """Nomes (normalizados) de colunas do arquivo principal usados pela validação e pelo cruzamento."""
+    nomes = {nome for possiveis in MAPA_COLUNAS.values() for nome in possiveis}
+    return nomes | set(POSSIVEIS_EAN_DF) | {COLUNA_ORIGEM}
+
+
+def colunas_necessarias_auxiliar():
+    return set(POSSIVEIS_EAN_AUX) | set(COLUNAS_AUX_INTERESSE)
+
+
+def ler_arquivo_principal(arquivo, nome=None, somente_necessarias=False, tamanho_bloco=None):
+    """Lê o arquivo bruto da categoria (xlsx ou csv); `arquivo` é caminho ou file-like.
+
+    Com `somente_necessarias=True` só as colunas usadas na validação e no cruzamento
+    por EAN são lidas (o Excel de saída também terá só essas). `tamanho_bloco`
+    lê CSVs em blocos, o que limita a memória usada pelo parser.
+    """
+    colunas = colunas_necessarias_principal() if somente_necessarias else None
+    if _nome_arquivo(arquivo, nome).lower().endswith(".csv"):
+        colunas_texto = set(MAPA_COLUNAS["preco"] + MAPA_COLUNAS["vendas"] + MAPA_COLUNAS["contenido"])
+        if tamanho_bloco:
+            return pd.concat(ler_csv(arquivo, colunas, tamanho_bloco, colunas_texto), ignore_index=True)
+        return ler_csv(arquivo, colunas, colunas_texto=colunas_texto)
+    with abrir_excel(arquivo) as xls:
+        return ler_aba_excel(xls, 0, colunas)
+
+
+# Vários arquivos da mesma categoria (ex.: extrações regionais) são lidos em
+# paralelo numa pool de threads (a leitura é quase toda I/O e parse fora do
+# Python) e empilhados num único DataFrame, com o arquivo de cada linha em
+# COLUNA_ORIGEM. Validados juntos, as faixas de preço de cada subcategoria
+# consideram as linhas de todos os arquivos.
+MAX_THREADS_LEITURA = 8
+
+
+def ler_arquivos_principais(arquivos, nomes=None, somente_necessarias=False, progresso=None,
+                            max_threads=MAX_THREADS_LEITURA):
+    """Lê vários arquivos da categoria ao mesmo tempo e empilha num único DataFrame.
+
+    `arquivos` são caminhos ou file-likes (informe `nomes` para file-likes sem
+    nome). As colunas são normalizadas e, quando os arquivos usam nomes
+    alternativos diferentes para a mesma coluna (ex.: `descripcion` e `nome sku`),
+    ficam com o nome usado no primeiro arquivo. A primeira coluna é COLUNA_ORIGEM
+    (`category`, com o nome de cada arquivo). `progresso` recebe os arquivos já
+    lidos. Retorna (df, avisos). Levanta ColunasFaltandoError indicando o arquivo.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    nomes_leitura = list(nomes) if nomes is not None else [_nome_arquivo(a) for a in arquivos]
+    # Rótulos de origem: nome do arquivo, numerado quando o mesmo nome se repete
+    nomes = [os.path.basename(str(nome)) for nome in nomes_leitura]
+    for i, nome in enumerate(nomes):
+        repeticoes = nomes[:i].count(nome)
+        if repeticoes:
+            nomes[i] = f"{nome} ({repeticoes + 1})"
+
+    lidos = []
+    avisar_progresso(progresso, "leitura_arquivos", 0, len(arquivos))
+    with ThreadPoolExecutor(max_workers=max(1, min(max_threads, len(arquivos)))) as executor:
+        futuros = [executor.submit(ler_arquivo_principal, arquivo, nome, somente_necessarias)
+                   for arquivo, nome in zip(arquivos, nomes_leitura)]
+        for i, futuro in enumerate(futuros, 1):
+            lidos.append(normalizar_nomes_colunas(futuro.result()))
+            avisar_progresso(progresso, "leitura_arquivos", i, len(arquivos))
+
+    referencia = None
+    for df, nome in zip(lidos, nomes):
+        try:
+            colunas = mapear_colunas(df)
+        except ColunasFaltandoError as e:
+            raise ColunasFaltandoError([f"{coluna} ({nome})" for coluna in e.colunas_faltando]) from None
+        colunas["ean"] = encontrar_coluna(df.columns, POSSIVEIS_EAN_DF)
+        if referencia is None:
+            referencia = colunas
+        renomear = {colunas[chave]: referencia[chave] for chave in colunas
+                    if colunas[chave] and referencia[chave] and colunas[chave] != referencia[chave]
+                    and referencia[chave] not in df.columns}
+        df.rename(columns=renomear, inplace=True)
+        df.drop(columns=[COLUNA_ORIGEM], errors="ignore", inplace=True)
+
+    avisos = [("info", f"📂 {len(lidos)} arquivos validados juntos: "
+                       + ", ".join(f"{nome} ({len(df)} linhas)" for df, nome in zip(lidos, nomes)))]
+    incompletas = [c for c in dict.fromkeys(c for df in lidos for c in df.columns)
+                   if not all(c in df.columns for df in lidos)]
+    if incompletas:
+        avisos.append(("warning",
+            "⚠️ Colunas que não existem em todos os arquivos (ficam vazias nas linhas dos demais): "
+            + ", ".join(incompletas)
+        ))
+
+    df = pd.concat(lidos, ignore_index=True) if len(lidos) > 1 else lidos[0]
+    origem = pd.Categorical.from_codes(np.repeat(np.arange(len(lidos)), [len(d) for d in lidos]), categories=nomes)
+    df.insert(0, COLUNA_ORIGEM, origem)
+    return df, avisos
+
+
+def ler_base_auxiliar(arquivo, nome=None):
+    """Lê a base validadora, de preferência a aba "PLANILHA VALIDADORA".
+
+    Retorna (df_aux, avisos); df_aux é None se a base não puder ser lida.
+    """
+    avisos = []
+    df_aux = None
+    try:
+        # Se for CSV, lemos normalmente (CSV não tem sheets)
+        if _nome_arquivo(arquivo, nome).lower().endswith(".csv"):
+            df_aux = ler_csv(arquivo, colunas_necessarias_auxiliar())
+            avisos.append(("info", "🔁 Base auxiliar lida como CSV (nenhuma aba disponível)."))
+        else:
+            # Abre o workbook uma vez só e procura a aba "Planilha Validadora"
+            with abrir_excel(arquivo) as xls:
+                aba = next(
+                    (nome_aba for nome_aba in xls.sheet_names if str(nome_aba).strip().upper() == ABA_VALIDADORA),
+                    None,
+                )
+                if aba is not None:
+                    avisos.append(("info", '✅ Aba "Planilha Validadora" encontrada e carregada da base auxiliar.'))
+                else:
+                    # aba não encontrada — fallback para a primeira aba e aviso
+                    aba = 0
+                    avisos.append(("warning", '⚠️ Aba "Planilha Validadora" não encontrada — carregada a primeira aba como fallback.'))
+                df_aux = ler_aba_excel(xls, aba, colunas_necessarias_auxiliar())
+    except Exception as e:
+        avisos.append(("warning", f"⚠️ Não foi possível ler a base auxiliar: {e}"))
+        df_aux = None
+    return df_aux, avisos
+
+
+# ----------------------------
+# Mapeamento flexível de colunas
+# ----------------------------
+MAPA_COLUNAS = {
+    "descricao": ["descripcion", "prod_nombre_original", "nome sku"],
+    "contenido": ["contenido", "qtd conteúdo sku"],
+    "preco": ["precio kg/lt", "preço convertido kg/lt r$", "preço kg/lt"],
+    "categoria": ["est mer 7 (subcategoria)", "nivel1", "est mer 7 descripcion"],
+    "vendas": ["imp vta (ult.24 meses)", "vendas em volume", "imp vta (ult 24meses)"]
+}
+
+NOMES_COLUNAS = {
+    "descricao": "Descrição",
+    "contenido": "Conteúdo",
+    "preco": "Preço",
+    "categoria": "Categoria",
+    "vendas": "Vendas",
+}
+
+
+class ColunasFaltandoError(ValueError):
+    """Alguma coluna obrigatória não foi encontrada no arquivo."""
+
+    def __init__(self, colunas_faltando):
+        self.colunas_faltando = colunas_faltando
+        super().__init__(
+            f"❌ Não foi possível identificar as seguintes colunas no arquivo: "
+            f"{', '.join(colunas_faltando)}"
+        )
+
+
+def normalizar_nomes_colunas(df):
+    df.columns = df.columns.astype(str).str.strip().str.lower()
+    return df
+
+
+def encontrar_coluna(colunas, possiveis):
+    for nome in possiveis:
+        if nome in colunas:
+            return nome
+    return None
+
+
+def mapear_colunas(df):
+    """Resolve os nomes reais das colunas obrigatórias (chaves de MAPA_COLUNAS).
+
+    Levanta ColunasFaltandoError se alguma não for encontrada.
+    """
+    colunas = {chave: encontrar_coluna(df.columns, possiveis) for chave, possiveis in MAPA_COLUNAS.items()}
+    colunas_faltando = [NOMES_COLUNAS[chave] for chave, valor in colunas.items() if valor is None]
+    if colunas_faltando:
+        raise ColunasFaltandoError(colunas_faltando)
+    return colunas
+
+
+# ----------------------------
+# Cruzamento com base auxiliar por EAN
+# ----------------------------
+POSSIVEIS_EAN_DF = ["codigo barras", "código barras", "ean"]
+POSSIVEIS_EAN_AUX = ["codigo barras", "código barras", "ean", "codigo_barras"]
+COLUNAS_AUX_INTERESSE = ["analise preço kg/lt", "mapeio pack", "localiza se há conteúdo no descritivo atual",
+                         "fórmula dun -> ean", "localiza se há marca no descritivo atual",
+                         "localiza se há categoria no descritivo atual"]
+
+
+VERSAO_INDICE_EAN = 1
+MAX_INDICES_EAN = 5
+_PESOS_GTIN = np.array([3, 1] * 6 + [3])
+_POTENCIAS_10 = 10 ** np.arange(13, -1, -1, dtype=np.int64)
+
+
+def _digito_verificador(digitos):
+    """Dígito verificador GS1 para uma matriz (n, 14) de dígitos (a última coluna é ignorada)."""
+    return (10 - (digitos[:, :13] @ _PESOS_GTIN) % 10) % 10
+
+
+def normalizar_ean(serie):
+    """Converte códigos de barras para int64 comparáveis, com DUN-14 mapeado para o EAN-13.
+
+    Aceita números, textos com zeros à esquerda, "7891234567890.0" e notação
+    científica. Retorna (codigos, estatisticas); código 0 significa ausente/inválido.
+    """
+    if pd.api.types.is_numeric_dtype(serie):
+        numeros = pd.to_numeric(serie, errors="coerce")
+    else:
+        # Caminho rápido: texto que já é um número inteiro ("0789...", "789....0", "7.89E+12")
+        try:
+            numeros = serie.astype("float64")
+        except (ValueError, TypeError):
+            numeros = pd.to_numeric(serie.astype(str).str.strip(), errors="coerce")
+        numeros = numeros.where((numeros >= 0) & (numeros % 1 == 0))
+        resto = numeros.isna() & serie.notna()
+        if resto.any():
+            so_digitos = serie[resto].astype(str).str.replace(r"\D", "", regex=True)
+            so_digitos = so_digitos.where(so_digitos.str.len().between(1, 14))
+            numeros = numeros.fillna(pd.to_numeric(so_digitos, errors="coerce"))
+    numeros = numeros.where((numeros > 0) & (numeros < 1e14))
+    validos = numeros.notna().to_numpy()
+
+    codigos = np.zeros(len(serie), dtype=np.int64)
+    codigos[validos] = numeros[validos].round().astype(np.int64).to_numpy()
+    digitos = (codigos[:, None] // _POTENCIAS_10) % 10
+
+    # DUN-14: indicador 1-8 + 12 dígitos do EAN + novo verificador
+    dun = validos & (digitos[:, 0] >= 1) & (digitos[:, 0] <= 8)
+    digito_invalido = validos & (_digito_verificador(digitos) != digitos[:, 13])
+    if dun.any():
+        ean = digitos[dun].copy()
+        ean[:, 0] = 0
+        ean[:, 13] = _digito_verificador(ean)
+        codigos[dun] = ean @ _POTENCIAS_10
+
+    estatisticas = {
+        "validos": int(validos.sum()),
+        "vazios_ou_invalidos": int((~validos).sum()),
+        "digito_invalido": int(digito_invalido.sum()),
+        "dun_convertidos": int(dun.sum()),
+    }
+    return codigos, estatisticas
+
+
+def construir_indice_ean(df_aux):
+    """Monta o índice da base validadora: EAN normalizado (int64, único) -> colunas de interesse.
+
+    Retorna um dict com `indice` (DataFrame indexado pelo EAN), `coluna_ean`,
+    `colunas` e `estatisticas`, ou None se faltar a coluna de EAN.
+    """
+    normalizar_nomes_colunas(df_aux)
+    col_ean_aux = encontrar_coluna(df_aux.columns, POSSIVEIS_EAN_AUX)
+    if col_ean_aux is None:
+        return None
+    colunas_aux_existentes = [c for c in df_aux.columns if c.lower() in COLUNAS_AUX_INTERESSE]
+
+    codigos, estatisticas = normalizar_ean(df_aux[col_ean_aux])
+    indice = df_aux[colunas_aux_existentes].copy()
+    indice.index = pd.Index(codigos, name="ean")
+    indice = indice[indice.index != 0]
+    duplicados = indice.index.duplicated(keep="first")
+    estatisticas["duplicados"] = int(duplicados.sum())
+    indice = indice[~duplicados].sort_index()
+    return {
+        "versao": VERSAO_INDICE_EAN,
+        "indice": indice,
+        "coluna_ean": col_ean_aux,
+        "colunas": colunas_aux_existentes,
+        "estatisticas": estatisticas,
+    }
+
+
+def hash_arquivo(arquivo):
+    """SHA-256 do conteúdo de um caminho ou file-like (lido em blocos)."""
+    h = hashlib.sha256()
+    if hasattr(arquivo, "getvalue"):
+        h.update(arquivo.getvalue())
+        return h.hexdigest()
+    if hasattr(arquivo, "read"):
+        _rebobinar(arquivo)
+        for bloco in iter(lambda: arquivo.read(1 << 20), b""):
+            h.update(bloco)
+        _rebobinar(arquivo)
+        return h.hexdigest()
+    with open(arquivo, "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def carregar_indice_ean(arquivo, nome=None, pasta_cache=None):
+    """Índice EAN da base validadora, reaproveitado do disco enquanto o arquivo não mudar.
+
+    A chave é o hash do conteúdo da base; só os MAX_INDICES_EAN mais recentes
+    são mantidos. Retorna (indice_ean, avisos); indice_ean é None se a base não
+    puder ser lida ou não tiver coluna de EAN.
+    """
+    pasta_cache = pasta_cache or CACHE_PESO_DIR
+    caminho = os.path.join(pasta_cache, f"indice_ean_{hash_arquivo(arquivo)}.pkl")
+    try:
+        indice_ean = pd.read_pickle(caminho)
+        if indice_ean.get("versao") == VERSAO_INDICE_EAN:
+            os.utime(caminho)
+            return indice_ean, [("info", "✅ Índice da base auxiliar reaproveitado (base sem alterações).")]
+    except (OSError, ValueError, EOFError, pickle.UnpicklingError, AttributeError):
+        pass
+
+    df_aux, avisos = ler_base_auxiliar(arquivo, nome)
+    if df_aux is None:
+        return None, avisos
+    indice_ean = construir_indice_ean(df_aux)
+    if indice_ean is None:
+        avisos.append(("warning", "⚠️ Não foi possível localizar a coluna de EAN na base auxiliar."))
+        return None, avisos
+
+    try:
+        os.makedirs(pasta_cache, exist_ok=True)
+        pd.to_pickle(indice_ean, caminho)
+        # O índice recém-gravado nunca é descartado, mesmo com mtime empatado
+        antigos = sorted((p for p in glob.glob(os.path.join(pasta_cache, "indice_ean_*.pkl")) if p != caminho),
+                         key=os.path.getmtime)
+        for antigo in antigos[:max(0, len(antigos) - (MAX_INDICES_EAN - 1))]:
+            os.remove(antigo)
+    except OSError:
+        pass
+    return indice_ean, avisos
+
+
+def cruzar_por_indice_ean(df, indice_ean, acumulado=None, copiar=True):
+    """Traz as colunas de interesse do índice da base validadora para `df`.
+
+    Cada linha recebe no máximo um registro (o primeiro da base para aquele EAN).
+    Retorna (df_final, avisos). Se o cruzamento não for possível, df_final é `df`.
+    Com `acumulado` (dict), as contagens do cruzamento são somadas nele e os
+    avisos de resultado ficam para `avisos_cruzamento` (leitura em blocos). Com
+    `copiar=False`, as colunas são acrescentadas no próprio `df`.
+    """
+    avisos = []
+    try:
+        col_ean_df = encontrar_coluna(df.columns, POSSIVEIS_EAN_DF)
+        if col_ean_df is None or indice_ean is None:
+            avisos.append(("warning", "⚠️ Não foi possível localizar a coluna de EAN em uma das bases."))
+            return df, avisos
+        if not indice_ean["colunas"]:
+            avisos.append(("warning", "⚠️ Nenhuma das colunas de interesse foi encontrada na base auxiliar. "
+                           "Verifique os nomes: " + ", ".join(COLUNAS_AUX_INTERESSE)))
+            return df, avisos
+
+        codigos, estatisticas = normalizar_ean(df[col_ean_df])
+        posicoes = indice_ean["indice"].index.get_indexer(codigos)
+        posicoes[codigos == 0] = -1
+        encontrados = posicoes >= 0
+        df_final = anexar_colunas_indice(df, indice_ean, posicoes, copiar)
+
+        cruzamento = {} if acumulado is None else acumulado
+        cruzamento["coluna_ean"] = col_ean_df
+        for chave, valor in [("encontrados", int(encontrados.sum())), ("total", len(df)), *estatisticas.items()]:
+            cruzamento[chave] = cruzamento.get(chave, 0) + valor
+        if acumulado is None:
+            avisos.extend(avisos_cruzamento(cruzamento, indice_ean))
+        return df_final, avisos
+
+    except Exception as e:
+        avisos.append(("warning", f"⚠️ Erro ao cruzar as bases: {e}"))
+        return df, avisos
+
+
+def anexar_colunas_indice(df, indice_ean, posicoes, copiar=True):
+    """Cópia de `df` com as colunas do índice na posição `posicoes` de cada linha (-1: não encontrado).
+
+    Colunas que já existem em `df` recebem o sufixo `_aux`. Com `copiar=False`,
+    as colunas são acrescentadas no próprio `df`.
+    """
+    indice = indice_ean["indice"]
+    encontrados = posicoes >= 0
+    df_final = df.copy() if copiar else df
+    for coluna in indice_ean["colunas"]:
+        valores = indice[coluna].to_numpy()
+        destino = coluna + "_aux" if coluna in df.columns else coluna
+        if valores.dtype.kind in "iub":
+            valores = valores.astype(float)
+        novos = np.full(len(df), np.nan, dtype=valores.dtype if valores.dtype.kind == "f" else object)
+        novos[encontrados] = valores[posicoes[encontrados]]
+        df_final[destino] = novos
+    return df_final
+
+
+def avisos_cruzamento(cruzamento, indice_ean):
+    """Avisos de resultado do cruzamento a partir das contagens de `cruzar_por_indice_ean`."""
+    if not cruzamento:
+        return []
+    total = cruzamento["total"]
+    taxa = cruzamento["encontrados"] / total * 100 if total else 0
+    avisos = [("success",
+        f"✅ Bases cruzadas com sucesso por '{cruzamento['coluna_ean']}'. "
+        f"Colunas adicionadas: {', '.join(indice_ean['colunas'])}. "
+        f"{cruzamento['encontrados']} de {total} linhas encontradas na base ({taxa:.1f}%)."
+    )]
+    detalhes = []
+    if cruzamento["dun_convertidos"]:
+        detalhes.append(f"{cruzamento['dun_convertidos']} DUN-14 convertidos para EAN")
+    if cruzamento["digito_invalido"]:
+        detalhes.append(f"{cruzamento['digito_invalido']} códigos com dígito verificador inválido")
+    if cruzamento["vazios_ou_invalidos"]:
+        detalhes.append(f"{cruzamento['vazios_ou_invalidos']} linhas sem EAN válido")
+    if indice_ean["estatisticas"].get("duplicados"):
+        detalhes.append(f"{indice_ean['estatisticas']['duplicados']} EANs repetidos na base auxiliar (usado o primeiro)")
+    if detalhes:
+        avisos.append(("info", "ℹ️ " + "; ".join(detalhes) + "."))
+    return avisos
+
+
+def cruzar_base_auxiliar(df, df_aux):
+    """Cruza `df` com a base validadora já lida (monta o índice em memória)."""
+    return cruzar_por_indice_ean(df, construir_indice_ean(df_aux))
+
+
+# ----------------------------
+# Diagnóstico de desempenho (tempo e memória por etapa)
+# ----------------------------
+LOGGER = logging.getLogger("validador_mapeio")
+
+
+def configurar_log_json(destino=None):
+    """Envia os registros de diagnóstico (uma linha JSON cada) para `destino`.
+
+    `destino` é um caminho de arquivo (acrescenta ao final) ou None para stderr.
+    Chamar de novo com o mesmo destino não duplica as linhas.
+    """
+    nome = destino or "<stderr>"
+    if any(getattr(h, "_destino_mapeio", None) == nome for h in LOGGER.handlers):
+        return
+    handler = logging.FileHandler(destino, encoding="utf-8") if destino else logging.StreamHandler()
+    handler._destino_mapeio = nome
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    LOGGER.addHandler(handler)
+    LOGGER.setLevel(logging.INFO)
+
+
+def novo_diagnostico(medir_memoria=True, **contexto):
+    """Coletor passado a `processar_dataframe` (e a `etapa`) para registrar as etapas.
+
+    `medir_memoria` liga o tracemalloc, que deixa o processamento um pouco mais
+    lento. `contexto` (ex.: arquivo=...) é repetido em cada linha do log JSON.
+    """
+    return {"etapas": [], "regras_peso": {}, "medir_memoria": medir_memoria, "contexto": contexto}
+
+
+@contextmanager
+def etapa(diagnostico, nome, **detalhes):
+    """Mede tempo e pico de memória do bloco e acrescenta em `diagnostico["etapas"]`.
+
+    Com `diagnostico` None não faz nada. Cada etapa também é registrada como uma
+    linha JSON no logger `validador_mapeio`. O pico de memória é o quanto o bloco
+    alocou (tracemalloc: Python e NumPy; leitores nativos como o calamine não
+    entram) acima do que já estava em uso quando começou.
+    """
+    if diagnostico is None:
+        yield
+        return
+    medir_memoria = diagnostico["medir_memoria"]
+    iniciou_tracemalloc = False
+    if medir_memoria:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            iniciou_tracemalloc = True
+        _registrar_pico_memoria()
+        tracemalloc.reset_peak()
+        memoria_inicial, _ = tracemalloc.get_traced_memory()
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registro = {"etapa": nome, "segundos": round(time.perf_counter() - inicio, 4)}
+        if medir_memoria:
+            _, pico = tracemalloc.get_traced_memory()
+            registro["pico_memoria_mb"] = round((pico - memoria_inicial) / 1024 ** 2, 1)
+            _registrar_pico_memoria()
+            if iniciou_tracemalloc:
+                tracemalloc.stop()
+        registro.update(detalhes)
+        diagnostico["etapas"].append(registro)
+        LOGGER.info(json.dumps({"evento": "etapa", **diagnostico["contexto"], **registro}, ensure_ascii=False))
+
+
+# Medições de `medir_pico_memoria` em andamento (atualizadas antes de cada reset do pico)
+_MEDICOES_PICO = []
+
+
+def _registrar_pico_memoria():
+    if _MEDICOES_PICO and tracemalloc.is_tracing():
+        pico = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 1)
+        for registro in _MEDICOES_PICO:
+            registro["pico_memoria_mb"] = max(registro["pico_memoria_mb"], pico)
+
+
+@contextmanager
+def medir_pico_memoria(diagnostico=None):
+    """Mede o pico de memória (tracemalloc: Python e NumPy) do bloco inteiro.
+
+    O resultado fica em `["pico_memoria_mb"]` do dict devolvido, que é o próprio
+    `diagnostico` se informado. As etapas medidas dentro do bloco não atrapalham
+    a medição total.
+    """
+    registro = {} if diagnostico is None else diagnostico
+    registro["pico_memoria_mb"] = 0.0
+    iniciou_tracemalloc = not tracemalloc.is_tracing()
+    if iniciou_tracemalloc:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    _MEDICOES_PICO.append(registro)
+    try:
+        yield registro
+    finally:
+        _registrar_pico_memoria()
+        _MEDICOES_PICO[:] = [outro for outro in _MEDICOES_PICO if outro is not registro]
+        if iniciou_tracemalloc:
+            tracemalloc.stop()
+
+
+def registrar_regras_peso(diagnostico, regras):
+    """Soma em `diagnostico["regras_peso"]` quantas linhas cada regra de REGRAS_PESO resolveu."""
+    if diagnostico is None:
+        return
+    contagem = regras.fillna("sem_resultado").value_counts()
+    for nome in [nome for nome, _, _ in REGRAS_PESO] + ["sem_resultado"]:
+        diagnostico["regras_peso"][nome] = diagnostico["regras_peso"].get(nome, 0) + int(contagem.get(nome, 0))
+    LOGGER.info(json.dumps({"evento": "regras_peso", **diagnostico["contexto"], **diagnostico["regras_peso"]},
+                           ensure_ascii=False))
+
+
+def tabela_diagnostico(diagnostico):
+    """(etapas, regras) como DataFrames para exibição."""
+    etapas = pd.DataFrame(diagnostico["etapas"])
+    if "linhas" in etapas.columns:
+        etapas["linhas"] = etapas["linhas"].astype("Int64")
+    regras = pd.DataFrame(
+        list(diagnostico["regras_peso"].items()), columns=["Regra", "Descrições resolvidas"]
+    )
+    return etapas, regras
+
+
+# ----------------------------
+# Progresso e cancelamento
+# ----------------------------
+# `progresso` é um callable opcional progresso(etapa, feito, total), chamado no
+# início, ao longo e no fim das etapas longas (total None quando desconhecido).
+# Para cancelar, o próprio callable levanta ProcessamentoCancelado, que
+# interrompe o processamento no próximo aviso.
+LINHAS_POR_AVISO_PROGRESSO = 100_000
+
+
+class ProcessamentoCancelado(Exception):
+    """Processamento interrompido a pedido (levantada pelo callback de progresso)."""
+
+
+def avisar_progresso(progresso, nome, feito, total=None):
+    if progresso is not None:
+        progresso(nome, feito, total)
+
+
+# ----------------------------
+# Pipeline completo
+# ----------------------------
+# Opções de `converter_numero` de cada coluna numérica (chaves de `mapear_colunas`)
+OPCOES_CONVERSAO = {
+    "preco": {},
+    "vendas": {"ponto_milhar": True},
+    "contenido": {"remover_texto": False},
+}
+
+
+def _converter_colunas(df, colunas, falhas, diagnostico=None):
+    """Converte preço, vendas e contenido; soma em `falhas` os valores não convertidos por coluna."""
+    with etapa(diagnostico, "conversao_numerica", linhas=len(df)):
+        falhas_conversao = normalizar_colunas_numericas(
+            df, {colunas[chave]: opcoes for chave, opcoes in OPCOES_CONVERSAO.items()}
+        )
+    for coluna, qtd in falhas_conversao.items():
+        falhas[coluna] = falhas.get(coluna, 0) + qtd
+
+
+def _aviso_falhas_conversao(falhas, avisos):
+    falhas = {coluna: qtd for coluna, qtd in falhas.items() if qtd}
+    if falhas:
+        avisos.append(("warning",
+            "⚠️ Valores que não puderam ser convertidos para número: "
+            + ", ".join(f"'{coluna}': {qtd}" for coluna, qtd in falhas.items())
+        ))
+
+
+def _preparar_dataframe(df, avisos, diagnostico=None, baixa_memoria=False):
+    """Mapeia as colunas, converte as numéricas e mantém só as linhas com venda.
+
+    O DataFrame de entrada não é alterado: os nomes e as colunas convertidas vão
+    para uma cópia rasa (os dados só são copiados no filtro das linhas com
+    venda). Com `baixa_memoria` (ver "Modo de baixa memória"), o próprio `df`
+    de entrada é podado e convertido in-place, sem cópia nenhuma.
+    """
+    if not baixa_memoria:
+        df = df.copy(deep=False)
+    normalizar_nomes_colunas(df)
+    colunas = mapear_colunas(df)
+    if baixa_memoria:
+        podar_colunas(df)
+
+    # Conversão das colunas numéricas (preço, vendas e contenido)
+    falhas_conversao = {}
+    _converter_colunas(df, colunas, falhas_conversao, diagnostico)
+    _aviso_falhas_conversao(falhas_conversao, avisos)
+    com_venda = (df[colunas["vendas"]] > 0).to_numpy()
+    if not baixa_memoria:
+        return df[com_venda].copy(), colunas
+
+    # `take` já devolve um DataFrame novo; se todas as linhas têm venda, nada é copiado
+    if not com_venda.all():
+        df = df.take(np.flatnonzero(com_venda))
+    for chave in ("categoria", "descricao"):
+        df[colunas[chave]] = df[colunas[chave]].astype("category")
+    return df, colunas
+
+
+def _validar_linhas(df, colunas, diagnostico=None, progresso=None, entradas_cache=None):
+    """Validações que só dependem da própria linha: peso da descrição e contenido.
+
+    `entradas_cache`: ver `extrair_peso_com_cache`.
+    """
+    with etapa(diagnostico, "extrair_peso", linhas=len(df)):
+        # Com `progresso`, em blocos de LINHAS_POR_AVISO_PROGRESSO para avisar (e poder cancelar) no meio
+        tamanho = LINHAS_POR_AVISO_PROGRESSO if progresso is not None else max(len(df), 1)
+        partes = []
+        for inicio in range(0, max(len(df), 1), tamanho):
+            avisar_progresso(progresso, "extrair_peso", inicio, len(df))
+            partes.append(extrair_peso_com_cache(df[colunas["descricao"]].iloc[inicio:inicio + tamanho],
+                                                 incluir_regra=diagnostico is not None,
+                                                 entradas_cache=entradas_cache))
+        pesos = pd.concat(partes) if len(partes) > 1 else partes[0]
+        avisar_progresso(progresso, "extrair_peso", len(df), len(df))
+        resultado = pesos[["QtdEmbalagem", "QtdEmbalagemGramas"]].copy()
+    if diagnostico is not None:
+        registrar_regras_peso(diagnostico, pesos["RegraPeso"])
+    with etapa(diagnostico, "validar_contenido", linhas=len(df)):
+        resultado["ValidacaoContenido"] = comparar_contenido(
+            resultado["QtdEmbalagemGramas"], df[colunas["contenido"]]
+        )
+    return resultado
+
+
+def _cruzar_ean(df, df_aux, indice_ean, avisos, diagnostico=None, progresso=None, copiar=True):
+    if indice_ean is None and df_aux is None:
+        return df
+    avisar_progresso(progresso, "cruzamento_ean", 0, len(df))
+    with etapa(diagnostico, "cruzamento_ean", linhas=len(df)):
+        if indice_ean is None:
+            indice_ean = construir_indice_ean(df_aux)
+        df_final, avisos_ean = cruzar_por_indice_ean(df, indice_ean, copiar=copiar)
+    avisar_progresso(progresso, "cruzamento_ean", len(df), len(df))
+    avisos.extend(avisos_ean)
+    return df_final
+
+
+# ----------------------------
+# Modo de baixa memória
+# ----------------------------
+# Com `baixa_memoria=True`, `processar_dataframe` descarta logo no início as
+# colunas que a validação e o cruzamento não usam, guarda subcategoria e
+# descrição como `category`, filtra as linhas sem venda sem a cópia defensiva e
+# anexa as colunas da base validadora no próprio DataFrame. No fim, os status
+# viram `category` (códigos int8 sobre CATEGORIAS_STATUS; a tela e a exportação
+# mostram os rótulos de sempre) e as colunas numéricas são reduzidas ao menor
+# tipo que guarda os mesmos valores. O DataFrame de entrada é reaproveitado.
+CATEGORIAS_STATUS = ["OK", "PROBLEMA", "OUTLIER", "OUTLIER_MEDIANA", "RISCO"]
+
+
+def podar_colunas(df):
+    """Remove in-place as colunas (já normalizadas) fora de `colunas_necessarias_principal`."""
+    necessarias = colunas_necessarias_principal()
+    df.drop(columns=[c for c in df.columns if c not in necessarias], inplace=True)
+    return df
+
+
+def reduzir_tipos_numericos(df):
+    """Inteiros para o menor tipo inteiro e float64 para float32 quando nenhum valor muda (in-place)."""
+    for coluna in df.columns:
+        serie = df[coluna]
+        if pd.api.types.is_bool_dtype(serie) or not pd.api.types.is_numeric_dtype(serie):
+            continue
+        if pd.api.types.is_integer_dtype(serie):
+            df[coluna] = pd.to_numeric(serie, downcast="integer")
+        elif serie.dtype == np.float64:
+            reduzida = serie.to_numpy().astype(np.float32)
+            if np.array_equal(reduzida.astype(np.float64), serie.to_numpy(), equal_nan=True):
+                df[coluna] = reduzida
+    return df
+
+
+def compactar_resultado(df):
+    """Status e QtdEmbalagem como `category` e colunas numéricas reduzidas (in-place)."""
+    for coluna in COLUNAS_STATUS:
+        df[coluna] = pd.Categorical(df[coluna], categories=CATEGORIAS_STATUS)
+    df["QtdEmbalagem"] = df["QtdEmbalagem"].astype("category")
+    return reduzir_tipos_numericos(df)
+
+
+# ----------------------------
+# Execução paralela por subcategoria
+# ----------------------------
+# As faixas de preço só dependem da própria subcategoria e a extração de peso só
+# da própria linha, então cada partição (um conjunto de subcategorias inteiras)
+# é validada num processo separado. Abaixo de MIN_LINHAS_PARALELO o custo de
+# enviar os dados aos processos não compensa.
+MIN_LINHAS_PARALELO = 100_000
+
+
+def particionar_por_categoria(categorias, n_partes):
+    """Distribui as subcategorias em até `n_partes` partições de tamanho parecido.
+
+    Maiores primeiro, sempre para a partição mais vazia (linhas sem subcategoria
+    contam como um grupo). Retorna o número da partição de cada linha.
+    """
+    codigos, _ = pd.factorize(categorias, use_na_sentinel=False)
+    tamanhos = np.bincount(codigos)
+    n_partes = max(1, min(n_partes, len(tamanhos)))
+    carga = np.zeros(n_partes, dtype=np.int64)
+    particao_grupo = np.empty(len(tamanhos), dtype=np.int64)
+    for grupo in np.argsort(-tamanhos, kind="stable"):
+        destino = int(np.argmin(carga))
+        particao_grupo[grupo] = destino
+        carga[destino] += tamanhos[grupo]
+    return particao_grupo[codigos]
+
+
+def _validar_particao(df, colunas, incluir_regra=False, faixas_referencia=None):
+    """Validações de uma partição (subcategorias inteiras), rodada num processo do pool.
+
+    O cache de pesos só é lido aqui; as descrições processadas voltam para o
+    processo principal gravar. Retorna (colunas derivadas, acertos por regra de
+    peso ou None, entradas para `gravar_cache_peso`).
+    """
+    diagnostico = novo_diagnostico(medir_memoria=False) if incluir_regra else None
+    entradas_cache = []
+    resultado = _validar_linhas(df, colunas, diagnostico, entradas_cache=entradas_cache)
+    precos = validar_precos(df, colunas["preco"], colunas["categoria"], faixas_referencia=faixas_referencia)
+    resultado[["ValidacionPrecio", "ValidacionPrecioMediana"]] = precos
+    resultado["StatusGeral"] = calcular_status_geral(resultado)
+    return resultado, diagnostico["regras_peso"] if incluir_regra else None, entradas_cache
+
+
+def validar_em_paralelo(df, colunas, processos, diagnostico=None, progresso=None, faixas_referencia=None):
+    """Extração de peso, contenido, validações de preço e status em `processos` processos.
+
+    Retorna as colunas derivadas na ordem original das linhas de `df`. `progresso`
+    recebe as subcategorias das partições já concluídas; se cancelar, as
+    partições que ainda não começaram são descartadas. `faixas_referencia` vai
+    para `validar_precos` de cada partição. Os processos só leem o cache de
+    pesos; as descrições novas são gravadas aqui, numa transação só.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    manter = list(dict.fromkeys(colunas[c] for c in ("descricao", "contenido", "preco", "categoria")))
+    base = df[manter].reset_index(drop=True)
+    particoes = particionar_por_categoria(base[colunas["categoria"]], processos)
+    partes = [base[particoes == i] for i in range(particoes.max() + 1)] if len(base) else []
+
+    grupos = [parte[colunas["categoria"]].nunique() for parte in partes]
+    resultados = []
+    avisar_progresso(progresso, "validacoes_paralelas", 0, sum(grupos))
+    executor = ProcessPoolExecutor(max_workers=max(1, len(partes)))
+    try:
+        for i, resultado in enumerate(executor.map(
+            _validar_particao, partes, [colunas] * len(partes), [diagnostico is not None] * len(partes),
+            [faixas_referencia] * len(partes)
+        )):
+            resultados.append(resultado)
+            avisar_progresso(progresso, "validacoes_paralelas", sum(grupos[:i + 1]), sum(grupos))
+    except BaseException:
+        # Cancelado (ou erro numa partição): não espera as partições restantes
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+    gravar_cache_peso([entrada for _, _, entradas in resultados for entrada in entradas])
+    if diagnostico is not None:
+        for _, regras_peso, _ in resultados:
+            for nome, qtd in regras_peso.items():
+                diagnostico["regras_peso"][nome] = diagnostico["regras_peso"].get(nome, 0) + qtd
+        LOGGER.info(json.dumps({"evento": "regras_peso", **diagnostico["contexto"], **diagnostico["regras_peso"]},
+                               ensure_ascii=False))
+
+    if not resultados:
+        resultados = [_validar_particao(base, colunas, faixas_referencia=faixas_referencia)]
+    resultado = pd.concat([parte for parte, _, _ in resultados]).sort_index()
+    resultado.index = df.index
+    return resultado
+
+
+# Backends de `processar_dataframe`: "polars" (`validador_polars`) roda a mesma
+# validação numa consulta lazy do Polars e precisa dos pacotes polars e pyarrow.
+BACKENDS = ["pandas", "polars"]
+POLARS_DISPONIVEL = all(importlib.util.find_spec(pacote) for pacote in ("polars", "pyarrow"))
+
+
+def processar_dataframe(df, df_aux=None, indice_ean=None, diagnostico=None, processos=None, progresso=None,
+                        backend="pandas", baixa_memoria=False, faixas_referencia=None):
+    """Roda todas as validações sobre o arquivo bruto já lido.
+
+    A base validadora pode vir já indexada (`indice_ean`, de `carregar_indice_ean`)
+    ou como DataFrame (`df_aux`). Com `diagnostico` (de `novo_diagnostico`),
+    registra tempo/memória de cada etapa e os acertos de cada regra de peso. Com
+    `processos` > 1 e pelo menos MIN_LINHAS_PARALELO linhas, as validações rodam
+    em paralelo por subcategoria (`validar_em_paralelo`), limitado ao número de
+    núcleos. `progresso` é chamado ao longo das etapas (ver `avisar_progresso`).
+    `backend` é um de BACKENDS. Com `baixa_memoria`, ver "Modo de baixa
+    memória" (o resultado só tem as colunas usadas e `df` é alterado in-place;
+    sem ele, `df` não é alterado). Com `faixas_referencia` (índice
+    de `carregar_indice_faixas`), os preços são validados contra as faixas de
+    referência (ver "Índice de referência de faixas de preço"; no backend polars,
+    as colunas de preço são refeitas sobre o resultado). Retorna (df_final, colunas, avisos), onde
+    `colunas` é o mapeamento resolvido por `mapear_colunas`. Levanta
+    ColunasFaltandoError (e ProcessamentoCancelado, vinda de `progresso`).
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend inválido: {backend}. Use um de: {', '.join(BACKENDS)}.")
+    if backend == "polars":
+        if not POLARS_DISPONIVEL:
+            raise ValueError("O backend polars requer os pacotes polars e pyarrow.")
+        from validador_polars import processar_dataframe_polars
+        if baixa_memoria:
+            podar_colunas(normalizar_nomes_colunas(df))
+        df_final, colunas, avisos = processar_dataframe_polars(df, df_aux, indice_ean, diagnostico, progresso)
+        if faixas_referencia is not None:
+            with etapa(diagnostico, "validar_precos_referencia", linhas=len(df_final)):
+                df_final[["ValidacionPrecio", "ValidacionPrecioMediana"]] = validar_precos(
+                    df_final, colunas["preco"], colunas["categoria"], progresso, faixas_referencia["faixas"]
+                )
+                df_final["StatusGeral"] = calcular_status_geral(df_final)
+            avisos.extend(avisos_faixas_referencia(df_final, colunas["categoria"], faixas_referencia))
+        if baixa_memoria:
+            with etapa(diagnostico, "compactar_resultado", linhas=len(df_final)):
+                compactar_resultado(df_final)
+        return df_final, colunas, avisos
+
+    avisos = []
+    df, colunas = _preparar_dataframe(df, avisos, diagnostico, baixa_memoria)
+    faixas = None
+    if faixas_referencia is not None:
+        faixas = faixas_referencia["faixas"]
+        avisos.extend(avisos_faixas_referencia(df, colunas["categoria"], faixas_referencia))
+
+    processos = min(processos or 1, os.cpu_count() or 1)
+    if processos > 1 and len(df) >= MIN_LINHAS_PARALELO:
+        with etapa(diagnostico, "validacoes_paralelas", linhas=len(df), processos=processos):
+            df[COLUNAS_DERIVADAS] = validar_em_paralelo(df, colunas, processos, diagnostico, progresso, faixas)
+        return _finalizar(df, colunas, df_aux, indice_ean, avisos, diagnostico, progresso, baixa_memoria)
+
+    # Processamento principal
+    df[["QtdEmbalagem", "QtdEmbalagemGramas", "ValidacaoContenido"]] = _validar_linhas(
+        df, colunas, diagnostico, progresso
+    )
+
+    # Validações de preço
+    with etapa(diagnostico, "validar_precos", linhas=len(df)):
+        df[["ValidacionPrecio", "ValidacionPrecioMediana"]] = validar_precos(
+            df, colunas["preco"], colunas["categoria"], progresso, faixas
+        )
+        df["StatusGeral"] = calcular_status_geral(df)
+
+    return _finalizar(df, colunas, df_aux, indice_ean, avisos, diagnostico, progresso, baixa_memoria)
+
+
+def _finalizar(df, colunas, df_aux, indice_ean, avisos, diagnostico, progresso, baixa_memoria):
+    """Cruzamento por EAN e, no modo de baixa memória, compactação do resultado."""
+    df_final = _cruzar_ean(df, df_aux, indice_ean, avisos, diagnostico, progresso, copiar=not baixa_memoria)
+    if baixa_memoria:
+        with etapa(diagnostico, "compactar_resultado", linhas=len(df_final)):
+            compactar_resultado(df_final)
+    return df_final, colunas, avisos
+
+
+def validar(df, df_aux=None, indice_ean=None, diagnostico=None, processos=None, progresso=None, backend="pandas",
+            baixa_memoria=False, faixas_referencia=None):
+    """Pipeline completo: DataFrame bruto -> linhas anotadas + resumo.
+
+    Mesmos parâmetros de `processar_dataframe`. Retorna um dict com `df` (linhas
+    com venda e as colunas de validação), `resumo` (tabela da aba Resumo),
+    `metricas` (de `calcular_metricas_resumo`), `colunas` e `avisos`.
+    Levanta ColunasFaltandoError.
+    """
+    df_final, colunas, avisos = processar_dataframe(df, df_aux, indice_ean, diagnostico, processos, progresso,
+                                                    backend, baixa_memoria, faixas_referencia)
+    metricas = calcular_metricas_resumo(df_final, colunas["vendas"])
+    return {
+        "df": df_final,
+        "resumo": tabela_resumo(metricas),
+        "metricas": metricas,
+        "colunas": colunas,
+        "avisos": avisos,
+    }
+
+
+def validar_arquivo(arquivo, base_auxiliar=None, nome=None, somente_necessarias=False, **opcoes):
+    """Lê o arquivo principal (e a base validadora, se informada) e roda `validar`.
+
+    `arquivo`/`base_auxiliar` são caminhos ou file-likes (xlsx ou csv; informe
+    `nome` para file-likes sem nome). `arquivo` também pode ser uma lista, validada
+    como um arquivo só (ver `ler_arquivos_principais`; `nome` vira a lista de
+    nomes). `opcoes` vão para `validar`. Os avisos da leitura vêm antes dos do
+    processamento. Com `baixa_memoria=True` em `opcoes`, só as colunas
+    necessárias são lidas.
+    """
+    somente_necessarias = somente_necessarias or opcoes.get("baixa_memoria", False)
+    avisos = []
+    if isinstance(arquivo, (list, tuple)):
+        df, avisos = ler_arquivos_principais(arquivo, nome, somente_necessarias=somente_necessarias)
+    else:
+        df = ler_arquivo_principal(arquivo, nome, somente_necessarias=somente_necessarias)
+    if base_auxiliar is not None:
+        opcoes["indice_ean"], avisos_aux = carregar_indice_ean(base_auxiliar)
+        avisos.extend(avisos_aux)
+    resultado = validar(df, **opcoes)
+    resultado["avisos"] = avisos + resultado["avisos"]
+    return resultado
+
+
+# ----------------------------
+# Revalidação incremental (arquivo corrigido x último processamento)
+# ----------------------------
+VERSAO_RESULTADO_ANTERIOR = 1
+MAX_RESULTADOS_ANTERIORES = 20
+
+
+def codigos_ean_linhas(df):
+    """EAN normalizado de cada linha (0 sem EAN válido ou sem coluna de EAN)."""
+    col_ean = encontrar_coluna(df.columns, POSSIVEIS_EAN_DF)
+    if col_ean is None:
+        return np.zeros(len(df), dtype=np.int64)
+    return normalizar_ean(df[col_ean])[0]
+
+
+def chaves_linhas(df, colunas, hashes=None, codigos=None):
+    """Chave estável (uint64) de cada linha: EAN normalizado (ou a descrição, sem EAN) + ocorrência.
+
+    A ocorrência (1ª, 2ª... linha com o mesmo EAN) separa códigos repetidos no
+    arquivo. Com `hashes` (um por linha), o conteúdo também entra na chave.
+    `codigos` evita normalizar o EAN de novo (ver `codigos_ean_linhas`).
+    """
+    codigos = codigos_ean_linhas(df) if codigos is None else codigos
+    sem_ean = codigos == 0
+    descricoes = np.full(len(df), "", dtype=object)
+    if sem_ean.any():
+        descricoes[sem_ean] = df[colunas["descricao"]][sem_ean].astype(str).str.upper().str.strip().to_numpy()
+    partes = {"ean": codigos, "descricao": descricoes}
+    if hashes is not None:
+        partes["conteudo"] = hashes
+    base = pd.util.hash_pandas_object(pd.DataFrame(partes), index=False).to_numpy()
+    ocorrencia = pd.Series(base).groupby(base, sort=False).cumcount().to_numpy()
+    return pd.util.hash_pandas_object(pd.DataFrame({"base": base, "ocorrencia": ocorrencia}), index=False).to_numpy()
+
+
+def _linhas_mudaram(antes, depois):
+    """True onde algum dos status difere (NaN igual a NaN)."""
+    return (antes.astype(object).fillna("").to_numpy() != depois.astype(object).fillna("").to_numpy()).any(axis=1)
+
+
+def listar_mudancas(df_anterior, df_novo, colunas, codigos=(None, None)):
+    """Linhas novas, removidas ou com algum status diferente entre dois resultados.
+
+    Retorna um DataFrame com o EAN (se houver), a descrição, a subcategoria,
+    `Situacao` (NOVA, REMOVIDA ou ALTERADA) e `<status>_anterior`/`<status>`
+    de cada coluna de COLUNAS_STATUS. `codigos` são os EANs já normalizados
+    (anterior, novo), se houver.
+    """
+    col_ean = encontrar_coluna(df_novo.columns, POSSIVEIS_EAN_DF)
+    identificacao = ([col_ean] if col_ean is not None else []) + [colunas["descricao"], colunas["categoria"]]
+    posicao = pd.Index(chaves_linhas(df_anterior, colunas, codigos=codigos[0])).get_indexer(
+        chaves_linhas(df_novo, colunas, codigos=codigos[1])
+    )
+    casadas = posicao >= 0
+    removidas = np.ones(len(df_anterior), dtype=bool)
+    removidas[posicao[casadas]] = False
+
+    status_anterior = df_anterior[COLUNAS_STATUS].iloc[np.where(casadas, posicao, 0)].set_axis(df_novo.index)
+    status_anterior = status_anterior.where(pd.Series(casadas, index=df_novo.index), axis=0)
+    mudou = ~casadas | _linhas_mudaram(status_anterior, df_novo[COLUNAS_STATUS])
+
+    partes = [
+        df_novo.loc[mudou, identificacao].assign(
+            Situacao=np.where(casadas[mudou], "ALTERADA", "NOVA"),
+            **status_anterior.loc[mudou].add_suffix("_anterior"),
+            **df_novo.loc[mudou, COLUNAS_STATUS],
+        ),
+        df_anterior.loc[removidas, identificacao].assign(
+            Situacao="REMOVIDA",
+            **df_anterior.loc[removidas, COLUNAS_STATUS].add_suffix("_anterior"),
+            **{coluna: np.nan for coluna in COLUNAS_STATUS},
+        ),
+    ]
+    ordem = identificacao + ["Situacao"] + [c for col in COLUNAS_STATUS for c in (col + "_anterior", col)]
+    partes = [parte[ordem] for parte in partes if not parte.empty]
+    if not partes:
+        return pd.DataFrame(columns=ordem)
+    return pd.concat(partes, ignore_index=True)
+
+
+def revalidar_incremental(df, df_anterior, colunas_anterior, df_aux=None, indice_ean=None, diagnostico=None,
+                          progresso=None):
+    """Igual a `processar_dataframe`, mas reaproveita o último resultado do mesmo arquivo.
+
+    As linhas são casadas por `chaves_linhas`; só as novas ou alteradas passam
+    por `extrair_peso`/contenido, e as faixas de preço só são recalculadas nas
+    subcategorias que tiveram linhas incluídas, removidas ou alteradas. O
+    resultado é o mesmo do processamento completo. Se o último resultado não
+    servir (colunas diferentes), processa tudo.
+
+    Retorna (df_final, colunas, avisos, mudancas), com `mudancas` de `listar_mudancas`.
+    """
+    avisos = []
+    df, colunas = _preparar_dataframe(df, avisos, diagnostico)
+    colunas_entrada = list(df.columns)
+    if (colunas != colunas_anterior or df_anterior.empty
+            or not set(colunas_entrada + COLUNAS_DERIVADAS) <= set(df_anterior.columns)):
+        avisos.append(("info", "ℹ️ O último processamento tem outras colunas; o arquivo foi validado por completo."))
+        df_final, colunas, avisos_completo = processar_dataframe(df, df_aux, indice_ean, diagnostico,
+                                                                 progresso=progresso)
+        return df_final, colunas, avisos + avisos_completo, listar_mudancas(df_anterior, df_final, colunas)
+
+    with etapa(diagnostico, "comparacao_incremental", linhas=len(df)):
+        # Hash do conteúdo de entrada de cada linha (concatenado para igualar os dtypes)
+        hashes = pd.util.hash_pandas_object(
+            pd.concat([df[colunas_entrada], df_anterior[colunas_entrada]], ignore_index=True), index=False
+        ).to_numpy()
+        codigos_novos, codigos_anteriores = codigos_ean_linhas(df), codigos_ean_linhas(df_anterior)
+        chaves_novas = chaves_linhas(df, colunas, hashes[:len(df)], codigos_novos)
+        chaves_anteriores = chaves_linhas(df_anterior, colunas, hashes[len(df):], codigos_anteriores)
+
+        # Linha inalterada = mesma chave e mesmo conteúdo de alguma linha anterior
+        posicao_anterior = pd.Index(chaves_anteriores).get_indexer(chaves_novas)
+        inalteradas = posicao_anterior >= 0
+        reaproveitadas = np.zeros(len(df_anterior), dtype=bool)
+        reaproveitadas[posicao_anterior[inalteradas]] = True
+
+        # Subcategorias tocadas: com linha nova/alterada agora ou removida/alterada antes
+        categoria = colunas["categoria"]
+        tocadas = pd.concat([df[categoria][~inalteradas], df_anterior[categoria][~reaproveitadas]]).unique()
+        recalcular = df[categoria].isin(tocadas).to_numpy() | ~inalteradas
+
+    for coluna in COLUNAS_DERIVADAS[:-1]:
+        df[coluna] = pd.Series(df_anterior[coluna].to_numpy()[np.where(inalteradas, posicao_anterior, 0)],
+                               index=df.index, dtype=df_anterior[coluna].dtype)
+    if (~inalteradas).any():
+        df.loc[~inalteradas, ["QtdEmbalagem", "QtdEmbalagemGramas", "ValidacaoContenido"]] = \
+            _validar_linhas(df[~inalteradas], colunas, diagnostico, progresso)
+    with etapa(diagnostico, "validar_precos", linhas=int(recalcular.sum())):
+        if recalcular.any():
+            df.loc[recalcular, ["ValidacionPrecio", "ValidacionPrecioMediana"]] = \
+                validar_precos(df[recalcular], colunas["preco"], categoria, progresso)
+        df["StatusGeral"] = calcular_status_geral(df)
+
+    avisos.append(("info",
+        f"♻️ Revalidação incremental: {int((~inalteradas).sum())} linhas novas ou alteradas, "
+        f"{int((~reaproveitadas).sum())} do processamento anterior descartadas; faixas de preço recalculadas em "
+        f"{len(pd.Series(tocadas).dropna())} de {df[categoria].nunique()} subcategorias."
+    ))
+    df_final = _cruzar_ean(df, df_aux, indice_ean, avisos, diagnostico, progresso)
+    mudancas = listar_mudancas(df_anterior, df_final, colunas, (codigos_anteriores, codigos_novos))
+    return df_final, colunas, avisos, mudancas
+
+
+def _caminho_resultado_anterior(identificador, pasta_cache=None):
+    nome = hashlib.sha256(str(identificador).encode("utf-8")).hexdigest()
+    return os.path.join(pasta_cache or CACHE_PESO_DIR, f"resultado_{nome}.pkl")
+
+
+def salvar_resultado_anterior(identificador, df_final, colunas, pasta_cache=None):
+    """Guarda o resultado para a próxima `revalidar_incremental` do mesmo arquivo (ex.: caminho)."""
+    caminho = _caminho_resultado_anterior(identificador, pasta_cache)
+    try:
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        pd.to_pickle({
+            "versao": VERSAO_RESULTADO_ANTERIOR,
+            "assinatura_regras": _assinatura_regras_peso(),
+            "df_final": df_final,
+            "colunas": colunas,
+        }, caminho)
+        antigos = sorted(glob.glob(os.path.join(os.path.dirname(caminho), "resultado_*.pkl")),
+                         key=os.path.getmtime)
+        for antigo in antigos[:-MAX_RESULTADOS_ANTERIORES]:
+            os.remove(antigo)
+    except OSError:
+        pass
+
+
+def carregar_resultado_anterior(identificador, pasta_cache=None):
+    """(df_final, colunas) do último processamento, ou None se não houver/for de outra versão das regras."""
+    try:
+        salvo = pd.read_pickle(_caminho_resultado_anterior(identificador, pasta_cache))
+    except (OSError, ValueError, EOFError, pickle.UnpicklingError, AttributeError):
+        return None
+    if salvo.get("versao") != VERSAO_RESULTADO_ANTERIOR or salvo.get("assinatura_regras") != _assinatura_regras_peso():
+        return None
+    return salvo["df_final"], salvo["colunas"]
+
+
+# ----------------------------
+# Validação em blocos (arquivos maiores que a memória)
+# ----------------------------
+# Dois passos sobre o CSV: o primeiro monta, por subcategoria, um sketch de
+# quantis dos preços; o segundo valida bloco a bloco contra as faixas estimadas
+# e grava cada bloco direto no zip de saída. A memória depende do tamanho do
+# bloco e do número de subcategorias, não do número de linhas.
+#
+# O sketch arredonda cada preço para o representante do seu balde logarítmico
+# (balde k = (γ^(k-1), γ^k], γ = (1+α)/(1-α), representante 2γ^k/(γ+1)), que fica
+# a no máximo α (ERRO_RELATIVO_SKETCH) do preço. Como o arredondamento preserva a
+# ordem, cada estatística de ordem estimada fica a no máximo α da exata, e a
+# interpolação linear do `quantile` do pandas também: os quantis 2/3/5/95/97/98%
+# e a mediana de cada subcategoria ficam a no máximo α (relativo) dos usados por
+# `validar_precio_por_categoria`/`validar_precio_mediana` no arquivo inteiro.
+# `n` (que escolhe os quantis) é exato. Logo uma linha só pode ser marcada
+# diferente do processamento completo se o preço estiver a menos de α de um
+# limite da faixa. Somar sketches de blocos diferentes dá o mesmo resultado que
+# o sketch do arquivo inteiro.
+ERRO_RELATIVO_SKETCH = 0.001
+TAMANHO_BLOCO_STREAMING = 200_000
+
+
+def novo_sketch_precos(erro_relativo=ERRO_RELATIVO_SKETCH):
+    """Sketch vazio: `tamanho` (linhas por subcategoria) e `contagens` por (subcategoria, representante)."""
+    return {"erro_relativo": erro_relativo, "tamanho": None, "contagens": None}
+
+
+def representantes_sketch(precos, erro_relativo=ERRO_RELATIVO_SKETCH):
+    """Representante do balde de cada preço (NaN continua NaN, zero continua zero)."""
+    gamma = (1 + erro_relativo) / (1 - erro_relativo)
+    precos = np.asarray(precos, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        k = np.ceil(np.log(np.abs(precos)) / np.log(gamma))
+        representantes = np.sign(precos) * 2 * gamma ** k / (gamma + 1)
+    representantes[precos == 0] = 0.0
+    return representantes
+
+
+def _somar_contagens(atual, parcial, niveis):
+    if atual is None:
+        return parcial
+    return pd.concat([atual, parcial]).groupby(level=niveis).sum()
+
+
+def atualizar_sketch(sketch, precos, categorias):
+    """Acrescenta ao sketch os preços de um bloco (linhas sem subcategoria são ignoradas)."""
+    bloco = pd.DataFrame({
+        "categoria": categorias.to_numpy(),
+        "representante": representantes_sketch(precos, sketch["erro_relativo"]),
+    })
+    tamanho = bloco.groupby("categoria").size()
+    contagens = bloco.dropna().groupby(["categoria", "representante"]).size()
+    sketch["tamanho"] = _somar_contagens(sketch["tamanho"], tamanho, 0)
+    sketch["contagens"] = _somar_contagens(sketch["contagens"], contagens, [0, 1])
+    return sketch
+
+
+def combinar_sketches(*sketches):
+    """Junta sketches montados em separado (ex.: partes do arquivo lidas em paralelo)."""
+    combinado = novo_sketch_precos(sketches[0]["erro_relativo"])
+    for sketch in sketches:
+        if sketch["erro_relativo"] != combinado["erro_relativo"]:
+            raise ValueError("Sketches com erro relativo diferente não podem ser combinados.")
+        if sketch["tamanho"] is not None:
+            combinado["tamanho"] = _somar_contagens(combinado["tamanho"], sketch["tamanho"], 0)
+            combinado["contagens"] = _somar_contagens(combinado["contagens"], sketch["contagens"], [0, 1])
+    return combinado
+
+
+def faixas_do_sketch(sketch):
+    """Mesmo resultado de `calcular_faixas_preco`, com quantis e mediana estimados pelo sketch."""
+    if sketch["tamanho"] is None:
+        faixas = pd.DataFrame({"n": pd.Series(dtype="int64"), "mediana": pd.Series(dtype=float)})
+        return _montar_faixas(faixas, pd.DataFrame(columns=QUANTIS_FAIXAS, dtype=float))
+
+    contagens = sketch["contagens"]  # ordenado por (subcategoria, representante)
+    valores = contagens.index.get_level_values(1).to_numpy(dtype=float)
+    acumulado = contagens.to_numpy().cumsum()
+    m = contagens.groupby(level=0).sum()
+    inicio = (m.cumsum() - m).to_numpy()
+    m_valores = m.to_numpy()
+
+    def _valor(posto):
+        return valores[np.searchsorted(acumulado, inicio + posto, side="right")]
+
+    # Interpolação linear entre as estatísticas de ordem, como no `quantile` do pandas
+    estimativas = {}
+    for q in QUANTIS_FAIXAS + [0.5]:
+        h = (m_valores - 1) * q
+        inferior = np.floor(h).astype(np.int64)
+        superior = np.minimum(inferior + 1, m_valores - 1)
+        v_inf, v_sup = _valor(inferior), _valor(superior)
+        estimativas[q] = v_inf + (h - inferior) * (v_sup - v_inf)
+    tabela_quantis = pd.DataFrame(estimativas, index=m.index).reindex(sketch["tamanho"].index)
+
+    faixas = pd.DataFrame({"n": sketch["tamanho"], "mediana": tabela_quantis.pop(0.5)})
+    return _montar_faixas(faixas, tabela_quantis)
+
+
+def validar_csv_em_blocos(arquivo, destino, nome=None, df_aux=None, indice_ean=None,
+                          tamanho_bloco=TAMANHO_BLOCO_STREAMING, erro_relativo=ERRO_RELATIVO_SKETCH,
+                          somente_necessarias=False, diagnostico=None, progresso=None):
+    """Valida um CSV grande em dois passos, sem carregá-lo inteiro.
+
+    Grava em `destino` (caminho ou file-like) o mesmo zip de
+    `exportar_resultado(formato="csv")`: `detalhes.csv`, escrito bloco a bloco, e
+    `resumo.xlsx`. As faixas de preço vêm de `faixas_do_sketch` (ver o comentário
+    da seção sobre o erro máximo em relação ao processamento completo); as demais
+    validações e o cruzamento por EAN são idênticos aos de `processar_dataframe`.
+    `progresso` recebe as linhas lidas em cada passo.
+    Retorna (metricas, colunas, avisos), com `metricas` de `metricas_de_contagens`
+    mais `risco` (linhas com StatusGeral RISCO). Levanta ColunasFaltandoError.
+    """
+    if not _nome_arquivo(arquivo, nome).lower().endswith(".csv"):
+        raise ValueError("A validação em blocos só está disponível para arquivos CSV.")
+    colunas_texto = set(MAPA_COLUNAS["preco"] + MAPA_COLUNAS["vendas"] + MAPA_COLUNAS["contenido"]
+                        + MAPA_COLUNAS["categoria"])  # subcategoria como texto: mesmo tipo em todos os blocos
+    if indice_ean is None and df_aux is not None:
+        indice_ean = construir_indice_ean(df_aux)
+    avisos = []
+
+    # Passo 1: sketch dos preços por subcategoria (só das linhas com venda)
+    colunas = None
+    sketch = novo_sketch_precos(erro_relativo)
+    lidas = 0
+    with etapa(diagnostico, "sketch_precos"):
+        for bloco in ler_csv(arquivo, colunas_necessarias_principal(), tamanho_bloco, colunas_texto):
+            lidas += len(bloco)
+            avisar_progresso(progresso, "sketch_precos", lidas)
+            normalizar_nomes_colunas(bloco)
+            if colunas is None:
+                colunas = mapear_colunas(bloco)
+            normalizar_colunas_numericas(bloco, {colunas["preco"]: {}, colunas["vendas"]: {"ponto_milhar": True}})
+            bloco = bloco[bloco[colunas["vendas"]] > 0]
+            atualizar_sketch(sketch, bloco[colunas["preco"]], bloco[colunas["categoria"]])
+        if colunas is None:
+            raise ColunasFaltandoError(list(NOMES_COLUNAS.values()))
+        faixas = faixas_do_sketch(sketch)
+
+    # Passo 2: validação bloco a bloco, gravando os detalhes conforme avança
+    falhas_conversao = {}
+    cruzamento = {}
+    contagem = np.zeros(8, dtype=np.int64)
+    volume = np.zeros(8)
+    risco = 0
+    colunas_leitura = colunas_necessarias_principal() if somente_necessarias else None
+    with zipfile.ZipFile(destino, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        with etapa(diagnostico, "validacao_em_blocos"), zf.open("detalhes.csv", "w", force_zip64=True) as f:
+            texto = io.TextIOWrapper(f, encoding="utf-8-sig", newline="")
+            for i, bloco in enumerate(ler_csv(arquivo, colunas_leitura, tamanho_bloco, colunas_texto)):
+                avisar_progresso(progresso, "validacao_em_blocos", i * tamanho_bloco + len(bloco), lidas)
+                normalizar_nomes_colunas(bloco)
+                _converter_colunas(bloco, colunas, falhas_conversao)
+                bloco = bloco[bloco[colunas["vendas"]] > 0].copy()
+
+                pesos = extrair_peso_com_cache(bloco[colunas["descricao"]], incluir_regra=diagnostico is not None)
+                if diagnostico is not None:
+                    registrar_regras_peso(diagnostico, pesos["RegraPeso"])
+                bloco["QtdEmbalagem"] = pesos["QtdEmbalagem"]
+                bloco["QtdEmbalagemGramas"] = pesos["QtdEmbalagemGramas"]
+                bloco["ValidacaoContenido"] = comparar_contenido(bloco["QtdEmbalagemGramas"], bloco[colunas["contenido"]])
+                bloco["ValidacionPrecio"], bloco["ValidacionPrecioMediana"] = marcar_precos(
+                    bloco[colunas["preco"]], faixas.index.get_indexer(bloco[colunas["categoria"]]), faixas
+                )
+                bloco["StatusGeral"] = calcular_status_geral(bloco)
+                risco += int((bloco["StatusGeral"] == "RISCO").sum())
+
+                codigos = codigos_status(bloco)
+                contagem += np.bincount(codigos, minlength=8)
+                volume += np.bincount(codigos, weights=np.nan_to_num(bloco[colunas["vendas"]].to_numpy(dtype=float)),
+                                      minlength=8)
+
+                if indice_ean is not None:
+                    bloco, avisos_ean = cruzar_por_indice_ean(bloco, indice_ean, cruzamento)
+                    avisos.extend(aviso for aviso in avisos_ean if aviso not in avisos)
+                bloco.to_csv(texto, index=False, sep=";", decimal=",", header=i == 0)
+            texto.flush()
+            texto.detach()
+
+        metricas = metricas_de_contagens(contagem, volume)
+        metricas["risco"] = risco
+        with zf.open("resumo.xlsx", "w") as f:
+            to_excel_com_resumo(None, colunas["vendas"], f, incluir_detalhes=False, df_resumo=tabela_resumo(metricas))
+
+    _aviso_falhas_conversao(falhas_conversao, avisos)
+    if indice_ean is not None:
+        avisos.extend(avisos_cruzamento(cruzamento, indice_ean))
+    avisos.append(("info",
+        f"ℹ️ Arquivo validado em blocos de {tamanho_bloco} linhas: faixas de preço estimadas com erro "
+        f"máximo de {erro_relativo:.2%} nos quantis e na mediana de cada subcategoria."
+    ))
+    return metricas, colunas, avisos
+
+
+# ----------------------------
+# Índice de referência de faixas de preço
+# ----------------------------
+# Em vez de tirar quantis e mediana só das linhas do arquivo enviado (lento em
+# arquivos grandes e pouco confiável em arquivos parciais), os preços podem ser
+# validados contra faixas de referência montadas com processamentos anteriores.
+# O índice guarda, por subcategoria, o mesmo sketch de preços da validação em
+# blocos e as faixas já calculadas a partir dele (com `n` e a data da última
+# atualização). Como sketches se somam, acrescentar um arquivo aceito é somar o
+# sketch dele, e as faixas ficam a no máximo ERRO_RELATIVO_SKETCH das de
+# `calcular_faixas_preco` sobre todos os arquivos acrescentados juntos. Os
+# limites são alargados nesse mesmo erro (`_alargar_faixas`): preços repetidos
+# exatamente no limite (comuns em tabelas de preço) não viram outlier só pelo
+# arredondamento do sketch; só deixam de ser marcados os que estão a menos de
+# ERRO_RELATIVO_SKETCH fora da faixa exata. Na
+# validação, cada linha busca a faixa da sua subcategoria num único
+# `get_indexer`; subcategorias ainda sem referência usam as faixas do arquivo.
+# Os quantis da referência são escolhidos em FAIXAS_QUANTIL pelo `n` acumulado,
+# não pelo número de linhas do arquivo validado: a faixa mais estreita (5-95%)
+# existe porque quantis extremos de poucas linhas não são confiáveis, e aqui eles
+# são estimados com todas as linhas já acrescentadas. Por isso subcategorias
+# maduras usam 2-98% mesmo quando o arquivo traz poucas linhas delas.
+VERSAO_INDICE_FAIXAS = 1
+CAMINHO_INDICE_FAIXAS = os.path.join(CACHE_PESO_DIR, "faixas_referencia.pkl")
+
+
+def _chave_categoria(serie):
+    """Subcategoria como texto (mesma chave para arquivos lidos com tipos diferentes).
+
+    Códigos inteiros lidos como float (101.0, comum quando a coluna tem vazios)
+    viram "101", a mesma chave da leitura como inteiro.
+    """
+    serie = pd.Series(serie)
+    if isinstance(serie.dtype, pd.CategoricalDtype) and len(serie.cat.categories):
+        # Converte só as categorias e expande pelos códigos (modo de baixa memória)
+        rotulos = np.append(_chave_categoria(serie.cat.categories).to_numpy(dtype=object, na_value=None), None)
+        return pd.Series(rotulos[serie.cat.codes.to_numpy()], index=serie.index, dtype="string")
+    chave = serie.astype("string")
+    if pd.api.types.is_float_dtype(serie):
+        inteiros = (serie % 1 == 0) & (serie.abs() < 2 ** 53)
+        chave[inteiros] = serie[inteiros].astype("int64").astype("string")
+    return chave
+
+
+def novo_indice_faixas(erro_relativo=ERRO_RELATIVO_SKETCH):
+    """Índice vazio: sketch, faixas por subcategoria e dados já acrescentados (`origens`)."""
+    agora = pd.Timestamp.now().isoformat(timespec="seconds")
+    sketch = novo_sketch_precos(erro_relativo)
+    faixas = faixas_do_sketch(sketch)
+    faixas["atualizado_em"] = pd.Series(dtype=object)
+    return {
+        "versao": VERSAO_INDICE_FAIXAS,
+        "sketch": sketch,
+        "faixas": faixas,
+        "origens": {},
+        "construido_em": agora,
+        "atualizado_em": agora,
+    }
+
+
+def sketch_referencia(df, coluna_preco, coluna_categoria, erro_relativo=ERRO_RELATIVO_SKETCH):
+    """(assinatura, sketch) dos preços de um resultado, para `acrescentar_ao_indice_faixas`.
+
+    A assinatura identifica o conteúdo (preços e subcategorias), para o mesmo
+    arquivo não ser somado duas vezes. O sketch é pequeno e pode vir de outro
+    processo (ver `validar_lote`).
+    """
+    precos = df[coluna_preco]
+    if not pd.api.types.is_numeric_dtype(precos):
+        precos = converter_numero(precos)
+    categorias = _chave_categoria(df[coluna_categoria])
+    conteudo = pd.DataFrame({"preco": precos.to_numpy(dtype=float), "categoria": categorias.to_numpy()})
+    assinatura = hashlib.sha256(pd.util.hash_pandas_object(conteudo, index=False).to_numpy().tobytes()).hexdigest()
+    return assinatura, atualizar_sketch(novo_sketch_precos(erro_relativo), precos, categorias)
+
+
+def _alargar_faixas(faixas, erro_relativo):
+    for inf, sup in (("quantil_inf", "quantil_sup"), ("mediana_inf", "mediana_sup")):
+        faixas[inf] = faixas[inf] - erro_relativo * faixas[inf].abs()
+        faixas[sup] = faixas[sup] + erro_relativo * faixas[sup].abs()
+    return faixas
+
+
+def acrescentar_ao_indice_faixas(indice, assinatura, sketch, origem=None):
+    """Soma um sketch de `sketch_referencia` ao índice; False se esse conteúdo já estava nele."""
+    if assinatura in indice["origens"]:
+        return False
+    agora = pd.Timestamp.now().isoformat(timespec="seconds")
+    indice["sketch"] = combinar_sketches(indice["sketch"], sketch)
+    faixas = _alargar_faixas(faixas_do_sketch(indice["sketch"]), indice["sketch"]["erro_relativo"])
+    datas = indice["faixas"]["atualizado_em"].reindex(faixas.index)
+    if sketch["tamanho"] is not None:
+        datas[sketch["tamanho"].index] = agora
+    faixas["atualizado_em"] = datas
+    indice["faixas"] = faixas
+    linhas = int(sketch["tamanho"].sum()) if sketch["tamanho"] is not None else 0
+    indice["origens"][assinatura] = {"origem": origem, "linhas": linhas, "acrescentado_em": agora}
+    indice["atualizado_em"] = agora
+    return True
+
+
+def atualizar_indice_faixas(indice, df, coluna_preco, coluna_categoria, origem=None):
+    """Acrescenta ao índice os preços de um resultado aceito (ex.: `df_final` de `processar_dataframe`).
+
+    Retorna True se o índice mudou (False se o mesmo conteúdo já tinha sido acrescentado).
+    """
+    assinatura, sketch = sketch_referencia(df, coluna_preco, coluna_categoria, indice["sketch"]["erro_relativo"])
+    return acrescentar_ao_indice_faixas(indice, assinatura, sketch, origem)
+
+
+def salvar_indice_faixas(indice, caminho=None):
+    """Grava o índice (arquivo temporário + rename, para leitores nunca verem um arquivo pela metade)."""
+    caminho = caminho or CAMINHO_INDICE_FAIXAS
+    os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    pd.to_pickle(indice, temporario)
+    os.replace(temporario, caminho)
+
+
+def carregar_indice_faixas(caminho=None):
+    """Índice salvo por `salvar_indice_faixas`, ou None se não houver/for de outra versão."""
+    try:
+        indice = pd.read_pickle(caminho or CAMINHO_INDICE_FAIXAS)
+    except (OSError, ValueError, EOFError, pickle.UnpicklingError, AttributeError):
+        return None
+    if not isinstance(indice, dict) or indice.get("versao") != VERSAO_INDICE_FAIXAS:
+        return None
+    return indice
+
+
+def faixas_com_referencia(df, coluna_preco, coluna_categoria, faixas_referencia):
+    """Faixas de referência mais as do próprio `df` para as subcategorias ausentes da referência.
+
+    Retorna (faixas, categorias como texto, subcategorias sem referência).
+    """
+    categorias = _chave_categoria(df[coluna_categoria])
+    sem_referencia = (~categorias.isin(faixas_referencia.index) & categorias.notna()).to_numpy()
+    if not sem_referencia.any():
+        return faixas_referencia, categorias, []
+    proprias = calcular_faixas_preco(
+        pd.DataFrame({"preco": df[coluna_preco].to_numpy()[sem_referencia],
+                      "categoria": categorias.to_numpy()[sem_referencia]}),
+        "preco", "categoria",
+    )
+    return pd.concat([faixas_referencia, proprias]), categorias, list(proprias.index)
+
+
+def avisos_faixas_referencia(df, coluna_categoria, indice):
+    """Avisos da validação contra o índice: origem das faixas e subcategorias sem referência."""
+    categorias = _chave_categoria(df[coluna_categoria]).dropna().unique()
+    sem_referencia = [c for c in categorias if c not in indice["faixas"].index]
+    avisos = [("info",
+        f"📚 Preços validados contra o índice de referência ({len(indice['faixas'])} subcategorias, "
+        f"{len(indice['origens'])} arquivos, atualizado em {indice['atualizado_em']})."
+    )]
+    if sem_referencia:
+        exemplos = ", ".join(map(str, sem_referencia[:5])) + ("..." if len(sem_referencia) > 5 else "")
+        avisos.append(("warning",
+            f"⚠️ {len(sem_referencia)} subcategorias sem faixa de referência foram validadas com as faixas do "
+            f"próprio arquivo: {exemplos}"
+        ))
+    return avisos
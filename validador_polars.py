@@ -0,0 +1,379 @@
+"""Backend Polars da validação (opcional: requer os pacotes polars e pyarrow).
+
+Conversão numérica, extração de peso das descrições, faixas de preço por
+subcategoria, status e cruzamento por EAN rodam numa única consulta lazy do
+Polars (colunar sobre Arrow e multi-thread). O resultado tem as mesmas colunas
+de `processar_dataframe` (QtdEmbalagem, QtdEmbalagemGramas, ValidacaoContenido,
+ValidacionPrecio, ValidacionPrecioMediana, StatusGeral e as da base
+validadora), para comparar com o caminho pandas. Usado por
+`processar_dataframe(..., backend="polars")`.
+
+Diferenças em relação ao pandas: as regras de peso rodam sobre todas as
+descrições (sem o cache SQLite de `extrair_peso_com_cache`) e `processos` é
+ignorado, já que o Polars usa todos os núcleos.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+import polars as pl
+
+from validador_mapeio import (
+    COLUNAS_VALIDACAO,
+    FAIXAS_QUANTIL,
+    FATOR_MEDIANA,
+    OPCOES_CONVERSAO,
+    POSSIVEIS_EAN_DF,
+    QUANTIS_FAIXAS,
+    REGRAS_PESO,
+    _UNIDADES_MIL,
+    _aviso_falhas_conversao,
+    _PESOS_GTIN,
+    anexar_colunas_indice,
+    avisar_progresso,
+    avisos_cruzamento,
+    construir_indice_ean,
+    cruzar_por_indice_ean,
+    encontrar_coluna,
+    etapa,
+    mapear_colunas,
+    normalizar_nomes_colunas,
+    registrar_regras_peso,
+)
+
+# ----------------------------
+# Pandas -> Arrow
+# ----------------------------
+def _separar_numeros(serie):
+    """(números, textos, preenchido_nao_texto) de uma coluna com números e/ou textos."""
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.astype(float).to_numpy(), None, serie.notna().to_numpy()
+    e_texto = serie.map(type).eq(str)
+    numeros = pd.to_numeric(serie.where(~e_texto), errors="coerce").astype(float).to_numpy()
+    return numeros, serie.where(e_texto).to_numpy(dtype=object), (serie.notna() & ~e_texto).to_numpy()
+
+
+def _como_texto(serie):
+    """`str` de cada valor preenchido (ausentes continuam ausentes)."""
+    return serie[serie.notna()].astype(str).reindex(serie.index).to_numpy(dtype=object)
+
+
+def _para_polars(df, colunas, col_ean):
+    """LazyFrame só com as colunas usadas, textos e números separados como no `converter_numero`."""
+    base = {"linha": np.arange(len(df))}
+    for chave in OPCOES_CONVERSAO:
+        base[chave], base[f"{chave}_texto"], base[f"{chave}_preenchido"] = _separar_numeros(df[colunas[chave]])
+    base["descricao"] = _como_texto(df[colunas["descricao"]])
+    base["categoria"] = df[colunas["categoria"]].to_numpy()
+    if col_ean is not None:
+        # Como em `normalizar_ean`: o que não for inteiro ainda passa pelo texto só com dígitos
+        base["ean"], textos, _ = _separar_numeros(df[col_ean])
+        base["ean_texto"] = None if textos is None else _como_texto(df[col_ean])
+
+    base = pd.DataFrame({nome: valores for nome, valores in base.items() if valores is not None})
+    try:
+        return pl.from_pandas(base).lazy()
+    except (TypeError, ValueError):
+        # Subcategoria com tipos misturados (ex.: números e textos): agrupa pelos códigos do pandas
+        codigos, _ = pd.factorize(base["categoria"])
+        base["categoria"] = pd.array(np.where(codigos < 0, None, codigos), dtype="Int64")
+        return pl.from_pandas(base).lazy()
+
+
+# ----------------------------
+# Conversão numérica (mesmas regras de `converter_numero`)
+# ----------------------------
+def _expr_converter_numero(chave, nomes, ponto_milhar=False, remover_texto=True):
+    """Expressão do valor convertido da coluna `chave` (números mantidos, textos no formato BR/LatAm).
+
+    `nomes` são as colunas do LazyFrame (a parte `_texto` só existe em colunas com textos).
+    """
+    numeros = pl.col(chave)
+    if f"{chave}_texto" not in nomes:
+        return numeros
+    texto = pl.col(f"{chave}_texto").str.replace_all(r"[^\d,.-]" if remover_texto else r"\s", "")
+    tem_ponto = texto.str.contains(".", literal=True)
+    tem_virgula = texto.str.contains(",", literal=True)
+    virgula_decimal = texto.str.contains(r",[^.,]*$") & (tem_ponto | (texto.str.count_matches(",", literal=True) == 1))
+    ponto_decimal = texto.str.contains(r"\.[^.,]*$") & (
+        tem_virgula if ponto_milhar else tem_virgula | (texto.str.count_matches(".", literal=True) == 1)
+    )
+    normalizado = (
+        pl.when(virgula_decimal)
+        .then(texto.str.replace_all(".", "", literal=True).str.replace_all(",", ".", literal=True))
+        .when(ponto_decimal)
+        .then(texto.str.replace_all(",", "", literal=True))
+        .otherwise(texto.str.replace_all(r"[.,]", ""))
+    )
+    return pl.coalesce(numeros, normalizado.cast(pl.Float64, strict=False))
+
+
+def _expr_preenchido(chave, nomes):
+    preenchido = pl.col(f"{chave}_preenchido")
+    if f"{chave}_texto" in nomes:
+        preenchido = preenchido | (pl.col(f"{chave}_texto").str.strip_chars() != "").fill_null(False)
+    return preenchido
+
+
+# ----------------------------
+# Extração de peso (mesmas regras e ordem de REGRAS_PESO)
+# ----------------------------
+def _numero(expr):
+    return expr.str.replace(",", ".", literal=True).cast(pl.Float64)
+
+
+def _fator_unidade(unidade):
+    return pl.when(unidade.str.to_lowercase().is_in(_UNIDADES_MIL)).then(1000.0).otherwise(1.0)
+
+
+def _calc_multi(g):
+    # Mesma ordem das multiplicações do caminho pandas: ((último * fator) * n1) * n2 ...
+    numeros = g("bloco").str.extract_all(r"\d+[.,]?\d*").list.eval(_numero(pl.element()))
+    inicial = numeros.list.last() * _fator_unidade(g("unidade"))
+    fatores = numeros.list.head(numeros.list.len() - 1)
+    total = pl.concat_list([inicial, fatores]).list.eval(pl.element().cum_prod()).list.last()
+    return g("bloco"), total.floor()
+
+
+def _calc_3d(g):
+    valor = _numero(g("valor")) * _fator_unidade(g("unidade"))
+    return g("bloco"), (_numero(g("n1")) * _numero(g("n2")) * valor).floor()
+
+
+def _calc_2d(g):
+    valor = _numero(g("valor")) * _fator_unidade(g("unidade"))
+    return g("bloco"), (_numero(g("n1")) * valor).floor()
+
+
+def _calc_simples(g):
+    return g("bloco"), (_numero(g("valor")) * _fator_unidade(g("unidade"))).floor()
+
+
+def _calc_produto(g):
+    return g("bloco"), _numero(g("mult").fill_null("1")) * _numero(g("qtd"))
+
+
+def _calc_qtd(g):
+    return g("bloco"), _numero(g("qtd"))
+
+
+def _calc_ultimo_numero(g):
+    ultimo = _numero(g("qtd"))
+    valido = (ultimo > 0) & (ultimo <= 10000)
+    return pl.when(valido).then(ultimo.cast(pl.Int64).cast(pl.Utf8)), pl.when(valido).then(ultimo)
+
+
+# Uma entrada por regra de REGRAS_PESO (conferido nos testes)
+CALCULOS_PESO = {
+    "multi": _calc_multi,
+    "3d": _calc_3d,
+    "2d": _calc_2d,
+    "simples": _calc_simples,
+    "un": _calc_produto,
+    "c_pack": _calc_produto,
+    "c": _calc_qtd,
+    "rolos": _calc_produto,
+    "leve_pague": _calc_qtd,
+    "pack": _calc_produto,
+    "ultimo_numero": _calc_ultimo_numero,
+}
+
+
+def _padrao(regex):
+    return ("(?i)" if regex.flags & re.IGNORECASE else "") + regex.pattern
+
+
+def _exprs_regras_peso(descricao):
+    """Colunas `_bloco_<regra>`/`_gramas_<regra>` com o resultado de cada regra de REGRAS_PESO.
+
+    Ficam em colunas próprias para que cada regex rode uma única vez (e as
+    regras rodem em paralelo); `_expr_peso` escolhe a primeira que resolveu.
+    """
+    texto = descricao.str.to_uppercase().str.strip_chars()
+    exprs = []
+    for nome, regex, _ in REGRAS_PESO:
+        bloco, valor = CALCULOS_PESO[nome](texto.str.extract_groups(_padrao(regex)).struct.field)
+        exprs += [bloco.alias(f"_bloco_{nome}"), valor.cast(pl.Float64).alias(f"_gramas_{nome}")]
+    return exprs
+
+
+def _expr_peso():
+    """(QtdEmbalagem, QtdEmbalagemGramas, RegraPeso): a primeira regra que resolve a descrição."""
+    nomes = [nome for nome, _, _ in REGRAS_PESO]
+    gramas = regra = None
+    for nome in nomes:
+        resolveu = pl.col(f"_bloco_{nome}").is_not_null()
+        gramas = (pl.when(resolveu) if gramas is None else gramas.when(resolveu)).then(pl.col(f"_gramas_{nome}"))
+        regra = (pl.when(resolveu) if regra is None else regra.when(resolveu)).then(pl.lit(nome))
+    return (pl.coalesce([pl.col(f"_bloco_{nome}") for nome in nomes]),
+            gramas.otherwise(None), regra.otherwise(None))
+
+
+# ----------------------------
+# Faixas de preço por subcategoria (quantis pelo tamanho do grupo e mediana)
+# ----------------------------
+def _expr_validacoes_preco(preco, categoria):
+    n = pl.len().over(categoria)
+    quantis = {q: preco.quantile(q, interpolation="linear").over(categoria) for q in QUANTIS_FAIXAS}
+    quantil_inf = quantil_sup = None
+    for limite, inf, sup in FAIXAS_QUANTIL[:-1]:
+        quantil_inf = (pl.when(n < limite) if quantil_inf is None else quantil_inf.when(n < limite)).then(quantis[inf])
+        quantil_sup = (pl.when(n < limite) if quantil_sup is None else quantil_sup.when(n < limite)).then(quantis[sup])
+    quantil_inf = quantil_inf.otherwise(quantis[FAIXAS_QUANTIL[-1][1]])
+    quantil_sup = quantil_sup.otherwise(quantis[FAIXAS_QUANTIL[-1][2]])
+    mediana = preco.median().over(categoria)
+
+    def _marcar(inf, sup, rotulo):
+        dentro = ((inf <= preco) & (preco <= sup)).fill_null(False)
+        return pl.when(categoria.is_null()).then(None).when(dentro).then(pl.lit("OK")).otherwise(pl.lit(rotulo))
+
+    return (_marcar(quantil_inf, quantil_sup, "OUTLIER"),
+            _marcar(mediana / FATOR_MEDIANA, mediana * FATOR_MEDIANA, "OUTLIER_MEDIANA"))
+
+
+# ----------------------------
+# EAN (mesma normalização de `normalizar_ean`)
+# ----------------------------
+def _expr_verificador(digitos, inicio=0):
+    soma = sum(int(peso) * digitos[i] for i, peso in enumerate(_PESOS_GTIN) if i >= inicio)
+    return (10 - soma % 10) % 10
+
+
+def _normalizar_ean(consulta, coluna_numerica, nomes):
+    """Acrescenta `codigo_ean` (int64 normalizado, 0 se inválido), `ean_valido`,
+    `ean_digito_invalido` e `ean_dun` a partir da coluna `ean`.
+
+    Em etapas (`with_columns` sucessivos) para que o código e os dígitos sejam
+    calculados uma vez só, e não dentro de cada expressão que os usa.
+    """
+    if coluna_numerica:
+        valor = pl.col("ean")
+    else:
+        direto = pl.col("ean")
+        if "ean_texto" in nomes:
+            direto = pl.coalesce(direto, pl.col("ean_texto").str.strip_chars().cast(pl.Float64, strict=False))
+        valor = pl.when((direto >= 0) & (direto % 1 == 0)).then(direto)
+        if "ean_texto" in nomes:
+            so_digitos = pl.col("ean_texto").str.replace_all(r"\D", "")
+            so_digitos = pl.when(so_digitos.str.len_chars().is_between(1, 14)).then(so_digitos)
+            valor = pl.coalesce(valor, so_digitos.cast(pl.Float64, strict=False))
+    consulta = consulta.with_columns(valor.alias("_ean_valor"))
+    valido = ((pl.col("_ean_valor") > 0) & (pl.col("_ean_valor") < 1e14)).fill_null(False)
+    consulta = consulta.with_columns(
+        valido.alias("ean_valido"),
+        pl.when(valido).then(pl.col("_ean_valor").round(0).cast(pl.Int64)).otherwise(0).alias("_ean_codigo"),
+    )
+    codigo = pl.col("_ean_codigo")
+    consulta = consulta.with_columns([((codigo // 10 ** (13 - i)) % 10).alias(f"_ean_d{i}") for i in range(14)])
+    digitos = [pl.col(f"_ean_d{i}") for i in range(14)]
+
+    dun = pl.col("ean_valido") & (digitos[0] >= 1) & (digitos[0] <= 8)
+    # DUN-14: zera o indicador e recalcula o verificador do EAN-13
+    ean_do_dun = (codigo % 10 ** 13) // 10 * 10 + _expr_verificador(digitos, inicio=1)
+    return consulta.with_columns(
+        pl.when(dun).then(ean_do_dun).otherwise(codigo).alias("codigo_ean"),
+        (pl.col("ean_valido") & (_expr_verificador(digitos) != digitos[13])).alias("ean_digito_invalido"),
+        dun.alias("ean_dun"),
+    )
+
+
+# ----------------------------
+# Pipeline completo
+# ----------------------------
+def processar_dataframe_polars(df, df_aux=None, indice_ean=None, diagnostico=None, progresso=None):
+    """Mesmo contrato de `processar_dataframe`, executado pelo Polars.
+
+    Retorna (df_final, colunas, avisos). Levanta ColunasFaltandoError.
+    """
+    avisos = []
+    # Cópia rasa: os nomes normalizados não vazam para o DataFrame de entrada
+    df = normalizar_nomes_colunas(df.copy(deep=False))
+    colunas = mapear_colunas(df)
+    cruzar = indice_ean is not None or df_aux is not None
+    if indice_ean is None and df_aux is not None:
+        indice_ean = construir_indice_ean(df_aux)
+    col_ean = encontrar_coluna(df.columns, POSSIVEIS_EAN_DF)
+    juntar_ean = cruzar and col_ean is not None and indice_ean is not None and bool(indice_ean["colunas"])
+
+    avisar_progresso(progresso, "conversao_polars", 0, len(df))
+    with etapa(diagnostico, "conversao_polars", linhas=len(df)):
+        base = _para_polars(df, colunas, col_ean if juntar_ean else None)
+    nomes = set(base.collect_schema().names())
+
+    convertidas = base.with_columns(
+        [_expr_converter_numero(chave, nomes, **opcoes).alias(chave) for chave, opcoes in OPCOES_CONVERSAO.items()]
+    )
+    falhas = convertidas.select([
+        (_expr_preenchido(chave, nomes) & pl.col(chave).is_null()).sum().alias(colunas[chave])
+        for chave in OPCOES_CONVERSAO
+    ])
+
+    qtd, gramas, regra = _expr_peso()
+    validacao_preco, validacao_mediana = _expr_validacoes_preco(pl.col("preco"), pl.col("categoria"))
+    consulta = (
+        convertidas
+        .filter(pl.col("vendas") > 0)
+        .with_columns(_exprs_regras_peso(pl.col("descricao")))
+        .with_columns(
+            qtd.alias("QtdEmbalagem"),
+            gramas.alias("QtdEmbalagemGramas"),
+            regra.alias("RegraPeso"),
+            validacao_preco.alias("ValidacionPrecio"),
+            validacao_mediana.alias("ValidacionPrecioMediana"),
+        )
+        .with_columns(
+            pl.when(((pl.col("QtdEmbalagemGramas") - pl.col("contenido")).abs() < 1).fill_null(False))
+            .then(pl.lit("OK")).otherwise(pl.lit("PROBLEMA")).alias("ValidacaoContenido")
+        )
+        .with_columns(
+            pl.when(pl.any_horizontal([(pl.col(c) != "OK").fill_null(True) for c in COLUNAS_VALIDACAO]))
+            .then(pl.lit("RISCO")).otherwise(pl.lit("OK")).alias("StatusGeral")
+        )
+    )
+    if juntar_ean:
+        indice = pl.LazyFrame({
+            "codigo_ean": indice_ean["indice"].index.to_numpy(),
+            "posicao_indice": np.arange(len(indice_ean["indice"])),
+        })
+        consulta = (
+            _normalizar_ean(consulta, pd.api.types.is_numeric_dtype(df[col_ean]), nomes)
+            .join(indice, on="codigo_ean", how="left", maintain_order="left")
+        )
+
+    consulta = consulta.select(pl.exclude("^_.*$"))  # colunas auxiliares das regras de peso e do EAN
+
+    avisar_progresso(progresso, "consulta_polars", 0)
+    with etapa(diagnostico, "consulta_polars", linhas=len(df)):
+        resultado, falhas = pl.collect_all([consulta, falhas])
+    avisar_progresso(progresso, "consulta_polars", len(resultado), len(resultado))
+    _aviso_falhas_conversao(falhas.row(0, named=True), avisos)
+
+    with etapa(diagnostico, "montagem_polars", linhas=len(resultado)):
+        df_final = df.iloc[resultado["linha"].to_numpy()].copy()
+        for chave in OPCOES_CONVERSAO:
+            df_final[colunas[chave]] = resultado[chave].to_numpy()
+        df_final["QtdEmbalagem"] = resultado["QtdEmbalagem"].to_numpy()
+        df_final["QtdEmbalagemGramas"] = resultado["QtdEmbalagemGramas"].to_numpy()
+        for coluna in ["ValidacaoContenido", "ValidacionPrecio", "ValidacionPrecioMediana", "StatusGeral"]:
+            valores = pd.Series(resultado[coluna].to_numpy(), index=df_final.index, dtype=object)
+            df_final[coluna] = valores.where(valores.notna(), np.nan)
+        if diagnostico is not None:
+            registrar_regras_peso(diagnostico, resultado["RegraPeso"].to_pandas())
+
+        if juntar_ean:
+            posicoes = resultado["posicao_indice"].fill_null(-1).to_numpy()
+            df_final = anexar_colunas_indice(df_final, indice_ean, posicoes)
+            avisos.extend(avisos_cruzamento({
+                "coluna_ean": col_ean,
+                "encontrados": int((posicoes >= 0).sum()),
+                "total": len(resultado),
+                "validos": int(resultado["ean_valido"].sum()),
+                "vazios_ou_invalidos": int((~resultado["ean_valido"]).sum()),
+                "digito_invalido": int(resultado["ean_digito_invalido"].sum()),
+                "dun_convertidos": int(resultado["ean_dun"].sum()),
+            }, indice_ean))
+        elif cruzar:
+            # Sem coluna de EAN ou sem colunas de interesse: mesmos avisos do caminho pandas
+            df_final, avisos_ean = cruzar_por_indice_ean(df_final, indice_ean)
+            avisos.extend(avisos_ean)
+    return df_final, colunas, avisos
@@ -0,0 +1,327 @@
+"""Validação em lote, sem interface, de vários arquivos de categoria.
+
+Exemplos:
+    python validar_lote.py extracoes/ --base-aux validadora.xlsx --saida resultados/
+    python validar_lote.py "extracoes/*.csv" outra_pasta/ --processos 8
+
+Para cada entrada gera `<nome>_analise_risco.xlsx` (mesmo Excel do app; ou
+`.zip` com `--formato csv|parquet`) e, ao final, `resumo_lote.csv` com uma
+linha por arquivo. Com `--log-json`, registra tempo e memória de cada etapa e
+os acertos de cada regra de extração de peso, uma linha JSON por evento. Com
+`--incremental`, um arquivo já processado antes (mesmo caminho) só tem as
+linhas alteradas revalidadas, e `<nome>_mudancas.csv` lista as linhas cujo
+status mudou. Com `--streaming`, CSVs são validados em dois passos, bloco a
+bloco, sem carregar o arquivo inteiro (faixas de preço estimadas; ver
+`validar_csv_em_blocos`). Com `--backend polars`, o processamento completo de
+cada arquivo roda no Polars (ver `validador_polars`). Com `--baixa-memoria`, só
+as colunas usadas são lidas, o resultado é guardado em tipos compactos e o pico
+de memória de cada arquivo vai para a coluna `pico_memoria_mb` do resumo. Com
+`--faixas-referencia`, os preços são validados contra o índice de referência
+salvo (ver "Índice de referência de faixas de preço" em `validador_mapeio`); com
+`--acumular-referencia`, os preços de cada arquivo processado sem erro são
+acrescentados ao índice (que é criado se não existir), por exemplo para montá-lo
+a partir dos arquivos históricos:
+
+    python validar_lote.py historico/ --acumular-referencia faixas.pkl
+    python validar_lote.py novos/ --faixas-referencia faixas.pkl
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+
+import pandas as pd
+
+from validador_mapeio import (
+    BACKENDS,
+    FORMATOS_DETALHES,
+    POLARS_DISPONIVEL,
+    acrescentar_ao_indice_faixas,
+    calcular_metricas_resumo,
+    carregar_indice_faixas,
+    carregar_resultado_anterior,
+    configurar_log_json,
+    etapa,
+    exportar_resultado,
+    medir_pico_memoria,
+    ler_arquivo_principal,
+    carregar_indice_ean,
+    novo_diagnostico,
+    novo_indice_faixas,
+    processar_dataframe,
+    revalidar_incremental,
+    salvar_indice_faixas,
+    salvar_resultado_anterior,
+    sketch_referencia,
+    validar_csv_em_blocos,
+)
+
+EXTENSOES = (".xlsx", ".csv")
+SUFIXO_SAIDA = "_analise_risco.xlsx"
+SUFIXO_MUDANCAS = "_mudancas.csv"
+NOME_RESUMO = "resumo_lote.csv"
+
+# Índice EAN da base auxiliar e índice de referência de faixas de preço, montados
+# uma vez e enviados a cada processo (ver _inicializar_worker)
+_indice_ean = None
+_faixas_referencia = None
+
+
+def _e_saida_do_lote(caminho):
+    """Arquivos que o próprio lote grava (a pasta de saída pode ser a de entrada)."""
+    nome = os.path.basename(caminho).lower()
+    return (nome == NOME_RESUMO or nome.endswith(SUFIXO_MUDANCAS)
+            or nome.rsplit(".", 1)[0].endswith(SUFIXO_SAIDA.rsplit(".", 1)[0]))
+
+
+def listar_entradas(entradas):
+    """Expande pastas e globs em uma lista ordenada de arquivos xlsx/csv.
+
+    Ignora os arquivos gerados pelo lote (Excel/zip de saída, `resumo_lote.csv`,
+    `<nome>_mudancas.csv`) e os temporários do Excel (`~$...`).
+    """
+    arquivos = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            candidatos = [os.path.join(entrada, nome) for nome in os.listdir(entrada)]
+        else:
+            candidatos = glob.glob(entrada) or [entrada]
+        arquivos.extend(
+            c for c in candidatos
+            if os.path.isfile(c) and c.lower().endswith(EXTENSOES)
+            and not _e_saida_do_lote(c) and not os.path.basename(c).startswith("~$")
+        )
+    return sorted(set(arquivos))
+
+
+def _inicializar_worker(indice_ean, log_json=None, faixas_referencia=None):
+    global _indice_ean, _faixas_referencia
+    _indice_ean = indice_ean
+    _faixas_referencia = faixas_referencia
+    if log_json:
+        configurar_log_json(None if log_json == "-" else log_json)
+
+
+def processar_arquivo(caminho, pasta_saida, somente_necessarias=False, tamanho_bloco=None, formato="xlsx",
+                      com_diagnostico=False, incremental=False, processos_por_arquivo=1, streaming=False,
+                      backend="pandas", baixa_memoria=False, acumular_referencia=False):
+    """Processa um arquivo e grava o Excel; retorna uma linha do resumo do lote.
+
+    Com `com_diagnostico`, a linha ganha uma coluna `seg_<etapa>` por etapa. Com
+    `incremental`, reaproveita o último processamento do mesmo caminho e grava
+    `<nome>_mudancas.csv` com as linhas cujo status mudou. Com `streaming`, CSVs
+    passam por `validar_csv_em_blocos` (sempre zip com detalhes em CSV). `backend`
+    e `baixa_memoria` valem para o processamento completo (ver
+    `processar_dataframe`); com `baixa_memoria`, só as colunas usadas são lidas e
+    a linha ganha `pico_memoria_mb` (leitura, validação e exportação). Com
+    `acumular_referencia`, a linha leva em `_referencia` o (assinatura, sketch)
+    dos preços do resultado, para o processo principal somar ao índice de
+    referência (não vai para o resumo).
+    """
+    inicio = time.time()
+    nome_base = os.path.basename(caminho).rsplit(".", 1)[0]
+    linha = {"arquivo": caminho, "status": "OK", "erro": "", "saida": ""}
+    diagnostico = novo_diagnostico(arquivo=caminho) if com_diagnostico else None
+    somente_necessarias = somente_necessarias or baixa_memoria
+    with medir_pico_memoria(diagnostico) if baixa_memoria else nullcontext({}) as memoria:
+        _processar(linha, caminho, nome_base, pasta_saida, diagnostico, somente_necessarias, tamanho_bloco,
+                   formato, incremental, processos_por_arquivo, streaming, backend, baixa_memoria,
+                   acumular_referencia)
+    if baixa_memoria:
+        linha["pico_memoria_mb"] = memoria["pico_memoria_mb"]
+    return _finalizar_linha(linha, diagnostico, inicio)
+
+
+def _processar(linha, caminho, nome_base, pasta_saida, diagnostico, somente_necessarias, tamanho_bloco, formato,
+               incremental, processos_por_arquivo, streaming, backend, baixa_memoria, acumular_referencia):
+    """Corpo de `processar_arquivo`: preenche `linha` (ou marca o erro)."""
+    try:
+        if streaming and caminho.lower().endswith(".csv"):
+            saida = os.path.join(pasta_saida, nome_base + SUFIXO_SAIDA.replace(".xlsx", ".zip"))
+            metricas, _, avisos = validar_csv_em_blocos(
+                caminho, saida, indice_ean=_indice_ean, somente_necessarias=somente_necessarias,
+                diagnostico=diagnostico, **({"tamanho_bloco": tamanho_bloco} if tamanho_bloco else {})
+            )
+            _preencher_linha(linha, saida, metricas["total_itens"], metricas["risco"], metricas, avisos)
+            return
+
+        with etapa(diagnostico, "leitura"):
+            df = ler_arquivo_principal(caminho, somente_necessarias=somente_necessarias,
+                                       tamanho_bloco=tamanho_bloco)
+        anterior = carregar_resultado_anterior(os.path.abspath(caminho)) if incremental else None
+        if anterior is not None:
+            df_final, colunas, avisos, mudancas = revalidar_incremental(
+                df, *anterior, indice_ean=_indice_ean, diagnostico=diagnostico
+            )
+            saida_mudancas = os.path.join(pasta_saida, nome_base + SUFIXO_MUDANCAS)
+            mudancas.to_csv(saida_mudancas, index=False, sep=";", decimal=",", encoding="utf-8-sig")
+            linha["linhas_com_mudanca"] = len(mudancas)
+        else:
+            df_final, colunas, avisos = processar_dataframe(df, indice_ean=_indice_ean, diagnostico=diagnostico,
+                                                            processos=processos_por_arquivo, backend=backend,
+                                                            baixa_memoria=baixa_memoria,
+                                                            faixas_referencia=_faixas_referencia)
+        if incremental:
+            salvar_resultado_anterior(os.path.abspath(caminho), df_final, colunas)
+
+        sufixo = SUFIXO_SAIDA if formato == "xlsx" else SUFIXO_SAIDA.replace(".xlsx", ".zip")
+        saida = os.path.join(pasta_saida, nome_base + sufixo)
+        with etapa(diagnostico, f"exportacao_{formato}"), open(saida, "wb") as f:
+            exportar_resultado(df_final, colunas["vendas"], formato, destino=f)
+
+        if acumular_referencia:
+            linha["_referencia"] = sketch_referencia(df_final, colunas["preco"], colunas["categoria"])
+        metricas = calcular_metricas_resumo(df_final, colunas["vendas"])
+        _preencher_linha(linha, saida, len(df_final), int((df_final["StatusGeral"] == "RISCO").sum()),
+                         metricas, avisos)
+    except Exception as e:
+        linha.update({"status": "ERRO", "erro": f"{type(e).__name__}: {e}"})
+
+
+def _preencher_linha(linha, saida, linhas, risco, metricas, avisos):
+    linha.update({
+        "saida": saida,
+        "linhas": linhas,
+        "risco": risco,
+        "problemas_contenido": metricas["problemas_contenido"],
+        "outliers_quartil": metricas["outliers_quartil"],
+        "outliers_mediana": metricas["outliers_mediana"],
+        "itens_com_problema": metricas["problemas_total"],
+        "perc_volume_com_problema": round(metricas["volume_problemas_perc"], 2),
+        "avisos": " | ".join(mensagem for _, mensagem in avisos),
+    })
+
+
+def _finalizar_linha(linha, diagnostico, inicio):
+    if diagnostico is not None:
+        for registro in diagnostico["etapas"]:
+            linha[f"seg_{registro['etapa']}"] = registro["segundos"]
+    linha["segundos"] = round(time.time() - inicio, 2)
+    return linha
+
+
+def _acumular_referencia(caminho, resumo):
+    """Soma ao índice em `caminho` os sketches levados pelas linhas do resumo (na ordem dos arquivos)."""
+    indice = carregar_indice_faixas(caminho) or novo_indice_faixas()
+    acrescentados = repetidos = 0
+    for linha in sorted(resumo, key=lambda item: item["arquivo"]):
+        referencia = linha.pop("_referencia", None)
+        if referencia is None:
+            continue
+        if acrescentar_ao_indice_faixas(indice, *referencia, origem=os.path.basename(linha["arquivo"])):
+            acrescentados += 1
+        else:
+            repetidos += 1
+    salvar_indice_faixas(indice, caminho)
+    print(f"Índice de referência: {acrescentados} arquivos acrescentados, {repetidos} já presentes; "
+          f"{len(indice['faixas'])} subcategorias. Salvo em {caminho}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Valida vários arquivos de categoria em paralelo.")
+    parser.add_argument("entradas", nargs="+", help="pastas, arquivos ou globs com xlsx/csv")
+    parser.add_argument("--base-aux", help="base validadora para cruzar por EAN")
+    parser.add_argument("--saida", default=".", help="pasta de saída (padrão: pasta atual)")
+    parser.add_argument("--processos", type=int, default=os.cpu_count(),
+                        help="quantidade de processos (padrão: número de núcleos)")
+    parser.add_argument("--processos-por-arquivo", type=int, default=1, metavar="N",
+                        help="divide cada arquivo grande por subcategoria entre N processos "
+                             "(use com --processos 1 para poucos arquivos muito grandes)")
+    parser.add_argument("--somente-colunas-necessarias", action="store_true",
+                        help="lê só as colunas usadas na validação e no cruzamento por EAN")
+    parser.add_argument("--bloco-csv", type=int, metavar="LINHAS",
+                        help="lê CSVs em blocos de LINHAS linhas (arquivos muito grandes)")
+    parser.add_argument("--formato", choices=FORMATOS_DETALHES, default="xlsx",
+                        help="xlsx completo, ou zip com Resumo .xlsx + detalhes em csv/parquet")
+    parser.add_argument("--incremental", action="store_true",
+                        help="revalida só o que mudou desde o último processamento de cada arquivo "
+                             "e grava <nome>_mudancas.csv")
+    parser.add_argument("--streaming", action="store_true",
+                        help="valida CSVs em dois passos, bloco a bloco (blocos de --bloco-csv linhas), "
+                             "sem carregar o arquivo inteiro; gera sempre o zip com detalhes em CSV")
+    parser.add_argument("--backend", choices=BACKENDS, default="pandas",
+                        help="motor da validação completa (polars requer os pacotes polars e pyarrow)")
+    parser.add_argument("--baixa-memoria", action="store_true",
+                        help="lê só as colunas usadas, guarda o resultado em tipos compactos e informa "
+                             "o pico de memória de cada arquivo")
+    parser.add_argument("--faixas-referencia", metavar="ARQUIVO",
+                        help="valida os preços contra o índice de referência de faixas salvo em ARQUIVO")
+    parser.add_argument("--acumular-referencia", metavar="ARQUIVO",
+                        help="acrescenta os preços de cada arquivo processado sem erro ao índice de referência "
+                             "em ARQUIVO (criado se não existir; a validação deste lote usa o índice do início)")
+    parser.add_argument("--log-json", metavar="ARQUIVO",
+                        help="registra tempo/memória por etapa e acertos das regras de peso, "
+                             "em JSON por linha ('-' para stderr)")
+    args = parser.parse_args(argv)
+    if args.streaming and args.incremental:
+        parser.error("--streaming não pode ser combinado com --incremental")
+    if args.baixa_memoria and args.incremental:
+        parser.error("--baixa-memoria não pode ser combinado com --incremental")
+    if args.backend == "polars" and not POLARS_DISPONIVEL:
+        parser.error("--backend polars requer os pacotes polars e pyarrow")
+    if (args.faixas_referencia or args.acumular_referencia) and args.streaming:
+        parser.error("--faixas-referencia/--acumular-referencia não podem ser combinados com --streaming")
+    if args.faixas_referencia and args.incremental:
+        parser.error("--faixas-referencia não pode ser combinado com --incremental")
+    faixas_referencia = None
+    if args.faixas_referencia:
+        faixas_referencia = carregar_indice_faixas(args.faixas_referencia)
+        if faixas_referencia is None:
+            parser.error(f"índice de referência inválido ou inexistente: {args.faixas_referencia}")
+
+    arquivos = listar_entradas(args.entradas)
+    if not arquivos:
+        print("Nenhum arquivo .xlsx/.csv encontrado.", file=sys.stderr)
+        return 1
+    os.makedirs(args.saida, exist_ok=True)
+
+    if args.log_json:
+        configurar_log_json(None if args.log_json == "-" else args.log_json)
+
+    indice_ean = None
+    if args.base_aux:
+        indice_ean, avisos_aux = carregar_indice_ean(args.base_aux)
+        for _, mensagem in avisos_aux:
+            print(mensagem)
+
+    inicio = time.time()
+    resumo = []
+    with ProcessPoolExecutor(max_workers=args.processos, initializer=_inicializar_worker,
+                             initargs=(indice_ean, args.log_json, faixas_referencia)) as executor:
+        futuros = [
+            executor.submit(processar_arquivo, caminho, args.saida,
+                            args.somente_colunas_necessarias, args.bloco_csv, args.formato,
+                            bool(args.log_json), args.incremental, args.processos_por_arquivo,
+                            args.streaming, args.backend, args.baixa_memoria, bool(args.acumular_referencia))
+            for caminho in arquivos
+        ]
+        for i, futuro in enumerate(as_completed(futuros), 1):
+            linha = futuro.result()
+            resumo.append(linha)
+            detalhe = linha["erro"] if linha["status"] == "ERRO" else f"{linha['linhas']} linhas, {linha['risco']} em risco"
+            if linha["status"] != "ERRO" and "pico_memoria_mb" in linha:
+                detalhe += f", pico de memória {linha['pico_memoria_mb']} MB"
+            print(f"[{i}/{len(arquivos)}] {linha['status']} {linha['arquivo']} ({linha['segundos']}s) - {detalhe}")
+
+    if args.acumular_referencia:
+        _acumular_referencia(args.acumular_referencia, resumo)
+
+    df_resumo = pd.DataFrame(resumo).sort_values("arquivo")
+    colunas_contagem = ["linhas", "risco", "problemas_contenido", "outliers_quartil", "outliers_mediana",
+                        "itens_com_problema", "linhas_com_mudanca"]
+    for coluna in colunas_contagem:
+        if coluna in df_resumo.columns:
+            df_resumo[coluna] = df_resumo[coluna].astype("Int64")
+    caminho_resumo = os.path.join(args.saida, NOME_RESUMO)
+    df_resumo.to_csv(caminho_resumo, index=False, sep=";", encoding="utf-8-sig")
+
+    erros = int((df_resumo["status"] == "ERRO").sum())
+    print(f"{len(arquivos)} arquivos em {time.time() - inicio:.1f}s, {erros} com erro. Resumo: {caminho_resumo}")
+    return 1 if erros else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())